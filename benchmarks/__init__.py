@@ -0,0 +1 @@
+"""Offline benchmarks for the Citi Bike data pipeline."""
@@ -0,0 +1,96 @@
+############################# FEATURE DERIVATION BENCHMARK ##############################
+#########################################################################################
+"""Rows per second of the "Data Wragling" derivations, notebook code vs citibike.transform.
+
+Run from the project folder on a year-sized synthetic dataset::
+
+    python -m benchmarks.bench_transform --rows 30000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import YEAR_SIZED_ROWS, synthetic_trips
+from citibike.transform import daily_counts, member_labels, rideable_labels, season_of
+
+
+############################## NOTEBOOK CODE ############################################
+
+def notebook_season(df):
+    month = df['date'].dt.month
+    return month.apply(lambda x: 'Winter' if x in [12, 1, 2]
+                                 else 'Spring' if x in [3, 4, 5]
+                                 else 'Summer' if x in [6, 7, 8]
+                                 else 'Fall')
+
+
+def notebook_member(df):
+    return df['member_casual'].str.title()
+
+
+def notebook_rideable(df):
+    return df['rideable_type'].replace({'electric_bike': 'Electric Bike', 'classic_bike': 'Classic Bike'})
+
+
+def notebook_daily(df):
+    df = df[['date']].assign(value = 1)
+    df_group = df.groupby('date', as_index = False).agg({'value': 'sum'})
+    df_group.rename(columns = {'value': 'bike_rides_daily'}, inplace = True)
+    df = df.merge(df_group, on = 'date', how = 'outer', indicator = True)
+    return df['bike_rides_daily']
+
+
+############################## BENCHMARK ################################################
+
+STEPS = [
+    ('season', notebook_season, lambda df: season_of(df['date'])),
+    ('member_casual', notebook_member, lambda df: member_labels(df['member_casual'])),
+    ('rideable_type', notebook_rideable, lambda df: rideable_labels(df['rideable_type'])),
+    ('bike_rides_daily', notebook_daily, lambda df: daily_counts(df['date'])),
+]
+
+
+def _timed(function, df):
+    start = time.perf_counter()
+    result = function(df)
+    return result, time.perf_counter() - start
+
+
+def run(rows, steps=STEPS):
+    """Time every step both ways; returns one result row per step."""
+    df = synthetic_trips(rows, columns = ['rideable_type', 'member_casual'])
+    ## The notebook relabels plain strings; replace() on categoricals is deprecated in newer pandas
+    notebook_df = df.astype({'rideable_type': object, 'member_casual': object})
+    results = []
+    for name, before, after in steps:
+        expected, before_seconds = _timed(before, notebook_df)
+        actual, after_seconds = _timed(after, df)
+        ## The notebook merge reorders rows by date, so compare value counts
+        same = (expected.astype(object).value_counts().sort_index()
+                .equals(actual.astype(object).value_counts().sort_index()))
+        results.append({'step': name,
+                        'before_rows_per_s': rows / before_seconds,
+                        'after_rows_per_s': rows / after_seconds,
+                        'speedup': before_seconds / after_seconds,
+                        'same_result': same})
+    return pd.DataFrame(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the Data Wragling feature derivations.')
+    parser.add_argument('--rows', type = int, default = YEAR_SIZED_ROWS, help = 'number of synthetic trips')
+    args = parser.parse_args(argv)
+
+    results = run(args.rows)
+    with pd.option_context('display.float_format', '{:,.1f}'.format, 'display.width', 120):
+        print('%s synthetic trips' % format(args.rows, ','))
+        print(results.to_string(index = False))
+    if not np.all(results['same_result']):
+        raise SystemExit('vectorized results differ from the notebook code')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+############################# DASHBOARD LOAD TEST #######################################
+#########################################################################################
+"""Rerun latency, throughput and memory of the dashboard under concurrent sessions.
+
+Every session is a ``streamlit.testing.v1.AppTest`` of ``Citibike_Dashboard.py``
+run in a process of its own. ``AppTest`` keeps Streamlit's runtime and config
+in globals, so sessions sharing a process would race on them, and their
+timings would include each other's GIL contention. Nothing goes over the
+network. Each session also has its own Streamlit caches and its own copy of
+the prepared data, so the numbers are per-session costs, not those of one
+shared server. Each session follows one of the scripted patterns in
+``PATTERNS``, chosen round-robin:
+
+- ``browse``: switch through every page of the sidebar in turn
+- ``stations``: stay on "Most Popular Stations", changing the season
+  multiselect and toggling between start and end stations
+- ``map``: keep reopening the trip map, alternating with the intro page
+
+Each concurrency level runs its sessions for ``--actions`` interactions each,
+after a warm-up run that fills the caches. The sessions start together once
+all of them are warm. Every interaction is one rerun. Each level reports:
+
+- p50/p95/p99 latency and reruns per second
+- RSS per session process and summed over them, sampled while it runs
+- the dashboard's own span timings from ``citibike.instrumentation``
+
+Results go to JSON with the git commit and library versions, like
+``benchmarks.run``::
+
+    python -m benchmarks.load_test --sessions 1 2 4 8 16 --actions 20
+
+Needs Streamlit 1.28 or later for ``AppTest``.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.run import RESULTS_DIR, environment
+from citibike.instrumentation import Metrics, current_rss, metrics
+from citibike.paths import PROJECT_DIR
+from dashboard import PAGES
+
+APP = os.path.join(PROJECT_DIR, 'Citibike_Dashboard.py')
+PATTERNS = ['browse', 'stations', 'map']
+## Seconds between RSS samples while a level runs
+RSS_INTERVAL = 0.05
+## Seconds allowed for a session process to start and warm up, on top of ``--timeout``
+STARTUP_TIMEOUT = 120
+
+
+def _app_test():
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        import streamlit
+        raise SystemExit('the load test needs streamlit.testing (Streamlit 1.28 or later), found Streamlit %s'
+                         % streamlit.__version__)
+    return AppTest
+
+
+############################## SCRIPTED SESSIONS ########################################
+
+def _select_page(at, page):
+    return at.sidebar.selectbox[0].select(page)
+
+
+def _browse(at):
+    """Every page of the sidebar, in order, forever."""
+    for page in itertools.cycle(PAGES):
+        yield page, lambda page = page: _select_page(at, page)
+
+
+def _stations(at):
+    """Season multiselect changes and start/end toggles on the stations page."""
+    page = 'Most Popular Stations'
+    yield page, lambda: _select_page(at, page)
+    seasons = list(at.sidebar.multiselect[0].options)
+    for size in itertools.cycle(range(len(seasons), 0, -1)):
+        yield page, lambda size = size: at.sidebar.multiselect[0].set_value(seasons[:size])
+        yield page, lambda: at.button[0].click()
+
+
+def _map(at):
+    """The trip map, reopened from the intro page."""
+    for page in itertools.cycle(['Map of Aggregated Bike Trips', 'Intro Page']):
+        yield page, lambda page = page: _select_page(at, page)
+
+
+SCRIPTS = {'browse': _browse, 'stations': _stations, 'map': _map}
+
+
+class Session:
+    """One simulated user: a warmed-up ``AppTest`` replaying one pattern ``actions`` times."""
+
+    def __init__(self, pattern, actions, timeout):
+        self.pattern = pattern
+        self.actions = actions
+        self.at = _app_test().from_file(APP, default_timeout = timeout)
+        self.reruns = []
+        self.errors = []
+
+    def warm_up(self):
+        self.at.run()
+        self._check('Intro Page')
+
+    def replay(self):
+        script = SCRIPTS[self.pattern](self.at)
+        for _ in range(self.actions):
+            try:
+                page, interact = next(script)
+                start = time.perf_counter()
+                interact().run()
+                self.reruns.append({'pattern': self.pattern, 'page': page,
+                                    'ms': (time.perf_counter() - start) * 1000})
+                self._check(page)
+            except Exception as error:
+                ## A widget the script expects is missing: record it and stop this session
+                self.errors.append('%s: %s' % (type(error).__name__, error))
+                break
+
+    def _check(self, page):
+        for exception in self.at.exception:
+            self.errors.append('%s: %s' % (page, exception.message))
+
+
+def _sample_rss(samples, stop):
+    while not stop.wait(RSS_INTERVAL):
+        samples.append(current_rss())
+
+
+def _run_session(pattern, actions, timeout, barrier, results):
+    """Body of one session process: warm up, wait for the others, replay, report."""
+    session = Session(pattern, actions, timeout)
+    try:
+        session.warm_up()
+    except Exception as error:
+        session.errors.append('warm-up: %s: %s' % (type(error).__name__, error))
+    metrics.clear()
+
+    samples, stop = [current_rss()], threading.Event()
+    sampler = threading.Thread(target = _sample_rss, args = (samples, stop), daemon = True)
+    sampler.start()
+    try:
+        barrier.wait()
+        session.replay()
+    except threading.BrokenBarrierError:
+        session.errors.append('the level was aborted before this session started')
+    stop.set()
+    sampler.join()
+    samples.append(current_rss())
+    results.put({'reruns': session.reruns, 'errors': session.errors, 'timings': metrics.timings,
+                 'rss_start': samples[0], 'rss_peak': max(samples), 'rss_end': samples[-1]})
+
+
+############################## LEVELS ###################################################
+
+def run_level(sessions, actions, timeout=60):
+    """Run ``sessions`` concurrent session processes of ``actions`` reruns each; returns the level's summary."""
+    ## Spawned, not forked: every session starts from a fresh interpreter and Streamlit runtime
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(sessions + 1)
+    results = context.Queue()
+    processes = [context.Process(target = _run_session, name = 'session-%d' % i, daemon = True,
+                                 args = (PATTERNS[i % len(PATTERNS)], actions, timeout, barrier, results))
+                 for i in range(sessions)]
+    for process in processes:
+        process.start()
+    try:
+        barrier.wait(STARTUP_TIMEOUT + timeout)
+        start = time.perf_counter()
+        outcomes = [results.get(timeout = timeout * actions + STARTUP_TIMEOUT) for _ in processes]
+        wall = time.perf_counter() - start
+    except (threading.BrokenBarrierError, queue.Empty):
+        raise SystemExit('a session of the %d-session level did not start or finish in time' % sessions)
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+    level_metrics = Metrics()
+    for outcome in outcomes:
+        level_metrics.merge(outcome['timings'])
+    reruns = pd.DataFrame([rerun for outcome in outcomes for rerun in outcome['reruns']],
+                          columns = ['pattern', 'page', 'ms'])
+    ms = reruns['ms'].to_numpy()
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (np.nan, np.nan, np.nan)
+    return {'sessions': sessions,
+            'reruns': len(ms),
+            'wall_s': round(wall, 3),
+            'reruns_per_s': round(len(ms) / wall, 2) if wall else None,
+            'p50_ms': round(p50, 1), 'p95_ms': round(p95, 1), 'p99_ms': round(p99, 1),
+            'max_ms': round(ms.max(), 1) if len(ms) else None,
+            ## Per session process, then summed over all of them
+            'rss_session_peak_mb': round(max(outcome['rss_peak'] for outcome in outcomes) / 2**20, 1),
+            'rss_start_mb': round(sum(outcome['rss_start'] for outcome in outcomes) / 2**20, 1),
+            'rss_peak_mb': round(sum(outcome['rss_peak'] for outcome in outcomes) / 2**20, 1),
+            'rss_end_mb': round(sum(outcome['rss_end'] for outcome in outcomes) / 2**20, 1),
+            'pages': reruns.groupby('page')['ms'].describe(percentiles = [0.5, 0.95])
+                           .round(1).reset_index().to_dict('records'),
+            'spans': level_metrics.snapshot()['spans'],
+            'errors': sorted({error for outcome in outcomes for error in outcome['errors']})}
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Load test the dashboard with concurrent scripted sessions.')
+    parser.add_argument('--sessions', type = int, nargs = '+', default = [1, 2, 4, 8],
+                        help = 'concurrency levels to run, in order')
+    parser.add_argument('--actions', type = int, default = 20, help = 'reruns per session and level')
+    parser.add_argument('--timeout', type = float, default = 60, help = 'seconds allowed for one rerun')
+    parser.add_argument('--out', default = None,
+                        help = 'JSON file to write (default: benchmarks/results/load-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    ## Fail here rather than in every session process
+    _app_test()
+    ## The pages read the prepared data relative to the project folder; session processes inherit it
+    os.chdir(PROJECT_DIR)
+    results = dict(environment(), parameters = {'actions': args.actions, 'patterns': PATTERNS})
+    results['levels'] = []
+    for sessions in args.sessions:
+        print('Running %d concurrent sessions' % sessions)
+        results['levels'].append(run_level(sessions, args.actions, args.timeout))
+
+    out = args.out or os.path.join(RESULTS_DIR, 'load-%s.json' % (results['commit'] or 'results')[:10])
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok = True)
+    with open(out, 'w', encoding = 'utf-8') as f:
+        json.dump(results, f, indent = 1, default = str)
+
+    columns = ['sessions', 'reruns', 'reruns_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms',
+               'rss_session_peak_mb', 'rss_peak_mb', 'rss_end_mb']
+    with pd.option_context('display.float_format', '{:,.1f}'.format, 'display.width', 120):
+        print(pd.DataFrame(results['levels'])[columns].to_string(index = False))
+    for level in results['levels']:
+        for error in level['errors']:
+            print('%d sessions: %s' % (level['sessions'], error))
+    print('Wrote %s' % out)
+
+
+if __name__ == '__main__':
+    main()
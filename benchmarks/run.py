@@ -0,0 +1,332 @@
+############################# PIPELINE BENCHMARK SUITE ##################################
+#########################################################################################
+"""Throughput and peak memory of every stage of the data pipeline, as JSON.
+
+Synthetic monthly trip files in the raw Citi Bike schema (see
+``benchmarks.synthetic``) and a matching daily weather file are written once
+per scale into ``--workdir`` and reused by later runs. Every stage then runs
+in a fresh child process, so its peak RSS is its own:
+
+- ``ingest``: the monthly CSVs streamed into the trip store (``citibike.ingest``)
+- ``transforms``: the "Data Wragling" derivations (``citibike.transform``)
+- ``aggregations``: the "2.6. Data Wrangling 2" outputs rebuilt from the stored
+  partials, plus the dashboard's station roll-ups from the trip cube
+- ``od``: route counts between stations (``citibike.od_matrix``)
+- ``imbalance``: departures and arrivals per station and day (``citibike.imbalance``)
+- ``query``: the notebooks' top-20 stations and daily rides as fused queries
+  over the trip store (``citibike.query``)
+- ``dashboard``: the prepared data every dashboard page loads, cold and from
+  the Arrow cache
+
+Everything runs offline. Results are written with the git commit, library
+versions and parameters, and ``--compare`` prints the change against an
+earlier result file::
+
+    python -m benchmarks.run --rows 30000000 --out before.json
+    python -m benchmarks.run --rows 30000000 --compare before.json
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from benchmarks.synthetic import RAW_COLUMNS, YEAR_SIZED_ROWS, synthetic_trips
+from citibike.paths import PROJECT_DIR
+
+STAGES = ['ingest', 'transforms', 'aggregations', 'od', 'imbalance', 'query', 'dashboard']
+RESULTS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'results')
+## Rows generated per call, so writing the inputs does not need the whole year in memory
+GENERATE_BATCH = 2_000_000
+
+
+############################## INPUTS ###################################################
+
+def write_inputs(folder, rows, seed=0, stations=2000, year=2022):
+    """Write ``rows`` synthetic trips as one CSV per month, and a daily weather CSV.
+
+    Does nothing if ``folder`` already holds a complete set for these parameters.
+    """
+    marker = os.path.join(folder, '_complete')
+    if os.path.exists(marker):
+        return
+    raw = os.path.join(folder, 'raw')
+    os.makedirs(raw, exist_ok = True)
+    paths = [os.path.join(raw, '%d%02d-citibike-tripdata.csv' % (year, month)) for month in range(1, 13)]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    for batch, offset in enumerate(range(0, rows, GENERATE_BATCH)):
+        trips = synthetic_trips(min(GENERATE_BATCH, rows - offset), seed = seed + batch, year = year,
+                                stations = stations, columns = RAW_COLUMNS)
+        months = trips['date'].dt.month.to_numpy()
+        for month, path in enumerate(paths, start = 1):
+            part = trips.loc[months == month, RAW_COLUMNS]
+            part.to_csv(path, mode = 'a', header = not os.path.exists(path), index = False,
+                        date_format = '%Y-%m-%d %H:%M:%S')
+
+    days = pd.date_range('%d-01-01' % year, '%d-12-31' % year)
+    temperature = 12.5 - 11.5 * np.cos(2 * np.pi * (days.dayofyear.to_numpy() - 20) / len(days))
+    pd.DataFrame({'date': days.strftime('%Y-%m-%d'), 'avgTemp': temperature.round(1)}).to_csv(
+        os.path.join(folder, 'weather.csv'), index = False)
+    with open(marker, 'w') as f:
+        f.write('%d rows\n' % rows)
+
+
+############################## STAGES ###################################################
+
+def _trip_count(config):
+    from citibike.trip_store import trip_dataset
+    return trip_dataset(config['store']).count_rows()
+
+
+def stage_ingest(config):
+    from citibike.ingest import ingest, list_trip_files, read_weather
+
+    for folder in [config['store'], config['prepared']]:
+        shutil.rmtree(folder, ignore_errors = True)
+    files = list_trip_files(os.path.join(config['inputs'], 'raw'))
+    weather = read_weather(os.path.join(config['inputs'], 'weather.csv'))
+    start = time.perf_counter()
+    rows = ingest(files, weather, config['store'], config['chunksize'], config['workers'],
+                  full = True, folderpath = config['prepared'])
+    return rows, time.perf_counter() - start
+
+
+def stage_transforms(config):
+    from citibike.transform import derive_features
+
+    trips = synthetic_trips(config['rows'], seed = config['seed'], stations = config['stations'],
+                            columns = ['rideable_type', 'member_casual'])
+    start = time.perf_counter()
+    derive_features(trips)
+    return len(trips), time.perf_counter() - start
+
+
+def stage_aggregations(config):
+    from citibike.aggregates import build_outputs
+    from citibike.cube import CUBE_FILE, TripCube
+    from citibike.manifest import read_manifest
+    from citibike.transform import SEASONS
+
+    start = time.perf_counter()
+    build_outputs(config['store'], read_manifest(config['store']), config['prepared'])
+    cube = TripCube.load(os.path.join(config['prepared'], os.path.basename(CUBE_FILE)))
+    for direction in ['start', 'end']:
+        for season in SEASONS:
+            cube.top_n(20, 'station', direction = direction, season = season)
+    seconds = time.perf_counter() - start
+    return _trip_count(config), seconds
+
+
+def stage_od(config):
+    from citibike.od_matrix import OD_FLOWS_FILE, ODMatrix
+
+    start = time.perf_counter()
+    matrix = ODMatrix.from_store(config['store'])
+    matrix.prune(5000).to_frame().to_csv(os.path.join(config['prepared'], os.path.basename(OD_FLOWS_FILE)),
+                                         index = False)
+    return int(matrix.trips.sum()), time.perf_counter() - start
+
+
+def stage_imbalance(config):
+    from citibike.imbalance import NET_FLOW_FILE, NetFlow
+
+    start = time.perf_counter()
+    flow = NetFlow.from_store(config['store'], frequency = 'D')
+    flow.ranking(20)
+    flow.save(os.path.join(config['prepared'], os.path.basename(NET_FLOW_FILE)))
+    return int(flow.departures.sum()), time.perf_counter() - start
+
+
+def stage_query(config):
+    from citibike.query import daily_rides, top_stations
+
+    start = time.perf_counter()
+    for direction in ['start', 'end']:
+        top_stations(20, direction, config['store'], config['workers'])
+    rides = daily_rides(config['store'], config['workers'])
+    return int(rides['bike_rides_daily'].sum()), time.perf_counter() - start
+
+
+def _load_dashboard_data(folderpath):
+    from citibike.data_store import load_prepared
+    from citibike.duration_hist import load_duration_histogram
+    from citibike.imbalance import load_net_flow
+    from citibike.station_rank import load_station_ranking
+    from citibike.timeseries import load_time_series
+
+    load_time_series(folderpath)
+    load_station_ranking(folderpath)
+    load_prepared('pie_payment', folderpath)
+    load_duration_histogram(folderpath)
+    if os.path.exists(os.path.join(folderpath, 'DB_net_flow.parquet')):
+        load_net_flow(folderpath)
+
+
+def stage_dashboard(config):
+    from citibike.data_store import CACHE_DIRNAME, clear_cache
+
+    ## Cold: parse the prepared files and write their Arrow copies; warm: a new
+    ## session's process reading the Arrow copies
+    shutil.rmtree(os.path.join(config['prepared'], CACHE_DIRNAME), ignore_errors = True)
+    start = time.perf_counter()
+    _load_dashboard_data(config['prepared'])
+    cold = time.perf_counter() - start
+    clear_cache()
+    start = time.perf_counter()
+    _load_dashboard_data(config['prepared'])
+    warm = time.perf_counter() - start
+    return _trip_count(config), cold, {'warm_seconds': warm}
+
+
+STAGE_FUNCTIONS = {'ingest': stage_ingest, 'transforms': stage_transforms, 'aggregations': stage_aggregations,
+                   'od': stage_od, 'imbalance': stage_imbalance, 'query': stage_query,
+                   'dashboard': stage_dashboard}
+
+
+############################## CHILD PROCESSES ##########################################
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    ## Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _stage_child(name, config, connection):
+    try:
+        rows, seconds, *extra = STAGE_FUNCTIONS[name](config)
+        result = {'rows': int(rows), 'seconds': seconds,
+                  'peak_rss_mb': peak_rss_bytes() / 2**20,
+                  'children_peak_rss_mb': peak_rss_bytes(resource.RUSAGE_CHILDREN) / 2**20}
+        for values in extra:
+            result.update(values)
+        connection.send(result)
+    except Exception as error:
+        connection.send({'error': '%s: %s' % (type(error).__name__, error)})
+        raise
+    finally:
+        connection.close()
+
+
+def run_stage(name, config):
+    """Run one stage in a fresh process and return its measurements."""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex = False)
+    process = context.Process(target = _stage_child, args = (name, config, sender))
+    process.start()
+    sender.close()
+    result = receiver.recv() if receiver.poll(None) else {}
+    process.join()
+    if process.exitcode != 0 and 'error' not in result:
+        result['error'] = 'exited with code %s' % process.exitcode
+    if 'error' not in result:
+        result['rows_per_s'] = result['rows'] / result['seconds'] if result['seconds'] else None
+    return dict(stage = name, **result)
+
+
+############################## RESULTS ##################################################
+
+def git_revision():
+    """Commit hash of the project and whether the working tree has changes, or ``None`` outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = PROJECT_DIR, capture_output = True,
+                                text = True, check = True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd = PROJECT_DIR,
+                                capture_output = True, text = True, check = True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def environment():
+    commit, dirty = git_revision()
+    return {'commit': commit,
+            'dirty': dirty,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = 'seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'versions': {'pandas': pd.__version__, 'numpy': np.__version__, 'pyarrow': pa.__version__}}
+
+
+def compare(results, baseline):
+    """Rows per second and peak RSS of ``results`` relative to ``baseline``, per stage."""
+    before = {stage['stage']: stage for stage in baseline['stages']}
+    rows = []
+    for stage in results['stages']:
+        old = before.get(stage['stage'])
+        if old is None or 'error' in old or 'error' in stage:
+            continue
+        rows.append({'stage': stage['stage'],
+                     'rows_per_s': stage['rows_per_s'],
+                     'baseline_rows_per_s': old['rows_per_s'],
+                     'speedup': stage['rows_per_s'] / old['rows_per_s'],
+                     'peak_rss_mb': stage['peak_rss_mb'],
+                     'baseline_peak_rss_mb': old['peak_rss_mb']})
+    return pd.DataFrame(rows)
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Benchmark the ingestion, wrangling and dashboard data paths.')
+    parser.add_argument('--rows', type = int, default = YEAR_SIZED_ROWS, help = 'number of synthetic trips')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the synthetic trips')
+    parser.add_argument('--stations', type = int, default = 2000, help = 'number of synthetic stations')
+    parser.add_argument('--stages', nargs = '+', choices = STAGES, default = STAGES, help = 'stages to run, in order')
+    parser.add_argument('--chunksize', type = int, default = 250_000, help = 'ingestion chunk size')
+    parser.add_argument('--workers', type = int, default = 1, help = 'ingestion and query worker processes')
+    parser.add_argument('--workdir', default = os.path.join(tempfile.gettempdir(), 'citibike-benchmarks'),
+                        help = 'folder for the synthetic inputs and the trip store, reused between runs')
+    parser.add_argument('--out', default = None, help = 'JSON file to write (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', default = None, help = 'earlier JSON result to compare against')
+    args = parser.parse_args(argv)
+
+    inputs = os.path.join(args.workdir, 'inputs-%d-%d-%d' % (args.rows, args.seed, args.stations))
+    config = {'rows': args.rows, 'seed': args.seed, 'stations': args.stations,
+              'chunksize': args.chunksize, 'workers': args.workers, 'inputs': inputs,
+              'store': os.path.join(inputs, 'trips'), 'prepared': os.path.join(inputs, 'prepared')}
+    if 'ingest' in args.stages:
+        print('Writing %s synthetic trips to %s' % (format(args.rows, ','), inputs))
+        write_inputs(inputs, args.rows, args.seed, args.stations)
+    elif not os.path.exists(config['store']):
+        raise SystemExit('no trip store in %s, include the ingest stage' % inputs)
+
+    results = dict(environment(), parameters = {key: config[key] for key in
+                                                ['rows', 'seed', 'stations', 'chunksize', 'workers']})
+    results['stages'] = []
+    for name in args.stages:
+        print('Running %s' % name)
+        results['stages'].append(run_stage(name, config))
+
+    out = args.out or os.path.join(RESULTS_DIR, '%s.json' % (results['commit'] or 'results')[:10])
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok = True)
+    with open(out, 'w', encoding = 'utf-8') as f:
+        json.dump(results, f, indent = 1)
+
+    with pd.option_context('display.float_format', '{:,.1f}'.format, 'display.width', 120):
+        print(pd.DataFrame(results['stages']).to_string(index = False))
+        if args.compare:
+            with open(args.compare, 'r', encoding = 'utf-8') as f:
+                print(compare(results, json.load(f)).to_string(index = False))
+    print('Wrote %s' % out)
+    if any('error' in stage for stage in results['stages']):
+        raise SystemExit('some stages failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+############################# SYNTHETIC TRIPS ###########################################
+#########################################################################################
+"""Synthetic trips shaped like the published Citi Bike trip files.
+
+Station popularity is skewed and ride volume follows the seasons, so groupbys,
+top-N queries and joins see realistic cardinalities without the real data.
+"""
+
+import binascii
+
+import numpy as np
+import pandas as pd
+
+RAW_COLUMNS = ['ride_id', 'rideable_type', 'started_at', 'ended_at',
+               'start_station_name', 'start_station_id', 'end_station_name', 'end_station_id',
+               'start_lat', 'start_lng', 'end_lat', 'end_lng', 'member_casual']
+
+YEAR_SIZED_ROWS = 30_000_000
+
+
+def _stations(rng, count):
+    names = np.array(['Synthetic St %d & Ave %d' % (i // 40, i % 40) for i in range(count)], dtype = object)
+    ids = np.array(['%d.%02d' % (4000 + i, i % 100) for i in range(count)], dtype = object)
+    lat = 40.64 + rng.random(count) * 0.22
+    lng = -74.03 + rng.random(count) * 0.12
+    ## Zipf-like popularity so a few stations dominate, as in the real data
+    weights = 1.0 / np.arange(1, count + 1) ** 0.8
+    return names, ids, lat, lng, weights / weights.sum()
+
+
+def _ride_ids(rng, rows):
+    raw = rng.integers(0, 256, size = rows * 8, dtype = np.uint8).tobytes()
+    return np.frombuffer(binascii.hexlify(raw).upper(), dtype = 'S16').astype(str).astype(object)
+
+
+def synthetic_trips(rows, seed=0, year=2022, stations=2000, columns=None):
+    """Generate ``rows`` trips in the raw Citi Bike schema.
+
+    ``columns`` restricts the output (plus ``date``, which is always added) so
+    large benchmarks only pay for the columns they use.
+    """
+    rng = np.random.default_rng(seed)
+    wanted = set(RAW_COLUMNS if columns is None else columns)
+    frame = {}
+
+    ## More rides in the warm months, like the daily rides in DB_line_chart_data
+    days = pd.date_range('%d-01-01' % year, '%d-12-31' % year)
+    day_weights = 1.6 - np.cos(2 * np.pi * (days.dayofyear.to_numpy() - 20) / len(days))
+    day = rng.choice(len(days), size = rows, p = day_weights / day_weights.sum())
+    seconds = rng.integers(0, 86400, size = rows)
+    started_at = days.values[day] + seconds.astype('timedelta64[s]')
+    duration = np.minimum(rng.gamma(1.6, 500.0, size = rows), 86400 * 2).astype('timedelta64[s]')
+
+    if 'ride_id' in wanted:
+        frame['ride_id'] = _ride_ids(rng, rows)
+    if 'rideable_type' in wanted:
+        frame['rideable_type'] = pd.Categorical.from_codes(rng.integers(0, 2, size = rows),
+                                                           categories = ['classic_bike', 'electric_bike'])
+    if 'started_at' in wanted:
+        frame['started_at'] = started_at
+    if 'ended_at' in wanted:
+        frame['ended_at'] = started_at + duration
+
+    names, ids, lat, lng, weights = _stations(rng, stations)
+    for direction in ['start', 'end']:
+        if not wanted & {'%s_station_name' % direction, '%s_station_id' % direction,
+                         '%s_lat' % direction, '%s_lng' % direction}:
+            continue
+        station = rng.choice(stations, size = rows, p = weights)
+        if '%s_station_name' % direction in wanted:
+            frame['%s_station_name' % direction] = pd.Categorical.from_codes(station, categories = names)
+        if '%s_station_id' % direction in wanted:
+            frame['%s_station_id' % direction] = pd.Categorical.from_codes(station, categories = ids)
+        if '%s_lat' % direction in wanted:
+            frame['%s_lat' % direction] = lat[station] + rng.normal(0, 1e-4, size = rows)
+        if '%s_lng' % direction in wanted:
+            frame['%s_lng' % direction] = lng[station] + rng.normal(0, 1e-4, size = rows)
+
+    if 'member_casual' in wanted:
+        frame['member_casual'] = pd.Categorical.from_codes((rng.random(rows) < 0.78).astype(np.int8),
+                                                           categories = ['casual', 'member'])
+
+    frame = pd.DataFrame(frame)
+    frame['date'] = pd.Series(started_at).dt.normalize()
+    return frame[[column for column in RAW_COLUMNS if column in wanted] + ['date']]
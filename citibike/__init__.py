@@ -0,0 +1 @@
+"""Data pipeline and serving helpers for the Citi Bike dashboard and notebooks."""
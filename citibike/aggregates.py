@@ -0,0 +1,183 @@
+############################# DASHBOARD AGGREGATES #####################################
+#########################################################################################
+"""Mergeable aggregates behind the prepared dashboard data.
+
+"2.6. Data Wrangling 2" derives DB_line_chart_data, DB_bar_chart_start/end and
+DB_pie_payment with groupbys over the whole cleaned trip table. Here every
+source file contributes small partial counts, computed while it is ingested and
+stored next to its part files. The dashboard outputs are rebuilt by summing the
+partials, so refreshing one month only re-reads that month's trips. The same
+partials carry the cells of the trip cube (see ``citibike.cube``) and the trip
+duration histogram (see ``citibike.duration_hist``), and the station ids and
+coordinates of the station table (see ``citibike.stations``).
+"""
+
+import os
+
+import pandas as pd
+
+from citibike.cube import CUBE_FILE, KEYS, TripCube, cube_counts
+from citibike.duration_hist import DURATION_HIST_FILE, DurationHistogram, duration_counts
+from citibike.paths import PREPARED_DIR
+from citibike.schema import TRIP_SCHEMA
+from citibike.stations import StationTable, station_partials
+from citibike.transform import member_labels, rideable_labels, season_of
+
+AGGREGATES_DIRNAME = '_aggregates'
+TOP_STATIONS = 20
+
+## Grouping keys and file name of every partial aggregate
+PARTIALS = {
+    'daily': ['date', 'rideable_type'],
+    'stations': ['direction', 'station_name', 'rideable_type', 'season'],
+    'members': ['member_casual'],
+    'cube': KEYS,
+    'durations': ['member_casual', 'season', 'bin'],
+    'station_coords': ['station_key', 'axis', 'grid'],
+    'station_ids': ['station_key', 'station_id'],
+}
+
+
+############################## PARTIALS #################################################
+
+def partial_aggregates(chunk):
+    """Count one chunk of ingested trips along every ``PARTIALS`` grouping.
+
+    Trips without a temperature reading are left out, as in the cleaned dataset
+    the original aggregates were computed from.
+    """
+    chunk = chunk.loc[chunk['avgTemp'].notna()]
+    rideable = rideable_labels(chunk['rideable_type'])
+    member = member_labels(chunk['member_casual'])
+    season = season_of(chunk['date'])
+
+    daily = (pd.DataFrame({'date': chunk['date'], 'rideable_type': rideable, 'avgTemp': chunk['avgTemp']})
+             .groupby(PARTIALS['daily'], as_index = False, observed = True)
+             .agg(avgTemp = ('avgTemp', 'first'), trips = ('avgTemp', 'size')))
+
+    stations = []
+    for direction in ['start', 'end']:
+        frame = pd.DataFrame({'station_name': chunk['%s_station_name' % direction].astype(object),
+                              'rideable_type': rideable,
+                              'season': season})
+        frame = frame.groupby(PARTIALS['stations'][1:], as_index = False, observed = True).size()
+        frame.insert(0, 'direction', direction)
+        stations.append(frame.rename(columns = {'size': 'trips'}))
+    stations = pd.concat(stations, ignore_index = True)
+
+    members = member.value_counts(sort = False).rename_axis('member_casual').reset_index(name = 'trips')
+
+    cube = cube_counts(pd.DataFrame({'start_station_name': chunk['start_station_name'],
+                                     'end_station_name': chunk['end_station_name'],
+                                     'rideable_type': rideable,
+                                     'member_casual': member,
+                                     'date': chunk['date']}))
+
+    durations = duration_counts(pd.DataFrame({'member_casual': member,
+                                              'season': season,
+                                              'trip_duration': chunk['trip_duration']}))
+
+    station_coords, station_ids = station_partials(chunk)
+
+    return {'daily': daily, 'stations': stations, 'members': members, 'cube': cube, 'durations': durations,
+            'station_coords': station_coords, 'station_ids': station_ids}
+
+
+def _empty_partials():
+    """Partials of no trips, with the columns and dtypes of real ones."""
+    return partial_aggregates(pd.DataFrame({column: pd.Series(dtype = dtype) for column, dtype in TRIP_SCHEMA.items()}))
+
+
+def combine_partials(partials):
+    """Sum a list of partial aggregate dicts into one.
+
+    Kinds missing from a partial, stored before that kind existed, count as empty.
+    """
+    combined = {}
+    for kind, keys in PARTIALS.items():
+        stored = [partial[kind] for partial in partials if kind in partial]
+        frames = [frame for frame in stored if len(frame)]
+        if not frames:
+            combined[kind] = stored[0].iloc[:0] if stored else _empty_partials()[kind]
+            continue
+        frame = pd.concat(frames, ignore_index = True)
+        agg = {'trips': 'sum'}
+        if 'avgTemp' in frame:
+            agg['avgTemp'] = 'first'
+        combined[kind] = frame.groupby(keys, as_index = False, observed = True).agg(agg)
+    return combined
+
+
+def write_partials(partials, dest, prefix):
+    """Store the partials of one source file; returns their paths relative to ``dest``."""
+    folder = os.path.join(dest, AGGREGATES_DIRNAME)
+    os.makedirs(folder, exist_ok = True)
+    written = {}
+    for kind, frame in partials.items():
+        path = os.path.join(folder, '%s-%s.parquet' % (kind, prefix))
+        frame.to_parquet(path, index = False)
+        written[kind] = os.path.relpath(path, dest)
+    return written
+
+
+def read_partials(dest, manifest):
+    """Combine the stored partials of every source in the manifest."""
+    partials = []
+    for source in manifest['sources'].values():
+        stored = source.get('aggregates')
+        if stored:
+            partials.append({kind: pd.read_parquet(os.path.join(dest, path)) for kind, path in stored.items()})
+    return combine_partials(partials)
+
+
+############################## DASHBOARD OUTPUTS ########################################
+
+def line_chart_data(daily):
+    """DB_line_chart_data: temperature, daily rides and daily classic rides per date."""
+    totals = daily.groupby('date', observed = True).agg(avgTemp = ('avgTemp', 'first'), trips = ('trips', 'sum'))
+    classic = daily.loc[daily['rideable_type'] == 'Classic Bike'].groupby('date', observed = True)['trips'].sum()
+    output = pd.DataFrame({'Date': totals.index.strftime('%Y-%m-%d'),
+                           'Average Temperature': totals['avgTemp'].round(1).to_numpy(),
+                           'Daily Rides': totals['trips'].to_numpy(),
+                           'Daily Classic Rides': classic.reindex(totals.index, fill_value = 0).to_numpy()})
+    return output
+
+
+def bar_chart_data(stations, direction, top=TOP_STATIONS):
+    """DB_bar_chart_start/end: the top stations split by rideable type and season."""
+    column = '%s_station_name' % direction
+    frame = stations.loc[stations['direction'] == direction].drop(columns = 'direction')
+    frame = frame.rename(columns = {'station_name': column, 'trips': 'Total'})
+
+    grand_total = frame.groupby(column, observed = True)['Total'].sum()
+    top_stations = grand_total.nlargest(top)
+    output = frame.loc[frame[column].isin(top_stations.index)]
+    output = output.groupby([column, 'rideable_type', 'season'], as_index = False, observed = True)['Total'].sum()
+    output['Grand Total'] = output[column].map(top_stations)
+    return output
+
+
+def pie_payment_data(members):
+    """DB_pie_payment: rides per member status."""
+    return members.groupby('member_casual', observed = True)['trips'].sum().rename('value').to_frame()
+
+
+def _write_csv(frame, path, index):
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    frame.to_csv(tmp_path, index = index)
+    os.replace(tmp_path, path)
+
+
+def build_outputs(dest, manifest, folderpath=PREPARED_DIR):
+    """Rebuild the prepared dashboard CSVs, the trip cube and the duration histogram from the
+    stored partials, and refresh the ids and coordinates of the station table in ``dest``.
+    """
+    combined = read_partials(dest, manifest)
+    StationTable.load(dest).with_partials(combined['station_coords'], combined['station_ids']).save(dest)
+    os.makedirs(folderpath, exist_ok = True)
+    _write_csv(line_chart_data(combined['daily']), os.path.join(folderpath, 'DB_line_chart_data.csv'), True)
+    _write_csv(bar_chart_data(combined['stations'], 'start'), os.path.join(folderpath, 'DB_bar_chart_start.csv'), True)
+    _write_csv(bar_chart_data(combined['stations'], 'end'), os.path.join(folderpath, 'DB_bar_chart_end.csv'), True)
+    _write_csv(pie_payment_data(combined['members']), os.path.join(folderpath, 'DB_pie_payment.csv'), True)
+    TripCube(combined['cube']).save(os.path.join(folderpath, os.path.basename(CUBE_FILE)))
+    DurationHistogram(combined['durations']).save(os.path.join(folderpath, os.path.basename(DURATION_HIST_FILE)))
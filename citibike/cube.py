@@ -0,0 +1,163 @@
+############################# TRIP CUBE #################################################
+#########################################################################################
+"""Pre-aggregated trip counts by station, bike type, member status and day.
+
+"2.6. Data Wrangling 2" runs a separate groupby over every trip for each
+dashboard output, so a new slice (say, end stations for members in winter)
+means another pass over the full table. ``TripCube`` holds the trip count of
+every non-empty (direction, station, rideable_type, member_casual, date) cell,
+with the season derived from the date, and answers any roll-up or top-N over
+those dimensions from integer codes without touching the trips again.
+
+The cube is built in the same pass as the other ingestion aggregates and
+written to ``Data/Prepared_data/DB_trip_cube.parquet``. To query it::
+
+    cube = TripCube.load()
+    cube.top_n(20, 'station', direction = 'end', member_casual = 'Member', season = 'Winter')
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from citibike.paths import PREPARED_DIR
+from citibike.transform import SEASON_CODE_BY_MONTH, SEASONS
+
+CUBE_FILE = os.path.join(PREPARED_DIR, 'DB_trip_cube.parquet')
+
+## Stored dimensions, in the order of the counts frame; season is derived from date
+KEYS = ['direction', 'station', 'rideable_type', 'member_casual', 'date']
+DIMENSIONS = KEYS + ['season']
+DIRECTIONS = ['start', 'end']
+
+
+def cube_counts(trips):
+    """Trip counts of one batch of cleaned trips, keyed by ``KEYS``.
+
+    Both ends of a trip are counted: once for its start station with
+    ``direction='start'`` and once for its end station with ``direction='end'``.
+    """
+    frames = []
+    for direction in DIRECTIONS:
+        frame = pd.DataFrame({'station': trips['%s_station_name' % direction].astype(object),
+                              'rideable_type': trips['rideable_type'].astype(object),
+                              'member_casual': trips['member_casual'].astype(object),
+                              'date': trips['date']})
+        frame = frame.groupby(KEYS[1:], as_index = False, observed = True).size()
+        frame.insert(0, 'direction', direction)
+        frames.append(frame.rename(columns = {'size': 'trips'}))
+    return pd.concat(frames, ignore_index = True)
+
+
+class TripCube:
+    """Sparse trip counts over ``DIMENSIONS`` with roll-up and top-N queries.
+
+    Each dimension is kept as an integer code array plus its labels, so
+    filters are ``np.isin`` over small integers and roll-ups are a
+    ``np.bincount`` over the combined codes of the requested dimensions.
+
+    Every trip is stored once per direction: filter on ``direction`` to count
+    trips rather than station visits.
+    """
+
+    def __init__(self, counts):
+        counts = counts.loc[counts['trips'] > 0]
+        self.labels = {}
+        self.codes = {}
+        for dimension in KEYS:
+            values = counts[dimension]
+            if dimension == 'direction':
+                codes, labels = pd.Categorical(values, categories = DIRECTIONS).codes, pd.Index(DIRECTIONS)
+            else:
+                codes, labels = pd.factorize(values, sort = True)
+            self.codes[dimension] = np.asarray(codes, dtype = np.int32)
+            self.labels[dimension] = pd.Index(labels)
+        ## Counts without rows come untyped from combine_partials; dates must stay dates
+        self.labels['date'] = pd.DatetimeIndex(self.labels['date'])
+        ## Season is a lookup on the month of each distinct date
+        self.labels['season'] = pd.Index(SEASONS)
+        season_of_date = SEASON_CODE_BY_MONTH[self.labels['date'].month.to_numpy()].astype(np.int32)
+        self.codes['season'] = season_of_date[self.codes['date']]
+        self.trips = counts['trips'].to_numpy(dtype = np.int64)
+
+    ############################## BUILD AND STORE ######################################
+
+    @classmethod
+    def from_trips(cls, trips):
+        """Build a cube straight from a frame of cleaned trips."""
+        return cls(cube_counts(trips))
+
+    def to_counts(self):
+        """The stored cells as a frame with one row per non-empty cell."""
+        frame = {dimension: self.labels[dimension].take(self.codes[dimension]) for dimension in KEYS}
+        frame['trips'] = self.trips
+        return pd.DataFrame(frame)
+
+    def save(self, path=CUBE_FILE):
+        counts = self.to_counts()
+        for dimension in KEYS[:-1]:
+            counts[dimension] = counts[dimension].astype('category')
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        counts.to_parquet(tmp_path, index = False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=CUBE_FILE):
+        counts = pd.read_parquet(path)
+        return cls(counts.astype({dimension: object for dimension in KEYS[:-1]}))
+
+    def __len__(self):
+        return len(self.trips)
+
+    ############################## QUERIES ##############################################
+
+    def _mask(self, start=None, end=None, **filters):
+        mask = np.ones(len(self.trips), dtype = bool)
+        for dimension, value in filters.items():
+            if value is None:
+                continue
+            if dimension not in self.labels:
+                raise KeyError('unknown cube dimension: %s' % dimension)
+            values = list(value) if pd.api.types.is_list_like(value) else [value]
+            wanted = self.labels[dimension].get_indexer(values)
+            mask &= np.isin(self.codes[dimension], wanted[wanted >= 0])
+        dates = self.labels['date']
+        if start is not None:
+            mask &= self.codes['date'] >= dates.searchsorted(pd.Timestamp(start))
+        if end is not None:
+            mask &= self.codes['date'] < dates.searchsorted(pd.Timestamp(end), side = 'right')
+        return mask
+
+    def rollup(self, by, start=None, end=None, **filters):
+        """Total trips per combination of the ``by`` dimensions.
+
+        ``filters`` restrict any dimension to one value or a list of values and
+        ``start``/``end`` bound the date (inclusive). Returns a frame with the
+        ``by`` columns and ``trips``, largest first.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        mask = self._mask(start, end, **filters)
+        if not by:
+            return pd.DataFrame({'trips': [int(self.trips[mask].sum())]})
+
+        sizes = [len(self.labels[dimension]) for dimension in by]
+        key = np.ravel_multi_index([self.codes[dimension][mask] for dimension in by], sizes)
+        if np.prod(sizes, dtype = np.float64) <= 4 * len(key) + 1_000_000:
+            totals = np.bincount(key, weights = self.trips[mask], minlength = int(np.prod(sizes)))
+            cells = np.flatnonzero(totals)
+            totals = totals[cells]
+        else:
+            cells, inverse = np.unique(key, return_inverse = True)
+            totals = np.bincount(inverse, weights = self.trips[mask])
+
+        order = np.argsort(-totals, kind = 'stable')
+        cells = cells[order]
+        frame = {dimension: self.labels[dimension].take(codes)
+                 for dimension, codes in zip(by, np.unravel_index(cells, sizes))}
+        frame['trips'] = totals[order].astype(np.int64)
+        return pd.DataFrame(frame)
+
+    def top_n(self, n, by='station', start=None, end=None, **filters):
+        """The ``n`` largest ``by`` values under the filters, e.g. the top stations."""
+        return self.rollup(by, start, end, **filters).head(n).reset_index(drop = True)
@@ -0,0 +1,167 @@
+############################# PREPARED DATA STORE #######################################
+#########################################################################################
+"""Process-wide cache for the prepared datasets behind the dashboard.
+
+Streamlit re-executes the dashboard script on every interaction, so reading the
+prepared CSVs at the top of the script re-parses every file on every rerun and
+in every session. ``load_prepared`` parses a CSV once, keeps an Arrow IPC copy of
+it next to the data and hands every caller the same in-memory frame until the
+source file changes on disk.
+
+The returned frames are shared between sessions and must be treated as
+read-only: filter, sort or copy them, never assign into them.
+"""
+
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from citibike.paths import PREPARED_DIR
+
+## Prepared datasets the dashboard reads, with the options they were exported with
+PREPARED_DATASETS = {
+    'line_chart': ('DB_line_chart_data.csv', {'index_col': 0}),
+    'bar_chart_start': ('DB_bar_chart_start.csv', {'index_col': 0}),
+    'bar_chart_end': ('DB_bar_chart_end.csv', {'index_col': 0}),
+    'pie_payment': ('DB_pie_payment.csv', {}),
+    'hist_duration': ('DB_hist_duration.csv', {'index_col': 0}),
+}
+
+## Arrow copies are written to a cache folder inside the data folder
+CACHE_DIRNAME = '_cache'
+SIGNATURE_KEY = b'citibike.source_signature'
+
+## Guards the dicts below; loads run under a lock of their own path or key, so a cold
+## load only holds back the callers waiting for the same dataset
+_lock = threading.Lock()
+_frames = {}
+_derived = {}
+_loading = {}
+
+
+def _loading_lock(key):
+    with _lock:
+        return _loading.setdefault(key, threading.RLock())
+
+
+def _cached(cache, key, signature):
+    with _lock:
+        cached = cache.get(key)
+    return cached[1] if cached is not None and cached[0] == signature else None
+
+
+def file_signature(path):
+    """Return the ``(mtime_ns, size)`` pair used to detect changes to ``path``."""
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _encode_signature(signature):
+    return ('%d:%d' % signature).encode()
+
+
+def _arrow_path(path):
+    folder, name = os.path.split(path)
+    return os.path.join(folder, CACHE_DIRNAME, os.path.splitext(name)[0] + '.arrow')
+
+
+def _read_arrow(path, signature):
+    """Memory-map the Arrow copy of a dataset if it was built from ``signature``."""
+    if not os.path.exists(path):
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    metadata = reader.schema.metadata or {}
+    if metadata.get(SIGNATURE_KEY) != _encode_signature(signature):
+        return None
+    ## Numeric columns stay backed by the mapped file and are read-only
+    return reader.read_all().to_pandas(split_blocks = True)
+
+
+def _write_arrow(frame, path, signature):
+    table = pa.Table.from_pandas(frame, preserve_index = True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SIGNATURE_KEY] = _encode_signature(signature)
+    table = table.replace_schema_metadata(metadata)
+
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_prepared_file(path, **read_csv_kwargs):
+    """Load a prepared CSV through the shared cache.
+
+    The frame is reused for as long as the file's mtime and size are unchanged.
+    On a miss the Arrow copy is tried first and the CSV is only parsed when the
+    Arrow copy is missing or stale.
+    """
+    path = os.path.abspath(path)
+    signature = file_signature(path)
+
+    frame = _cached(_frames, path, signature)
+    if frame is not None:
+        return frame
+
+    with _loading_lock(('frame', path)):
+        ## Another caller may have loaded it while this one waited
+        frame = _cached(_frames, path, signature)
+        if frame is not None:
+            return frame
+        arrow_path = _arrow_path(path)
+        frame = _read_arrow(arrow_path, signature)
+        if frame is None:
+            frame = pd.read_csv(path, **read_csv_kwargs)
+            try:
+                _write_arrow(frame, arrow_path, signature)
+            except OSError:
+                ## Read-only deployments still get the in-process cache
+                pass
+        with _lock:
+            _frames[path] = (signature, frame)
+        return frame
+
+
+def load_prepared(name, folderpath=PREPARED_DIR):
+    """Load one of the ``PREPARED_DATASETS`` by name."""
+    filename, read_csv_kwargs = PREPARED_DATASETS[name]
+    return read_prepared_file(os.path.join(folderpath, filename), **read_csv_kwargs)
+
+
+def load_derived(key, paths, build):
+    """Process-wide cache for an object built from prepared files.
+
+    ``build()`` runs once and its result is shared until the signature of any
+    of ``paths`` changes. Like the frames, the result must be treated as
+    read-only.
+    """
+    signature = tuple(file_signature(path) for path in paths)
+    value = _cached(_derived, key, signature)
+    if value is not None:
+        return value
+
+    with _loading_lock(('derived', key)):
+        value = _cached(_derived, key, signature)
+        if value is not None:
+            return value
+        value = build()
+        with _lock:
+            _derived[key] = (signature, value)
+        return value
+
+
+def prepared_version(names, folderpath=PREPARED_DIR):
+    """Signature of the ``PREPARED_DATASETS`` files in ``names``, for keying derived results."""
+    names = [names] if isinstance(names, str) else names
+    return tuple(file_signature(os.path.join(folderpath, PREPARED_DATASETS[name][0])) for name in names)
+
+
+def clear_cache():
+    """Drop every cached frame and derived object; the Arrow copies on disk are kept."""
+    with _lock:
+        _frames.clear()
+        _derived.clear()
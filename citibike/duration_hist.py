@@ -0,0 +1,186 @@
+############################# TRIP DURATION HISTOGRAM ###################################
+#########################################################################################
+"""Exact trip duration distribution per member status and season.
+
+"2.6. Data Wrangling 2" exports DB_hist_duration.csv, a 2.5% random sample of
+the trips, and the "User Behavior Analysis" page draws its histogram and takes
+the member and casual medians from that sample. ``DurationHistogram`` counts
+every trip instead, in mergeable bins built during ingestion alongside the
+other partial aggregates:
+
+- one bin per second below ``EXACT_SECONDS``, so quantiles there are exact;
+- above it, log-spaced bins ``GAMMA`` apart, a quantile sketch whose
+  estimates are within half a percent of the true duration.
+
+The counts of all trips fit in a small Parquet file, DB_duration_hist.parquet,
+from which any histogram, median or percentile is computed without reading
+the trips.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from citibike.data_store import file_signature, load_derived, load_prepared
+from citibike.paths import PREPARED_DIR
+from citibike.transform import SEASONS
+
+DURATION_HIST_FILE = os.path.join(PREPARED_DIR, 'DB_duration_hist.parquet')
+
+## Trip durations in seconds below this have their own bin
+EXACT_SECONDS = 4 * 3600
+## Ratio between consecutive bin edges above EXACT_SECONDS
+GAMMA = 1.01
+
+KEYS = ['member_casual', 'season']
+
+
+############################## BINS #####################################################
+
+def duration_bins(seconds):
+    """Bin number of each duration; negative durations are counted as zero."""
+    seconds = np.clip(np.asarray(seconds, dtype = np.int64), 0, None)
+    bins = seconds.copy()
+    over = seconds >= EXACT_SECONDS
+    bins[over] = EXACT_SECONDS + np.floor(np.log(seconds[over] / EXACT_SECONDS) / np.log(GAMMA)).astype(np.int64)
+    return bins
+
+
+def bin_edges(bins):
+    """Lower edge in seconds of each bin number."""
+    bins = np.asarray(bins, dtype = np.int64)
+    return np.where(bins < EXACT_SECONDS, bins,
+                    EXACT_SECONDS * GAMMA ** (np.maximum(bins, EXACT_SECONDS) - EXACT_SECONDS))
+
+
+def bin_values(bins):
+    """Duration each bin stands for: its second below ``EXACT_SECONDS``, its geometric middle above."""
+    bins = np.asarray(bins, dtype = np.int64)
+    return np.where(bins < EXACT_SECONDS, bins,
+                    EXACT_SECONDS * GAMMA ** (np.maximum(bins, EXACT_SECONDS) - EXACT_SECONDS + 0.5))
+
+
+def duration_counts(trips):
+    """Trip counts of one batch of trips by ``KEYS`` and duration bin."""
+    frame = pd.DataFrame({'member_casual': trips['member_casual'].astype(object),
+                          'season': trips['season'].astype(object),
+                          'bin': duration_bins(trips['trip_duration'].to_numpy())},
+                         index = trips.index)
+    frame = frame.groupby(KEYS + ['bin'], as_index = False, observed = True).size()
+    return frame.rename(columns = {'size': 'trips'})
+
+
+############################## HISTOGRAM ################################################
+
+class DurationHistogram:
+    """Duration bin counts per member status and season, with exact quantiles."""
+
+    def __init__(self, counts):
+        """``counts`` has ``member_casual``, ``season``, ``bin`` and ``trips`` columns."""
+        self.members = pd.Index(sorted(counts['member_casual'].unique()))
+        self.seasons = [season for season in SEASONS if season in set(counts['season'])]
+        n_bins = int(counts['bin'].max()) + 1 if len(counts) else 0
+        self.counts = np.zeros((len(self.members), len(SEASONS), n_bins), dtype = np.int64)
+        np.add.at(self.counts,
+                  (self.members.get_indexer(counts['member_casual']),
+                   pd.Index(SEASONS).get_indexer(counts['season']),
+                   counts['bin'].to_numpy(dtype = np.int64)),
+                  counts['trips'].to_numpy())
+
+    @classmethod
+    def from_trips(cls, trips):
+        """Build straight from trips with ``member_casual``, ``season`` and ``trip_duration``."""
+        return cls(duration_counts(trips))
+
+    def to_counts(self):
+        member, season, bins = np.nonzero(self.counts)
+        return pd.DataFrame({'member_casual': self.members.take(member),
+                             'season': pd.Index(SEASONS).take(season),
+                             'bin': bins,
+                             'trips': self.counts[member, season, bins]})
+
+    def save(self, path=DURATION_HIST_FILE):
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        self.to_counts().to_parquet(tmp_path, index = False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=DURATION_HIST_FILE):
+        return cls(pd.read_parquet(path))
+
+    ############################## QUERIES ##############################################
+
+    def select(self, member_casual=None, season=None):
+        """Counts per bin of the trips matching the filters (``None`` keeps everything)."""
+        members = slice(None) if member_casual is None else self.members.get_indexer(
+            [member_casual] if isinstance(member_casual, str) else list(member_casual))
+        seasons = slice(None) if season is None else [
+            SEASONS.index(value) for value in ([season] if isinstance(season, str) else season)]
+        return self.counts[members][:, seasons].sum(axis = (0, 1))
+
+    def total(self, **filters):
+        return int(self.select(**filters).sum())
+
+    def quantile(self, q, **filters):
+        """Duration quantiles in seconds, interpolated between ranks like ``np.quantile``.
+
+        Exact for durations under ``EXACT_SECONDS``. Returns NaN when no trips match.
+        """
+        counts = self.select(**filters)
+        total = counts.sum()
+        q = np.asarray(q, dtype = np.float64)
+        if total == 0:
+            return np.full(q.shape, np.nan) if q.ndim else np.nan
+        cumulative = np.cumsum(counts)
+        position = q * (total - 1)
+        lower = np.floor(position).astype(np.int64)
+        upper = np.ceil(position).astype(np.int64)
+        lower_value = bin_values(np.searchsorted(cumulative, lower, side = 'right'))
+        upper_value = bin_values(np.searchsorted(cumulative, upper, side = 'right'))
+        result = lower_value + (upper_value - lower_value) * (position - lower)
+        return float(result) if result.ndim == 0 else result
+
+    def median(self, **filters):
+        return self.quantile(0.5, **filters)
+
+    def histogram(self, bins=50, upper=None, **filters):
+        """Counts in ``bins`` equal-width bins from 0 to ``upper`` seconds, for plotting.
+
+        ``upper`` defaults to the longest duration. Trips beyond it are left out.
+        Returns a frame with ``start``, ``end``, ``duration`` (bin middle) and ``trips``.
+        """
+        counts = self.select(**filters)
+        filled = np.flatnonzero(counts)
+        if upper is None:
+            upper = float(bin_values(filled[-1])) + 1 if len(filled) else 1.0
+        width = upper / bins
+        values = bin_values(filled)
+        keep = values < upper
+        trips = np.bincount((values[keep] // width).astype(np.int64), weights = counts[filled[keep]],
+                            minlength = bins)[:bins]
+        start = np.arange(bins) * width
+        return pd.DataFrame({'start': start,
+                             'end': start + width,
+                             'duration': start + width / 2,
+                             'trips': trips.astype(np.int64)})
+
+
+############################## LOADING ##################################################
+
+def load_duration_histogram(folderpath=PREPARED_DIR):
+    """Process-wide histogram of every trip, or of the DB_hist_duration.csv sample when
+    DB_duration_hist.parquet has not been built yet.
+    """
+    path = os.path.join(folderpath, os.path.basename(DURATION_HIST_FILE))
+    if os.path.exists(path):
+        build = lambda: DurationHistogram.load(path)
+    else:
+        path = os.path.join(folderpath, 'DB_hist_duration.csv')
+        build = lambda: DurationHistogram.from_trips(load_prepared('hist_duration', folderpath))
+
+    def versioned():
+        histogram = build()
+        histogram.version = file_signature(path)
+        return histogram
+    return load_derived(('duration_histogram', os.path.abspath(folderpath)), [path], versioned)
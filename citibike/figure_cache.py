@@ -0,0 +1,128 @@
+############################# FIGURE CACHE ##############################################
+#########################################################################################
+"""Process-wide cache of the dashboard's built Plotly figures.
+
+Every rerun of the dashboard rebuilds its figures with ``make_subplots``,
+``px.bar``, ``px.histogram`` and ``px.pie`` plus their ``update_layout``
+styling, even when neither the data nor the filters changed. ``cached_figure``
+builds a figure once per (page, data version, filter state) and hands the same
+object to every later rerun and every session showing that view.
+
+The cache is an LRU capped by the approximate size of the figures it holds:
+the bytes of their data arrays plus the length of every other value, measured
+without serializing them. Only the built figures are cached, not their JSON:
+``st.plotly_chart`` accepts a figure or a dict and always validates and
+serializes it itself, so a cached serialization would never be used.
+Cached figures are shared and must not be modified after they are built.
+Lookups are timed as ``figure`` spans and builds as ``figure/build`` (see
+``citibike.instrumentation``).
+"""
+
+import collections
+import threading
+
+import numpy as np
+
+from citibike.instrumentation import span
+
+## Approximate bytes of all cached figures together (see ``figure_nbytes``)
+DEFAULT_MAX_BYTES = 64 * 2**20
+DEFAULT_MAX_ENTRIES = 256
+
+
+def _freeze(value):
+    """A hashable copy of a filter state made of dicts, lists, sets and scalars."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(item) for item in value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(len(key) + _nbytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    return len(str(value))
+
+
+def figure_nbytes(figure):
+    """Approximate size of ``figure``: its data arrays' bytes plus the length of its other values."""
+    return _nbytes(figure.to_plotly_json())
+
+
+class FigureCache:
+    """Thread-safe LRU of built figures, bounded by entries and approximate bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, figure):
+        """Cache ``figure`` under ``key``, evicting the least recently used figures to fit."""
+        size = figure_nbytes(figure)
+        if size > self.max_bytes:
+            return figure
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (figure, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._bytes -= self._entries.popitem(last = False)[1][1]
+        return figure
+
+    def get_or_build(self, key, build):
+        figure = self.get(key)
+        if figure is None:
+            ## Built outside the lock: sessions on other views are never blocked by a build
+            with span('build'):
+                figure = self.put(key, build())
+        return figure
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+figures = FigureCache()
+
+
+def cached_figure(page, version, filters, build):
+    """The figure ``build()`` returns for this view, built at most once per key
+    and then shared by every rerun and session showing it.
+
+    ``version`` identifies the data behind the figure (for example the file
+    signatures of its prepared datasets) and ``filters`` the widget state it
+    depends on, as a dict of plain values.
+    """
+    with span('figure'):
+        return figures.get_or_build((page, _freeze(version), _freeze(filters)), build)
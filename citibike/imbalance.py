@@ -0,0 +1,265 @@
+############################# STATION IMBALANCE #########################################
+#########################################################################################
+"""Departures, arrivals and bike inventory drift per station over time.
+
+The dashboard's "Addressing Distribution Issues" and "Recommendations"
+sections discuss shortages and overcrowded docks, but nothing measured them:
+DB_bar_chart_start/end only rank stations by starts and by ends separately.
+``NetFlow`` counts departures (``started_at`` at the start station) and
+arrivals (``ended_at`` at the end station) per station per hour or day in one
+streaming pass over the station keys of the trip store, with a ``bincount``
+per batch into a dense (period, station) array.
+
+The running sum of arrivals minus departures is the station's inventory
+drift: how many bikes would pile up (positive) or run out (negative) without
+rebalancing. ``ranking`` orders the stations by their net flow and the spread
+of their drift.
+
+Write DB_net_flow.parquet for the dashboard with::
+
+    python -m citibike.imbalance
+"""
+
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from citibike.data_store import file_signature, load_derived
+from citibike.manifest import read_manifest
+from citibike.paths import PREPARED_DIR, TRIPS_DIR
+from citibike.stations import KEY_COLUMNS, StationTable
+from citibike.trip_store import trip_dataset, trip_filter
+
+NET_FLOW_FILE = os.path.join(PREPARED_DIR, 'DB_net_flow.parquet')
+FREQUENCIES = {'h': pd.Timedelta(hours = 1), 'D': pd.Timedelta(days = 1)}
+FLOW_COLUMNS = ['started_at', 'ended_at'] + KEY_COLUMNS
+## Parquet schema metadata holding the period frequency of a saved NetFlow
+FREQUENCY_KEY = b'citibike.frequency'
+_PARTITION = re.compile(r'year=(\d+)[\\/]month=(\d+)')
+
+
+def _period_span(root):
+    """First and last day covered by the partitions of the trip store."""
+    months = []
+    for source in read_manifest(root)['sources'].values():
+        for part in source['parts']:
+            match = _PARTITION.search(part)
+            if match:
+                months.append(pd.Timestamp(int(match.group(1)), int(match.group(2)), 1))
+    if not months:
+        raise FileNotFoundError('no committed trip data in %s, run citibike.ingest first' % root)
+    ## Trips starting on the last evening of the last month can end the next day
+    return min(months), max(months) + pd.offsets.MonthBegin(1) + pd.Timedelta(days = 1)
+
+
+def _accumulate(counts, periods, keys, n_periods, n_stations):
+    """Add one batch of (period, station) events into the flat ``counts``."""
+    valid = (keys >= 0) & (periods >= 0) & (periods < n_periods)
+    flat = periods[valid] * n_stations + keys[valid]
+    if len(flat):
+        ## A batch covers a few weeks at most, so only that slice of the array is counted
+        low = flat.min()
+        added = np.bincount(flat - low)
+        counts[low:low + len(added)] += added
+
+
+class _FlowCounter:
+    """Flat departure and arrival counts over ``[first, last)`` filled batch by batch."""
+
+    def __init__(self, n_stations, frequency, first, last):
+        self.n_stations = n_stations
+        self.frequency = frequency
+        self.first = first
+        self.step = FREQUENCIES[frequency].value
+        self.n_periods = max(-(-(last.value - first.value) // self.step), 0)
+        self.departures = np.zeros(self.n_periods * n_stations, dtype = np.int64)
+        self.arrivals = np.zeros(self.n_periods * n_stations, dtype = np.int64)
+
+    def add(self, started_at, ended_at, start_keys, end_keys):
+        for counts, times, keys in [(self.departures, started_at, start_keys), (self.arrivals, ended_at, end_keys)]:
+            periods = (np.asarray(times, dtype = 'datetime64[ns]').view(np.int64) - self.first.value) // self.step
+            _accumulate(counts, periods, np.asarray(keys, dtype = np.int64), self.n_periods, self.n_stations)
+
+    def flow(self, stations):
+        shape = (self.n_periods, self.n_stations)
+        return NetFlow(stations, self.first, self.frequency,
+                       self.departures.reshape(shape).astype(np.int32), self.arrivals.reshape(shape).astype(np.int32))
+
+
+class NetFlow:
+    """Departures and arrivals per (period, station), with drift and ranking."""
+
+    def __init__(self, stations, start, frequency, departures, arrivals):
+        self.stations = pd.Index(stations)
+        self.start = pd.Timestamp(start)
+        self.frequency = frequency
+        self.departures = np.asarray(departures)
+        self.arrivals = np.asarray(arrivals)
+        self.version = None
+
+    @property
+    def periods(self):
+        return pd.date_range(self.start, periods = self.departures.shape[0], freq = FREQUENCIES[self.frequency])
+
+    @property
+    def net(self):
+        """Arrivals minus departures per period and station."""
+        return self.arrivals.astype(np.int64) - self.departures
+
+    ############################## BUILD AND STORE ######################################
+
+    @classmethod
+    def from_arrays(cls, stations, started_at, ended_at, start_keys, end_keys, frequency='h', start=None, end=None):
+        """Count from trip timestamps and station keys (positions in ``stations``)."""
+        first = pd.Timestamp(start if start is not None else np.min(started_at)).floor('D')
+        last = pd.Timestamp(end if end is not None else np.max(ended_at)).floor('D') + pd.Timedelta(days = 1)
+        counter = _FlowCounter(len(stations), frequency, first, last)
+        counter.add(started_at, ended_at, start_keys, end_keys)
+        return counter.flow(stations)
+
+    @classmethod
+    def from_store(cls, root=TRIPS_DIR, frequency='h', start=None, end=None, batch_size=1_000_000):
+        """Count every trip of the store between the optional ``start`` and ``end`` dates in one pass."""
+        first, last = _period_span(root)
+        if start is not None:
+            first = max(first, pd.Timestamp(start).floor('D'))
+        if end is not None:
+            last = min(last, pd.Timestamp(end).floor('D') + pd.Timedelta(days = 1))
+        stations = StationTable.load(root).frame['station_name']
+        counter = _FlowCounter(len(stations), frequency, first, last)
+        batches = trip_dataset(root).to_batches(columns = FLOW_COLUMNS, filter = trip_filter(start, end),
+                                                batch_size = batch_size)
+        for batch in batches:
+            counter.add(*[batch.column(column).to_numpy(zero_copy_only = False) for column in FLOW_COLUMNS])
+        return counter.flow(stations)
+
+    def to_frame(self):
+        """Non-empty (period, station) cells in long format."""
+        period, station = np.nonzero(self.departures | self.arrivals)
+        return pd.DataFrame({'period': self.periods.take(period),
+                             'station': self.stations.take(station),
+                             'departures': self.departures[period, station],
+                             'arrivals': self.arrivals[period, station]})
+
+    @classmethod
+    def from_frame(cls, frame, frequency):
+        """Inverse of ``to_frame``; rows falling in the same (period, station) cell are added."""
+        stations = pd.Index(sorted(frame['station'].unique()))
+        start = frame['period'].min()
+        period = ((frame['period'] - start) // FREQUENCIES[frequency]).to_numpy(dtype = np.int64)
+        station = stations.get_indexer(frame['station'])
+        shape = (int(period.max()) + 1 if len(period) else 0, len(stations))
+        departures = np.zeros(shape, dtype = np.int32)
+        arrivals = np.zeros(shape, dtype = np.int32)
+        np.add.at(departures, (period, station), frame['departures'].to_numpy())
+        np.add.at(arrivals, (period, station), frame['arrivals'].to_numpy())
+        return cls(stations, start, frequency, departures, arrivals)
+
+    def save(self, path=NET_FLOW_FILE):
+        """Write the non-empty cells, with the frequency in the Parquet schema metadata."""
+        frame = self.to_frame()
+        frame['station'] = frame['station'].astype('category')
+        table = pa.Table.from_pandas(frame, preserve_index = False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[FREQUENCY_KEY] = self.frequency.encode()
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=NET_FLOW_FILE):
+        """Read a saved ``NetFlow`` at the frequency it was saved with (daily for older files)."""
+        table = pq.read_table(path)
+        frequency = (table.schema.metadata or {}).get(FREQUENCY_KEY, b'D').decode()
+        return cls.from_frame(table.to_pandas().astype({'station': object}), frequency)
+
+    ############################## ANALYSIS #############################################
+
+    def resample(self, frequency):
+        """Hourly counts summed into days; returns ``self`` when already at ``frequency``."""
+        if frequency == self.frequency:
+            return self
+        if (self.frequency, frequency) != ('h', 'D'):
+            raise ValueError('can only resample hourly counts to daily')
+        offset = self.start.hour
+        pad = (offset, (-(offset + len(self.departures))) % 24)
+        days = [np.pad(counts, (pad, (0, 0))).reshape(-1, 24, len(self.stations)).sum(axis = 1)
+                for counts in (self.departures, self.arrivals)]
+        return NetFlow(self.stations, self.start.floor('D'), 'D', *days)
+
+    def drift(self, stations=None):
+        """Running arrivals minus departures per station, indexed by period."""
+        net = self.net
+        columns = self.stations
+        if stations is not None:
+            positions = self.stations.get_indexer(stations)
+            net, columns = net[:, positions], self.stations.take(positions)
+        return pd.DataFrame(np.cumsum(net, axis = 0), index = self.periods, columns = columns)
+
+    def hourly_profile(self):
+        """Average net flow per hour of day and station (hourly counts only)."""
+        if self.frequency != 'h':
+            raise ValueError('the hourly profile needs hourly counts')
+        hours = self.periods.hour.to_numpy()
+        totals = np.zeros((24, len(self.stations)), dtype = np.int64)
+        np.add.at(totals, hours, self.net)
+        days = np.bincount(hours, minlength = 24).clip(min = 1)
+        return pd.DataFrame(totals / days[:, None], columns = self.stations).rename_axis('hour')
+
+    def ranking(self, top=20, by='net'):
+        """Stations ordered by imbalance, worst first.
+
+        ``by='net'`` ranks by the absolute total of arrivals minus departures,
+        ``by='drift'`` by the spread between the highest and lowest drift, the
+        bikes a station would need moved to never run empty or full.
+        """
+        drift = np.cumsum(self.net, axis = 0)
+        frame = pd.DataFrame({'station': self.stations,
+                              'departures': self.departures.sum(axis = 0, dtype = np.int64),
+                              'arrivals': self.arrivals.sum(axis = 0, dtype = np.int64)})
+        frame['net'] = frame['arrivals'] - frame['departures']
+        frame['drift_min'] = np.minimum(drift.min(axis = 0), 0) if len(drift) else 0
+        frame['drift_max'] = np.maximum(drift.max(axis = 0), 0) if len(drift) else 0
+        frame['drift_range'] = frame['drift_max'] - frame['drift_min']
+        key = frame['net'].abs() if by == 'net' else frame['drift_range']
+        order = np.lexsort((frame['station'].to_numpy(), -key.to_numpy()))
+        return frame.iloc[order[:top]].reset_index(drop = True)
+
+
+def load_net_flow(folderpath=PREPARED_DIR):
+    """Process-wide daily ``NetFlow`` from DB_net_flow.parquet, rebuilt when the file changes.
+
+    Hourly files are summed into days.
+    """
+    path = os.path.join(folderpath, os.path.basename(NET_FLOW_FILE))
+
+    def build():
+        flow = NetFlow.load(path).resample('D')
+        flow.version = file_signature(path)
+        return flow
+    return load_derived(('net_flow', os.path.abspath(folderpath)), [path], build)
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Count departures and arrivals per station for the imbalance page.')
+    parser.add_argument('--source', default = TRIPS_DIR, help = 'trip store folder written by citibike.ingest')
+    parser.add_argument('--out', default = NET_FLOW_FILE, help = 'Parquet file to write')
+    parser.add_argument('--frequency', choices = sorted(FREQUENCIES), default = 'D',
+                        help = 'period of the stored counts: h (hourly) or D (daily)')
+    args = parser.parse_args(argv)
+
+    flow = NetFlow.from_store(args.source, frequency = args.frequency)
+    flow.save(args.out)
+    print('Wrote %d periods x %d stations to %s' % (flow.departures.shape[0], len(flow.stations), args.out))
+    print(flow.ranking(10).to_string(index = False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+############################# TRIP INGESTION ############################################
+#########################################################################################
+"""Streaming ingestion of the monthly Citi Bike trip files.
+
+Replaces the ``pd.concat`` over every file in ``Data/Original_data`` from
+"2.2 Sourcing Data with an API". Each CSV is read in fixed-size chunks; every
+chunk is typed, joined to the daily weather table (and to hourly observations
+as of each trip's start, when given; see ``citibike.weather``), given the
+cleaned labels, season and trip duration of "Data Wragling", stripped of the
+trips ``citibike.quality`` flags as invalid and appended to a Parquet dataset
+partitioned by ``year``/``month`` of the trip date, so peak memory is bounded
+by the chunk size rather than by the number of months ingested.
+
+Files are independent of each other, so ``--workers`` hands them to a process
+pool; each worker writes its own part files and the run is published with one
+atomic commit of the dataset manifest (see ``citibike.manifest``). Before
+that, a first pass over the station name columns gives every new station its
+key in the station table (see ``citibike.stations``), and the trips store only
+those keys.
+
+Runs are incremental: only files that are new or whose content changed since
+the last commit are parsed, and the prepared dashboard CSVs are rebuilt from
+per-file partial aggregates (see ``citibike.aggregates``) instead of from the
+whole trip history.
+
+Run from the project folder::
+
+    python -m citibike.ingest --weather Data/Prepared_data/nyc_weather_daily.csv --workers 8
+"""
+
+import argparse
+import contextlib
+import glob
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from citibike.aggregates import PARTIALS, build_outputs, combine_partials, partial_aggregates, write_partials
+from citibike.manifest import (MANIFEST_VERSION, collect_garbage, commit_manifest, empty_manifest, file_fingerprint,
+                               is_unchanged, read_manifest)
+from citibike.paths import ORIGINAL_DIR, PREPARED_DIR, TRIPS_DIR
+from citibike.quality import INVALID, clean_trips, flag_counts, quality_flags, trip_seconds
+from citibike.schema import INVALID_RIDE_ID, TRIP_ARROW_SCHEMA, TRIP_SCHEMA, apply_schema
+from citibike.stations import DIRECTIONS, StationTable, lookup_keys, scan_station_names
+from citibike.transform import member_labels, rideable_labels, season_of
+from citibike.weather import DAILY_CACHE_FILE, HOURLY_COLUMNS, HourlyWeather, cached_daily_weather, lookup_daily
+
+WEATHER_FILE = os.path.join(PREPARED_DIR, 'nyc_weather_daily.csv')
+DEFAULT_CHUNKSIZE = 250_000
+
+## Raw columns as published by Citi Bike, read straight into their TRIP_SCHEMA dtypes;
+## ride ids are read as text and packed afterwards, station ids mix numbers and text
+CSV_DTYPES = {column: TRIP_SCHEMA[column] for column in
+              ['rideable_type', 'start_station_name', 'start_station_id', 'end_station_name', 'end_station_id',
+               'start_lat', 'start_lng', 'end_lat', 'end_lng', 'member_casual']}
+CSV_DTYPES['ride_id'] = str
+
+
+############################## INPUTS ###################################################
+
+def list_trip_files(folderpath=ORIGINAL_DIR):
+    """Return the monthly trip CSVs in ``folderpath`` in a stable order."""
+    return sorted(glob.glob(os.path.join(folderpath, '*.csv')))
+
+
+def read_weather(path=WEATHER_FILE):
+    """Read the daily weather table (``date``, ``avgTemp``) as a date-indexed series."""
+    weather = pd.read_csv(path, parse_dates = ['date'])
+    weather['date'] = weather['date'].dt.normalize()
+    return weather.drop_duplicates('date').set_index('date')['avgTemp'].astype('float32')
+
+
+def read_trip_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Yield chunks of one trip CSV typed according to ``TRIP_SCHEMA``."""
+    reader = pd.read_csv(path, dtype = CSV_DTYPES, chunksize = chunksize, encoding = 'utf-8')
+    for chunk in reader:
+        yield apply_schema(chunk)
+
+
+############################## TRANSFORM ################################################
+
+def join_weather(chunk, weather, hourly=None):
+    """Attach the daily average temperature of each trip's start date and, with
+    ``hourly`` observations, the temperature and precipitation as of its start time.
+    """
+    chunk['date'] = chunk['started_at'].dt.normalize()
+    chunk['avgTemp'] = lookup_daily(chunk['date'], weather)
+    if hourly is not None:
+        for column, values in hourly.lookup(chunk['started_at']).items():
+            chunk[column] = values
+    else:
+        for column in HOURLY_COLUMNS:
+            chunk[column] = np.float32(np.nan)
+    return chunk
+
+
+def clean_chunk(chunk):
+    """Apply the "Data Wragling" labels and derived columns to one chunk in place."""
+    chunk['member_casual'] = member_labels(chunk['member_casual'])
+    chunk['rideable_type'] = rideable_labels(chunk['rideable_type'])
+    chunk['season'] = season_of(chunk['date'])
+    chunk['trip_duration'] = trip_seconds(chunk['started_at'], chunk['ended_at']).astype('int32')
+    return chunk
+
+
+############################## OUTPUT ###################################################
+
+def source_key(path):
+    """Name used to tag the part files derived from one source file."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def new_run_id():
+    """Short unique tag that keeps the parts of concurrent or failed runs apart."""
+    return uuid.uuid4().hex[:8]
+
+
+def partition_dir(dest, year, month):
+    return os.path.join(dest, 'year=%d' % year, 'month=%d' % month)
+
+
+def write_chunk(chunk, dest, prefix, chunk_number):
+    """Write one chunk to the dataset, split by the year/month of the trip date.
+
+    Returns the paths of the part files written, relative to ``dest``.
+    """
+    written = []
+    dates = chunk['date']
+    for (year, month), part in chunk.groupby([dates.dt.year, dates.dt.month], sort = True):
+        folder = partition_dir(dest, year, month)
+        os.makedirs(folder, exist_ok = True)
+        path = os.path.join(folder, 'part-%s-%05d.parquet' % (prefix, chunk_number))
+        table = pa.Table.from_pandas(part, schema = TRIP_ARROW_SCHEMA, preserve_index = False)
+        pq.write_table(table, path)
+        written.append(os.path.relpath(path, dest))
+    return written
+
+
+def attach_station_keys(chunk, station_keys):
+    """Add ``start_station_key`` and ``end_station_key`` from the name -> key dict ``station_keys``."""
+    for direction in DIRECTIONS:
+        chunk['%s_station_key' % direction] = lookup_keys(chunk['%s_station_name' % direction], station_keys)
+    return chunk
+
+
+def ingest_file(path, weather, dest=TRIPS_DIR, chunksize=DEFAULT_CHUNKSIZE, run_id=None, station_keys=None,
+                hourly=None):
+    """Stream one trip file into unpublished part files and partial aggregates.
+
+    ``station_keys`` maps every station name in the file to its key in the
+    station table. Nothing becomes visible to readers until the returned entry
+    is committed to the manifest. Returns the source key and its manifest entry.
+    """
+    if station_keys is None:
+        station_keys = StationTable.load(dest).keys
+    key = source_key(path)
+    prefix = '%s-%s' % (key, run_id or new_run_id())
+    entry = file_fingerprint(path)
+
+    rows = 0
+    invalid_ride_ids = 0
+    quality = None
+    dropped = 0
+    written = []
+    partials = []
+    for chunk_number, chunk in enumerate(read_trip_chunks(path, chunksize)):
+        ## Trips with a missing or malformed ride id are kept under INVALID_RIDE_ID and counted
+        invalid_ride_ids += int(np.count_nonzero(chunk['ride_id'].to_numpy() == INVALID_RIDE_ID))
+        chunk = attach_station_keys(clean_chunk(join_weather(chunk, weather, hourly)), station_keys)
+        ## Trips without times, with negative durations or without a station or weather are
+        ## counted and dropped in one selection; duration outliers are kept for the notebooks
+        flags = quality_flags(chunk)
+        quality = flag_counts(flags) if quality is None else quality + flag_counts(flags)
+        dropped += int(np.count_nonzero(flags & INVALID))
+        chunk = clean_trips(chunk, flags, INVALID)
+        partials.append(partial_aggregates(chunk))
+        chunk = chunk.loc[:, list(TRIP_ARROW_SCHEMA.names)]
+        written += write_chunk(chunk, dest, prefix, chunk_number)
+        rows += len(chunk)
+
+    entry.update({'path': os.path.abspath(path),
+                  'rows': rows,
+                  'invalid_ride_ids': invalid_ride_ids,
+                  'dropped': dropped,
+                  'quality': {} if quality is None else {flag: int(trips) for flag, trips in quality.items()},
+                  'parts': written,
+                  'aggregates': write_partials(combine_partials(partials), dest, prefix)})
+    return key, entry
+
+
+def plan_ingest(filepaths, manifest):
+    """Split ``filepaths`` into the files that need ingesting and the unchanged ones."""
+    pending = []
+    for path in filepaths:
+        entry = manifest['sources'].get(source_key(path))
+        ## Sources ingested before a partial aggregate or the quality flags were added are ingested again
+        if (not is_unchanged(entry, path) or set(PARTIALS) - set(entry.get('aggregates', {}))
+                or 'quality' not in entry):
+            pending.append(path)
+    return pending
+
+
+def _summary(path, entry):
+    summary = '%s: %d rows' % (os.path.basename(path), entry['rows'])
+    if entry.get('dropped'):
+        summary += ', %d invalid dropped' % entry['dropped']
+    if entry.get('invalid_ride_ids'):
+        summary += ', %d with an invalid ride_id' % entry['invalid_ride_ids']
+    return summary
+
+
+def ingest(filepaths, weather, dest=TRIPS_DIR, chunksize=DEFAULT_CHUNKSIZE, workers=1,
+           full=False, folderpath=PREPARED_DIR, hourly=None):
+    """Ingest the new or changed files in ``filepaths`` and publish them with one manifest commit.
+
+    Files whose size, mtime or content hash match the manifest are skipped
+    unless ``full`` is set or the ``hourly`` observations differ from the
+    last run's. With ``workers`` above one every file is parsed, joined and
+    written by its own worker process. Trip files that no longer
+    exist are dropped, and the prepared dashboard CSVs in ``folderpath`` are
+    rebuilt from the stored partial aggregates whenever anything changed.
+    Returns the number of rows ingested.
+    """
+    manifest = read_manifest(dest)
+    if manifest.get('version') != MANIFEST_VERSION:
+        ## Parts written in an older layout cannot be read alongside new ones
+        print('Trip store layout changed, ingesting every file again')
+        manifest, full = empty_manifest(), True
+    ## Parts joined to other hourly observations (or to none) would not match the new ones
+    hourly_digest = hourly.digest if hourly is not None else None
+    if not full and manifest['sources'] and manifest.get('hourly_weather') != hourly_digest:
+        print('Hourly weather changed since the last run, ingesting every file again')
+        full = True
+    pending = list(filepaths) if full else plan_ingest(filepaths, manifest)
+    removed = [key for key, entry in manifest['sources'].items()
+               if 'sha256' in entry and not os.path.exists(entry['path'])]
+    print('%d of %d files to ingest' % (len(pending), len(filepaths)))
+
+    run_id = new_run_id()
+    entries = {}
+    pool = ProcessPoolExecutor(max_workers = workers) if workers > 1 and len(pending) > 1 else None
+    with pool or contextlib.nullcontext():
+        ## First pass: key every new station before any trips are written
+        scanned = pool.map(scan_station_names, pending) if pool else map(scan_station_names, pending)
+        known = StationTable.load(dest)
+        stations = known.add_names(set().union(*scanned))
+        ## Nothing to write when no file is pending or none names a new station
+        if stations is not known:
+            stations.save(dest)
+        station_keys = stations.keys
+
+        if pool:
+            futures = {pool.submit(ingest_file, path, weather, dest, chunksize, run_id, station_keys, hourly): path
+                       for path in pending}
+            for future in as_completed(futures):
+                key, entry = future.result()
+                entries[key] = entry
+                print(_summary(futures[future], entry))
+        else:
+            for path in pending:
+                key, entry = ingest_file(path, weather, dest, chunksize, run_id, station_keys, hourly)
+                entries[key] = entry
+                print(_summary(path, entry))
+
+    for key in removed:
+        del manifest['sources'][key]
+    manifest['sources'].update(entries)
+    manifest['hourly_weather'] = hourly_digest
+    ## Commit even when nothing was ingested so refreshed mtimes are remembered
+    commit_manifest(dest, manifest)
+    collect_garbage(dest, manifest)
+
+    if entries or removed:
+        build_outputs(dest, manifest, folderpath)
+    return sum(entry['rows'] for entry in entries.values())
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Stream the monthly trip files into a partitioned Parquet dataset.')
+    parser.add_argument('--source', default = ORIGINAL_DIR, help = 'folder with the monthly trip CSVs')
+    parser.add_argument('--weather', default = WEATHER_FILE, help = 'daily weather CSV with date and avgTemp columns')
+    parser.add_argument('--weather-station', default = None,
+                        help = 'read the daily weather of this station from the weather cache instead '
+                               '(fill it with citibike.weather)')
+    parser.add_argument('--weather-cache', default = DAILY_CACHE_FILE, help = 'weather cache read with --weather-station')
+    parser.add_argument('--hourly-weather', default = None,
+                        help = 'hourly weather CSV (time, hourlyTemp, hourlyPrcp) joined at each trip start; '
+                               'every file is ingested again when it changes or is left out')
+    parser.add_argument('--dest', default = TRIPS_DIR, help = 'output dataset folder')
+    parser.add_argument('--chunksize', type = int, default = DEFAULT_CHUNKSIZE, help = 'rows per chunk')
+    parser.add_argument('--workers', type = int, default = 1,
+                        help = 'number of files ingested in parallel, one process per file')
+    parser.add_argument('--full', action = 'store_true', help = 're-ingest every file, changed or not')
+    parser.add_argument('--prepared', default = PREPARED_DIR, help = 'folder for the prepared dashboard CSVs')
+    args = parser.parse_args(argv)
+
+    filepaths = list_trip_files(args.source)
+    if not filepaths:
+        parser.error('no trip CSVs found in %s' % args.source)
+
+    if args.weather_station:
+        weather = cached_daily_weather(args.weather_station, path = args.weather_cache)
+        if not len(weather):
+            parser.error('no cached weather for %s, run citibike.weather first' % args.weather_station)
+    else:
+        weather = read_weather(args.weather)
+    hourly = HourlyWeather.read_csv(args.hourly_weather) if args.hourly_weather else None
+    total = ingest(filepaths, weather, args.dest, args.chunksize, args.workers,
+                   args.full, args.prepared, hourly)
+    print('Ingested %d rows into %s' % (total, args.dest))
+
+
+if __name__ == '__main__':
+    main()
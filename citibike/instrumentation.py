@@ -0,0 +1,379 @@
+############################# DASHBOARD INSTRUMENTATION #################################
+#########################################################################################
+"""Timing spans, rerun counts and memory of the dashboard, cheap enough to leave on.
+
+``page_run`` wraps one rerun of a dashboard page and ``span`` the steps inside
+it (loading data, filtering, building and sending figures). A span costs two
+``perf_counter`` calls and a dict update under a lock, so the instrumentation
+stays on in production. Every (page, span) keeps a count, total, maximum and a
+fixed-bucket histogram of its durations; every run also counts the reruns of
+its session and samples the process RSS.
+
+Where the numbers go is set by environment variables read by ``configure``:
+
+- ``CITIBIKE_METRICS_LOG``: file receiving one JSON line per page run, with
+  its spans, rerun number and RSS;
+- ``CITIBIKE_METRICS_PORT``: serve ``/metrics`` (Prometheus text format) and
+  ``/metrics.json`` on 127.0.0.1 at this port;
+- ``CITIBIKE_PROFILE=1``: profile every run with ``cProfile``. With
+  ``CITIBIKE_PROFILE=allow`` a single session can ask for it instead by
+  opening the dashboard with ``?profile=1``; otherwise that parameter is
+  ignored. Profiles are written to ``profiles/``, of which the newest
+  ``MAX_PROFILES`` are kept, and their top functions logged.
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import pstats
+import re
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from citibike.paths import PROJECT_DIR
+
+LOG_ENV = 'CITIBIKE_METRICS_LOG'
+PORT_ENV = 'CITIBIKE_METRICS_PORT'
+PROFILE_ENV = 'CITIBIKE_PROFILE'
+PROFILE_DIR = os.path.join(PROJECT_DIR, 'profiles')
+## CITIBIKE_PROFILE values: profile every run, or only the sessions asking for it
+PROFILE_ALL = '1'
+PROFILE_ALLOW = 'allow'
+
+## Upper bounds of the duration histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+## Sessions whose rerun counts are remembered, least recently seen dropped first
+MAX_SESSIONS = 10_000
+PROFILE_LINES = 25
+## Profile files kept in PROFILE_DIR, oldest removed first
+MAX_PROFILES = 50
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_profile_numbers = itertools.count()
+
+
+def current_rss():
+    """Resident set size of this process in bytes; the peak where the current size is unknown."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        ## ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if peak > 2**32 else peak * 1024
+
+
+############################## METRICS ##################################################
+
+class _Timing:
+    """Count, total, maximum and bucketed histogram of one span's durations."""
+
+    __slots__ = ['count', 'total', 'max', 'buckets']
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        ## A handful of comparisons; cheaper than bisect's call for 14 buckets
+        for i, bound in enumerate(BUCKETS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def quantile(self, q):
+        """The ``q`` quantile, interpolated within its bucket and capped at the maximum."""
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            if count and seen + count >= rank:
+                upper = min(bound, self.max)
+                return round(lower + (upper - lower) * (rank - seen) / count, 3)
+            seen += count
+            lower = bound
+        return round(self.max, 3)
+
+    def to_dict(self):
+        return {'count': self.count, 'total_ms': round(self.total, 3), 'max_ms': round(self.max, 3),
+                'p50_ms': self.quantile(0.5), 'p95_ms': self.quantile(0.95), 'p99_ms': self.quantile(0.99)}
+
+
+class Metrics:
+    """Process-wide span timings, page runs and per-session rerun counts."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.timings = {}
+        self.sessions = collections.OrderedDict()
+        self.reruns = 0
+        self.rss = current_rss()
+        self.peak_rss = self.rss
+        self._lock = threading.Lock()
+
+    def record(self, page, name, ms):
+        with self._lock:
+            timing = self.timings.get((page, name))
+            if timing is None:
+                timing = self.timings[(page, name)] = _Timing()
+            timing.add(ms)
+
+    def merge(self, timings):
+        """Add the span ``timings`` of another ``Metrics``, for example one from another process."""
+        with self._lock:
+            for key, other in timings.items():
+                timing = self.timings.get(key)
+                if timing is None:
+                    timing = self.timings[key] = _Timing()
+                timing.merge(other)
+
+    def rerun(self, session):
+        """Count one more run of ``session`` and return its number."""
+        with self._lock:
+            reruns = self.sessions.pop(session, 0) + 1
+            self.sessions[session] = reruns
+            self.reruns += 1
+            if len(self.sessions) > MAX_SESSIONS:
+                self.sessions.popitem(last = False)
+            return reruns
+
+    def sample_rss(self):
+        rss = current_rss()
+        with self._lock:
+            self.rss = rss
+            self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def snapshot(self):
+        with self._lock:
+            return {'uptime_s': round(time.time() - self.started, 1),
+                    'rss_bytes': self.rss,
+                    'peak_rss_bytes': self.peak_rss,
+                    'sessions': len(self.sessions),
+                    'reruns': self.reruns,
+                    'spans': [dict(page = page, span = name, **timing.to_dict())
+                              for (page, name), timing in sorted(self.timings.items())]}
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = ['# TYPE citibike_span_seconds histogram']
+        with self._lock:
+            for (page, name), timing in sorted(self.timings.items()):
+                labels = 'page="%s",span="%s"' % (_escape(page), _escape(name))
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS, timing.buckets):
+                    cumulative += count
+                    le = '+Inf' if bound == math.inf else repr(bound / 1000)
+                    lines.append('citibike_span_seconds_bucket{%s,le="%s"} %d' % (labels, le, cumulative))
+                lines.append('citibike_span_seconds_sum{%s} %r' % (labels, timing.total / 1000))
+                lines.append('citibike_span_seconds_count{%s} %d' % (labels, timing.count))
+            lines += ['# TYPE citibike_sessions gauge', 'citibike_sessions %d' % len(self.sessions),
+                      '# TYPE citibike_reruns_total counter', 'citibike_reruns_total %d' % self.reruns,
+                      '# TYPE citibike_rss_bytes gauge', 'citibike_rss_bytes %d' % self.rss,
+                      '# TYPE citibike_peak_rss_bytes gauge', 'citibike_peak_rss_bytes %d' % self.peak_rss]
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self._lock:
+            self.timings.clear()
+            self.sessions.clear()
+            self.reruns = 0
+
+
+def _escape(label):
+    return str(label).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = Metrics()
+
+
+############################## SPANS ####################################################
+
+class PageRun:
+    """One rerun of a page: its session, rerun number and the spans timed inside it."""
+
+    def __init__(self, page, session, reruns):
+        self.page = page
+        self.session = session
+        self.reruns = reruns
+        self.spans = []
+        self.stack = []
+
+    def totals(self):
+        """Milliseconds per span path; a span entered several times is summed."""
+        totals = {}
+        for path, ms in self.spans:
+            totals[path] = totals.get(path, 0.0) + ms
+        return {path: round(ms, 3) for path, ms in totals.items()}
+
+
+@contextlib.contextmanager
+def span(name):
+    """Time the block as ``name``, nested under the enclosing spans of the current page run.
+
+    Outside a page run the block is timed under the page ``-``, so library code
+    can be instrumented whether or not the dashboard runs it.
+    """
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.stack.append(name)
+    path = '/'.join(run.stack) if run is not None else name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        if run is not None:
+            run.stack.pop()
+            run.spans.append((path, ms))
+        metrics.record(run.page if run is not None else '-', path, ms)
+
+
+@contextlib.contextmanager
+def page_run(page, session=None, profile=False):
+    """Time one rerun of ``page`` for ``session`` and report it to the configured sinks.
+
+    The run is also profiled with ``CITIBIKE_PROFILE=1``, or when the session
+    asks for it with ``profile`` and ``CITIBIKE_PROFILE=allow``.
+    """
+    run = PageRun(page, session, metrics.rerun(session))
+    _local.run = run
+    mode = os.environ.get(PROFILE_ENV)
+    profiling = mode == PROFILE_ALL or (profile and mode == PROFILE_ALLOW)
+    profiler = _start_profiler() if profiling else None
+    rss_before = current_rss()
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        _local.run = None
+        profile_path = _stop_profiler(profiler, page) if profiler is not None else None
+        rss = metrics.sample_rss()
+        metrics.record(page, 'run', ms)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'time': round(time.time(), 3), 'page': page, 'session': session,
+                                    'rerun': run.reruns, 'ms': round(ms, 3),
+                                    'spans': run.totals(),
+                                    'rss_bytes': rss, 'rss_delta_bytes': rss - rss_before,
+                                    'profile': profile_path}))
+
+
+############################## PROFILER #################################################
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        ## Another profiler (or a concurrent session's) already holds the hook
+        return None
+    return profiler
+
+
+def _stop_profiler(profiler, page):
+    """Write the run's profile to ``PROFILE_DIR`` and log its most expensive calls."""
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok = True)
+    slug = re.sub(r'[^a-z0-9]+', '_', page.lower()).strip('_')
+    path = os.path.join(PROFILE_DIR, '%s-%s-%d-%d.prof' % (slug, time.strftime('%Y%m%d-%H%M%S'), os.getpid(),
+                                                            next(_profile_numbers)))
+    profiler.dump_stats(path)
+    _prune_profiles()
+    report = io.StringIO()
+    pstats.Stats(profiler, stream = report).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    logger.warning('profile of %s written to %s\n%s', page, path, report.getvalue())
+    return path
+
+
+def _prune_profiles():
+    """Remove all but the newest ``MAX_PROFILES`` profile files."""
+    paths = [os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith('.prof')]
+    paths.sort(key = lambda path: os.stat(path).st_mtime_ns, reverse = True)
+    for path in paths[MAX_PROFILES:]:
+        try:
+            os.remove(path)
+        except OSError:
+            ## Another session pruned it first
+            pass
+
+
+############################## SINKS ####################################################
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body, content_type = metrics.prometheus(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(metrics.snapshot()), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def serve_metrics(port, host='127.0.0.1'):
+    """Serve the metrics from a daemon thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target = server.serve_forever, name = 'citibike-metrics', daemon = True).start()
+    return server
+
+
+def configure(log_path=None, port=None):
+    """Attach the log sink and start the metrics endpoint, once per process.
+
+    Both default to the ``CITIBIKE_METRICS_LOG`` and ``CITIBIKE_METRICS_PORT``
+    environment variables; without either, the metrics are only kept in memory.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+        log_path = log_path or os.environ.get(LOG_ENV)
+        port = port or os.environ.get(PORT_ENV)
+        if log_path:
+            handler = logging.FileHandler(log_path, encoding = 'utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        if port:
+            try:
+                serve_metrics(int(port))
+            except OSError as error:
+                ## Another dashboard process on this machine already serves the port
+                logger.warning('metrics endpoint not started on port %s: %s', port, error)
@@ -0,0 +1,199 @@
+############################# KEPLER ROUTE MAP ##########################################
+#########################################################################################
+"""Kepler.gl route map served as a small page plus a cached, compressed data file.
+
+The "Map of Aggregated Bike Trips" page used to read Citi_Bike_Trips2.html, a
+Kepler export with the whole trip dataset inlined as JSON, from disk on every
+rerun and push all of it through ``components.html`` to every session.
+``KeplerMap`` keeps the data and the page apart:
+
+- the route flows written by ``citibike.od_matrix`` are encoded once per
+  process as an Arrow IPC stream (dictionary-encoded station names, float32
+  coordinates) and gzipped, then published under ``static/kepler/`` with the
+  content hash in the file name. Streamlit's static file serving
+  (``server.enableStaticServing``) answers repeat requests with a 304 through
+  the ETag, and a changed file gets a new URL;
+- the page sent through the websocket is a few kilobytes of HTML holding the
+  map config (config2.json) and the payload URL. The browser fetches the
+  payload, decompresses it with ``DecompressionStream`` and decodes it with
+  Arrow JS before handing it to Kepler.
+
+Set ``MAPBOX_API_KEY`` for the base map tiles; the routes render without it.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from string import Template
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from citibike.data_store import load_derived
+from citibike.od_matrix import OD_FLOWS_FILE
+from citibike.paths import PROJECT_DIR
+
+KEPLER_CONFIG = os.path.join(PROJECT_DIR, 'config2.json')
+## Streamlit serves <script folder>/static at /app/static when static serving is enabled
+STATIC_DIR = os.path.join(PROJECT_DIR, 'static')
+PAYLOAD_DIRNAME = 'kepler'
+PAYLOAD_PREFIX = 'od_flows.'
+PAYLOAD_SUFFIX = '.arrow.gz'
+
+KEPLER_VERSION = '2.5.5'
+
+_PAGE = Template('''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="UTF-8"/>
+<script src="https://unpkg.com/react@16.8.4/umd/react.production.min.js"></script>
+<script src="https://unpkg.com/react-dom@16.8.4/umd/react-dom.production.min.js"></script>
+<script src="https://unpkg.com/redux@3.7.2/dist/redux.js"></script>
+<script src="https://unpkg.com/react-redux@7.1.3/dist/react-redux.min.js"></script>
+<script src="https://unpkg.com/styled-components@4.1.3/dist/styled-components.min.js"></script>
+<script src="https://unpkg.com/kepler.gl@$kepler_version/umd/keplergl.min.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/apache-arrow@14.0.2/Arrow.es2015.min.js"></script>
+<link href="https://api.tiles.mapbox.com/mapbox-gl-js/v1.1.1/mapbox-gl.css" rel="stylesheet">
+<style>body {margin: 0; padding: 0; overflow: hidden;}</style>
+</head>
+<body>
+<div id="app"></div>
+<script>
+  const PAYLOAD_URL = $payload_url;
+  const DATA_ID = $data_id;
+  const CONFIG = $config;
+  const MAPBOX_TOKEN = $mapbox_token;
+
+  const reducers = Redux.combineReducers({
+    keplerGl: KeplerGl.keplerGlReducer.initialState({uiState: {readOnly: false, currentModal: null}})
+  });
+  const store = Redux.createStore(reducers, {}, Redux.applyMiddleware(...KeplerGl.enhanceReduxMiddleware([])));
+
+  function App() {
+    return React.createElement(KeplerGl.KeplerGl, {
+      mapboxApiAccessToken: MAPBOX_TOKEN, id: 'map', width: window.innerWidth, height: window.innerHeight
+    });
+  }
+  ReactDOM.render(React.createElement(ReactRedux.Provider, {store: store}, React.createElement(App)),
+                  document.getElementById('app'));
+
+  async function loadFlows() {
+    const response = await fetch(PAYLOAD_URL);
+    const stream = response.body.pipeThrough(new DecompressionStream('gzip'));
+    const table = Arrow.tableFromIPC(new Uint8Array(await new Response(stream).arrayBuffer()));
+    const names = table.schema.fields.map(field => field.name);
+    const columns = names.map(name => Array.from(table.getChild(name)));
+    const rows = [];
+    for (let i = 0; i < table.numRows; i++) {
+      const row = {};
+      names.forEach((name, j) => { row[name] = columns[j][i]; });
+      rows.push(row);
+    }
+    store.dispatch(KeplerGl.addDataToMap({
+      datasets: {info: {id: DATA_ID, label: 'trips'}, data: KeplerGl.processRowObject(rows)},
+      config: KeplerGl.KeplerGlSchema.parseSavedConfig(CONFIG),
+      options: {centerMap: false}
+    }));
+  }
+  loadFlows();
+</script>
+</body>
+</html>
+''')
+
+
+############################## PAYLOAD ##################################################
+
+def flows_table(flows):
+    """The route flows as a compact Arrow table: dictionary names, int32 trips, float32 coordinates."""
+    columns = {}
+    for column in flows.columns:
+        values = flows[column]
+        if column.endswith('_name'):
+            ## Plain utf8 values: Arrow JS reads them in every version, unlike large_string
+            columns[column] = pa.array(values.astype(str), type = pa.string()).dictionary_encode()
+        elif column == 'trips':
+            columns[column] = pa.array(values.to_numpy(dtype = np.int32))
+        else:
+            columns[column] = pa.array(values.to_numpy(dtype = np.float32))
+    return pa.table(columns)
+
+
+def encode_payload(table):
+    """Gzipped Arrow IPC stream of ``table``; identical tables give identical bytes."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return gzip.compress(sink.getvalue().to_pybytes(), compresslevel = 9, mtime = 0)
+
+
+############################## KEPLER MAP ###############################################
+
+class KeplerMap:
+    """A compressed route payload, its content hash and the Kepler config that draws it."""
+
+    def __init__(self, payload, config):
+        self.payload = payload
+        self.config = config
+        self.digest = hashlib.sha256(payload).hexdigest()[:16]
+        ## The dataset id the layers of the saved config refer to
+        layers = config['config']['visState']['layers']
+        self.data_id = layers[0]['config']['dataId'] if layers else 'data_1'
+        self._pages = {}
+
+    @classmethod
+    def from_flows(cls, flows, config):
+        return cls(encode_payload(flows_table(flows)), config)
+
+    @property
+    def filename(self):
+        return PAYLOAD_PREFIX + self.digest + PAYLOAD_SUFFIX
+
+    def publish(self, static_dir=STATIC_DIR):
+        """Write the payload under its content hash and remove payloads of older data."""
+        folder = os.path.join(static_dir, PAYLOAD_DIRNAME)
+        os.makedirs(folder, exist_ok = True)
+        path = os.path.join(folder, self.filename)
+        if not os.path.exists(path):
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                f.write(self.payload)
+            os.replace(tmp_path, path)
+        for name in os.listdir(folder):
+            if name.startswith(PAYLOAD_PREFIX) and name.endswith(PAYLOAD_SUFFIX) and name != self.filename:
+                os.remove(os.path.join(folder, name))
+        return path
+
+    def url(self, base_url_path=''):
+        """Path the Streamlit server publishes the payload at."""
+        base = base_url_path.strip('/')
+        return '/'.join([''] + ([base] if base else []) + ['app', 'static', PAYLOAD_DIRNAME, self.filename])
+
+    def html(self, url, mapbox_token=None):
+        """The map page, built once per payload URL."""
+        if mapbox_token is None:
+            mapbox_token = os.environ.get('MAPBOX_API_KEY', '')
+        key = (url, mapbox_token)
+        if key not in self._pages:
+            self._pages[key] = _PAGE.substitute(kepler_version = KEPLER_VERSION,
+                                                payload_url = json.dumps(url),
+                                                data_id = json.dumps(self.data_id),
+                                                config = json.dumps(self.config),
+                                                mapbox_token = json.dumps(mapbox_token))
+        return self._pages[key]
+
+
+def load_kepler_map(folderpath=None, config_path=KEPLER_CONFIG, static_dir=STATIC_DIR):
+    """Process-wide ``KeplerMap`` of DB_od_flows.csv, encoded and published when the file changes."""
+    path = OD_FLOWS_FILE if folderpath is None else os.path.join(folderpath, os.path.basename(OD_FLOWS_FILE))
+
+    def build():
+        with open(config_path, 'r', encoding = 'utf-8') as f:
+            config = json.load(f)
+        kepler_map = KeplerMap.from_flows(pd.read_csv(path), config)
+        kepler_map.publish(static_dir)
+        return kepler_map
+    return load_derived(('kepler_map', os.path.abspath(path), os.path.abspath(static_dir)),
+                        [path, config_path], build)
@@ -0,0 +1,115 @@
+############################# DATASET MANIFEST ##########################################
+#########################################################################################
+"""Manifest of the part files that make up the trip dataset.
+
+Ingestion writes part files under run-specific names and only publishes them by
+replacing ``_manifest.json`` in a single ``os.replace``. Readers list the parts
+from the manifest, so a crashed or in-progress run is never visible, and part
+files that no manifest references are removed by ``collect_garbage``.
+
+Every source entry also records the size, mtime and content hash of the file it
+was ingested from, which lets a re-run skip the files that have not changed.
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+from citibike.aggregates import AGGREGATES_DIRNAME
+
+MANIFEST_NAME = '_manifest.json'
+## Version 2: trips store station keys instead of station names, ids and coordinates
+## Version 3: trips carry the hourly weather at their start time
+MANIFEST_VERSION = 3
+
+
+def manifest_path(dest):
+    return os.path.join(dest, MANIFEST_NAME)
+
+
+def empty_manifest():
+    return {'version': MANIFEST_VERSION, 'sources': {}}
+
+
+def read_manifest(dest):
+    """Return the committed manifest of ``dest``, or an empty one."""
+    path = manifest_path(dest)
+    if not os.path.exists(path):
+        return empty_manifest()
+    with open(path, 'r', encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def commit_manifest(dest, manifest):
+    """Atomically replace the manifest of ``dest``."""
+    os.makedirs(dest, exist_ok = True)
+    path = manifest_path(dest)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding = 'utf-8') as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """Size, mtime and SHA-256 of a source file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def is_unchanged(entry, path):
+    """Whether ``path`` still matches the fingerprint recorded in ``entry``.
+
+    Size and mtime are checked first; the content hash is only computed when
+    they differ, so a touched but identical file is not ingested again. The
+    entry's mtime is refreshed in that case.
+    """
+    if entry is None or 'sha256' not in entry:
+        return False
+    stat = os.stat(path)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime_ns == entry['mtime_ns']:
+        return True
+    if file_fingerprint(path)['sha256'] != entry['sha256']:
+        return False
+    entry['mtime_ns'] = stat.st_mtime_ns
+    return True
+
+
+def manifest_parts(dest, manifest=None):
+    """Absolute paths of every part file published in the manifest."""
+    if manifest is None:
+        manifest = read_manifest(dest)
+    return [os.path.join(dest, part)
+            for source in manifest['sources'].values()
+            for part in source['parts']]
+
+
+def manifest_files(dest, manifest=None):
+    """Every file the manifest references: trip parts and stored partial aggregates."""
+    if manifest is None:
+        manifest = read_manifest(dest)
+    files = manifest_parts(dest, manifest)
+    for source in manifest['sources'].values():
+        files += [os.path.join(dest, path) for path in source.get('aggregates', {}).values()]
+    return files
+
+
+def collect_garbage(dest, manifest=None):
+    """Delete part and aggregate files that the committed manifest does not reference."""
+    live = set(manifest_files(dest, manifest))
+    candidates = glob.glob(os.path.join(dest, 'year=*', 'month=*', 'part-*.parquet'))
+    candidates += glob.glob(os.path.join(dest, AGGREGATES_DIRNAME, '*.parquet'))
+    removed = 0
+    for path in candidates:
+        if path not in live:
+            os.remove(path)
+            removed += 1
+    return removed
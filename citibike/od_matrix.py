@@ -0,0 +1,155 @@
+############################# ORIGIN-DESTINATION FLOWS ##################################
+#########################################################################################
+"""Trip counts between station pairs for the Kepler.gl route map.
+
+"2.5 Geospatial Plotting" groups the full trip table by start and end station
+name, takes median coordinates per route pair in a second groupby and merges
+the two, and its "-Copy1" drops 92% of the routes at random so Kepler can draw
+them. ``ODMatrix`` counts the routes as a sparse matrix over integer station
+keys in one streaming pass over the trip store, takes the coordinates of each
+station once from the station table (see ``citibike.stations``) and prunes
+deterministically to the heaviest flows.
+
+Write the flows Kepler loads with::
+
+    python -m citibike.od_matrix --top 5000
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from citibike.ingest import TRIPS_DIR
+from citibike.paths import PREPARED_DIR
+from citibike.stations import KEY_COLUMNS, StationTable, station_codes, weighted_medians
+from citibike.trip_store import trip_dataset
+
+OD_FLOWS_FILE = os.path.join(PREPARED_DIR, 'DB_od_flows.csv')
+OD_COLUMNS = ['start_station_name', 'end_station_name', 'start_lat', 'start_lng', 'end_lat', 'end_lng']
+
+_LOW_BITS = np.int64(2**32)
+
+
+############################## ROUTE COUNTS #############################################
+
+def route_counts(origin, destination):
+    """Trips per (origin, destination) code pair as sorted packed keys and counts; -1 codes are dropped."""
+    routed = (origin >= 0) & (destination >= 0)
+    keys, counts = np.unique(origin[routed].astype(np.int64) * _LOW_BITS + destination[routed], return_counts = True)
+    return keys, counts.astype(np.int64)
+
+
+def merge_route_counts(parts):
+    """Sum a list of ``route_counts`` results into one."""
+    if not parts:
+        return np.array([], dtype = np.int64), np.array([], dtype = np.int64)
+    keys, inverse = np.unique(np.concatenate([part[0] for part in parts]), return_inverse = True)
+    counts = np.bincount(inverse.ravel(), weights = np.concatenate([part[1] for part in parts]))
+    return keys, counts.astype(np.int64)
+
+
+############################## OD MATRIX ################################################
+
+class ODMatrix:
+    """Sparse (origin, destination) trip counts over integer station codes.
+
+    Routes are kept in coordinate format, heaviest first, with the station
+    names and median coordinates indexed by code.
+    """
+
+    def __init__(self, stations, lat, lng, origin, destination, trips):
+        self.stations = stations
+        self.lat = np.asarray(lat, dtype = np.float64)
+        self.lng = np.asarray(lng, dtype = np.float64)
+        ## Heaviest routes first; ties by code so pruning is deterministic
+        order = np.lexsort((destination, origin, -np.asarray(trips)))
+        self.origin = np.asarray(origin, dtype = np.int32)[order]
+        self.destination = np.asarray(destination, dtype = np.int32)[order]
+        self.trips = np.asarray(trips, dtype = np.int64)[order]
+
+    @classmethod
+    def from_counts(cls, stations, lat, lng, counts):
+        keys, trips = counts
+        return cls(stations, lat, lng, keys // _LOW_BITS, keys % _LOW_BITS, trips)
+
+    @classmethod
+    def from_trips(cls, trips):
+        """Build from a frame of trips with the ``OD_COLUMNS`` columns."""
+        stations = {}
+        origin = station_codes(trips['start_station_name'], stations)
+        destination = station_codes(trips['end_station_name'], stations)
+        codes = np.concatenate([origin, destination])
+        coordinates = []
+        for axis in ['lat', 'lng']:
+            values = np.concatenate([trips['start_%s' % axis].to_numpy(dtype = np.float64),
+                                     trips['end_%s' % axis].to_numpy(dtype = np.float64)])
+            valid = (codes >= 0) & np.isfinite(values)
+            coordinates.append(weighted_medians(codes[valid], values[valid], np.ones(valid.sum()), len(stations)))
+        return cls.from_counts(pd.Index(list(stations), dtype = object), coordinates[0], coordinates[1],
+                               route_counts(origin, destination))
+
+    @classmethod
+    def from_store(cls, root=TRIPS_DIR, batch_size=1_000_000):
+        """Build in one pass over the station keys of the trip store.
+
+        Station names and median coordinates come from the store's station table.
+        """
+        parts = []
+        for batch in trip_dataset(root).to_batches(columns = KEY_COLUMNS, batch_size = batch_size):
+            if batch.num_rows:
+                parts.append(route_counts(*[batch.column(column).to_numpy(zero_copy_only = False)
+                                            for column in KEY_COLUMNS]))
+        table = StationTable.load(root).frame
+        return cls.from_counts(pd.Index(table['station_name'], dtype = object),
+                               table['lat'].to_numpy(), table['lng'].to_numpy(), merge_route_counts(parts))
+
+    def __len__(self):
+        return len(self.trips)
+
+    def prune(self, top=None, min_trips=None, loops=True):
+        """Keep the ``top`` heaviest routes with at least ``min_trips`` trips.
+
+        ``loops=False`` also drops trips that return to their start station.
+        """
+        keep = np.ones(len(self.trips), dtype = bool)
+        if min_trips is not None:
+            keep &= self.trips >= min_trips
+        if not loops:
+            keep &= self.origin != self.destination
+        kept = np.flatnonzero(keep)[:top]
+        return ODMatrix(self.stations, self.lat, self.lng,
+                        self.origin[kept], self.destination[kept], self.trips[kept])
+
+    def to_frame(self):
+        """The routes in the layout of the notebook's Kepler dataset."""
+        return pd.DataFrame({'start_station_name': self.stations.take(self.origin),
+                             'end_station_name': self.stations.take(self.destination),
+                             'trips': self.trips,
+                             'start_lat': self.lat[self.origin],
+                             'start_lng': self.lng[self.origin],
+                             'end_lat': self.lat[self.destination],
+                             'end_lng': self.lng[self.destination]})
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Write the heaviest station-to-station flows for the Kepler map.')
+    parser.add_argument('--source', default = TRIPS_DIR, help = 'trip store folder written by citibike.ingest')
+    parser.add_argument('--out', default = OD_FLOWS_FILE, help = 'CSV to write')
+    parser.add_argument('--top', type = int, default = None, help = 'keep only the heaviest routes')
+    parser.add_argument('--min-trips', type = int, default = None, help = 'keep routes with at least this many trips')
+    parser.add_argument('--no-loops', action = 'store_true', help = 'drop trips that end where they started')
+    args = parser.parse_args(argv)
+
+    matrix = ODMatrix.from_store(args.source)
+    flows = matrix.prune(args.top, args.min_trips, loops = not args.no_loops)
+    flows.to_frame().to_csv(args.out, index = False)
+    print('Wrote %d of %d routes (%s of %s trips) to %s'
+          % (len(flows), len(matrix), format(int(flows.trips.sum()), ','), format(int(matrix.trips.sum()), ','), args.out))
+
+
+if __name__ == '__main__':
+    main()
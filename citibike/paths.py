@@ -0,0 +1,14 @@
+############################# PROJECT PATHS #############################################
+#########################################################################################
+
+import os
+
+## Resolve everything from the project root so the dashboard, the notebooks and the
+## command line tools agree on where the data lives regardless of the working directory
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATA_DIR = os.path.join(PROJECT_DIR, 'Data')
+ORIGINAL_DIR = os.path.join(DATA_DIR, 'Original_data')
+PREPARED_DIR = os.path.join(DATA_DIR, 'Prepared_data')
+VISUALIZATIONS_DIR = os.path.join(PROJECT_DIR, 'Visualizations')
+TRIPS_DIR = os.path.join(PREPARED_DIR, 'trips')
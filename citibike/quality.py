@@ -0,0 +1,217 @@
+############################# TRIP QUALITY ##############################################
+#########################################################################################
+"""Exact trip durations, duration fences and invalid-row flags in one pass.
+
+"Data Wragling" takes ``(ended_at - started_at).dt.seconds``, which drops the
+days of any trip longer than 24 hours, then finds outliers with two separate
+``quantile`` passes over the whole table, a boolean mask and extra copies of
+the frame. Here:
+
+- ``trip_seconds`` gives the exact total seconds of every trip;
+- ``duration_fences`` takes the IQR fences per (member_casual, season) from a
+  ``DurationHistogram``, which doubles as the quantile sketch: it is built
+  from streamed chunks during ingestion (exact below four hours, within half a
+  percent above) or from an in-memory frame;
+- ``quality_flags`` marks every problem of every row as a bit of one
+  ``uint8`` per trip, computed column by column without copying the frame.
+
+Rows are only dropped or capped at the end, once, by ``clean_trips`` and
+``cap_durations``. Ingestion flags every chunk and drops its ``INVALID``
+trips before they reach the trip store and the aggregates. Report the flags of the whole trip store, a batch at a
+time, with::
+
+    python -m citibike.quality
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from citibike.duration_hist import DurationHistogram, load_duration_histogram
+from citibike.paths import PREPARED_DIR, TRIPS_DIR
+from citibike.transform import SEASONS
+
+## One bit per problem; a trip can have several
+MISSING_TIME = 1 << 0
+NEGATIVE_DURATION = 1 << 1
+SHORT_TRIP = 1 << 2
+LONG_TRIP = 1 << 3
+DURATION_OUTLIER = 1 << 4
+MISSING_STATION = 1 << 5
+MISSING_WEATHER = 1 << 6
+
+FLAGS = {'missing_time': MISSING_TIME,
+         'negative_duration': NEGATIVE_DURATION,
+         'short_trip': SHORT_TRIP,
+         'long_trip': LONG_TRIP,
+         'duration_outlier': DURATION_OUTLIER,
+         'missing_station': MISSING_STATION,
+         'missing_weather': MISSING_WEATHER}
+
+## Citi Bike removes trips under a minute from its published data; docked bikes
+## are lost or stolen after a day
+SHORT_TRIP_SECONDS = 60
+LONG_TRIP_SECONDS = 24 * 3600
+IQR_FACTOR = 1.5
+
+## Flags that make a trip unusable; outliers are kept unless asked for
+INVALID = MISSING_TIME | NEGATIVE_DURATION | MISSING_STATION | MISSING_WEATHER
+## Duration of trips missing either time; no real trip lasts this long in either direction
+MISSING_SECONDS = np.iinfo(np.int64).min
+
+
+############################## DURATIONS ################################################
+
+def trip_seconds(started_at, ended_at):
+    """Exact trip durations in whole seconds, as int64; ``MISSING_SECONDS`` where either time is missing."""
+    started = np.asarray(started_at, dtype = 'datetime64[ns]')
+    ended = np.asarray(ended_at, dtype = 'datetime64[ns]')
+    seconds = (ended.view(np.int64) - started.view(np.int64)) // 10**9
+    seconds[np.isnat(started) | np.isnat(ended)] = MISSING_SECONDS
+    return seconds
+
+
+############################## FENCES ###################################################
+
+def duration_fences(histogram, factor=IQR_FACTOR):
+    """Q1, Q3 and the IQR fences of the trip duration per (member_casual, season).
+
+    Each cell is answered from the histogram's counts, so this costs no pass
+    over the trips.
+    """
+    rows = []
+    for member in histogram.members:
+        for season in histogram.seasons:
+            if not histogram.total(member_casual = member, season = season):
+                continue
+            q1, q3 = histogram.quantile([0.25, 0.75], member_casual = member, season = season)
+            rows.append({'member_casual': member, 'season': season, 'q1': q1, 'q3': q3,
+                         'lower': q1 - factor * (q3 - q1), 'upper': q3 + factor * (q3 - q1)})
+    return pd.DataFrame(rows, columns = ['member_casual', 'season', 'q1', 'q3', 'lower', 'upper'])
+
+
+def _fence_lookup(fences, member_casual, season):
+    """Lower and upper fence of every trip, NaN where its cell has no fences."""
+    members = pd.Index(fences['member_casual'].unique())
+    table = np.full((len(members) + 1, len(SEASONS) + 1, 2), np.nan)
+    table[members.get_indexer(fences['member_casual']), pd.Index(SEASONS).get_indexer(fences['season'])] = \
+        fences[['lower', 'upper']].to_numpy()
+    ## Unknown members and seasons get code -1, which indexes the spare NaN row and column
+    member = members.get_indexer(pd.Index(member_casual))
+    season = pd.Index(SEASONS).get_indexer(pd.Index(season))
+    bounds = table[member, season]
+    return bounds[:, 0], bounds[:, 1]
+
+
+############################## FLAGS ####################################################
+
+def quality_flags(trips, fences=None, seconds=None):
+    """One ``uint8`` of ``FLAGS`` bits per trip.
+
+    Reads ``started_at``/``ended_at`` (or uses ``seconds`` when given), the
+    station keys or names, ``avgTemp``, and with ``fences`` also
+    ``member_casual`` and ``season``. Columns the frame lacks are not checked.
+    """
+    flags = np.zeros(len(trips), dtype = np.uint8)
+    if seconds is None and 'started_at' in trips and 'ended_at' in trips:
+        seconds = trip_seconds(trips['started_at'], trips['ended_at'])
+    elif seconds is None and 'trip_duration' in trips:
+        seconds = trips['trip_duration'].fillna(0).to_numpy(dtype = np.int64)
+        seconds[trips['trip_duration'].isna().to_numpy()] = MISSING_SECONDS
+
+    if seconds is not None:
+        timed = seconds != MISSING_SECONDS
+        flags[~timed] |= MISSING_TIME
+        flags[timed & (seconds < 0)] |= NEGATIVE_DURATION
+        flags[timed & (seconds >= 0) & (seconds < SHORT_TRIP_SECONDS)] |= SHORT_TRIP
+        flags[timed & (seconds > LONG_TRIP_SECONDS)] |= LONG_TRIP
+        if fences is not None and len(fences):
+            lower, upper = _fence_lookup(fences, trips['member_casual'], trips['season'])
+            ## Comparisons with NaN fences are False, so trips without fences are never outliers
+            with np.errstate(invalid = 'ignore'):
+                flags[timed & ((seconds < lower) | (seconds > upper))] |= DURATION_OUTLIER
+
+    for direction in ['start', 'end']:
+        if '%s_station_key' % direction in trips:
+            flags[trips['%s_station_key' % direction].to_numpy() < 0] |= MISSING_STATION
+        elif '%s_station_name' % direction in trips:
+            flags[trips['%s_station_name' % direction].isna().to_numpy()] |= MISSING_STATION
+    if 'avgTemp' in trips:
+        flags[trips['avgTemp'].isna().to_numpy()] |= MISSING_WEATHER
+    return flags
+
+
+def flag_counts(flags):
+    """Trips carrying each flag, and trips with none."""
+    counts = {name: int(np.count_nonzero(flags & bit)) for name, bit in FLAGS.items()}
+    counts['clean'] = int(np.count_nonzero(flags == 0))
+    return pd.Series(counts, name = 'trips')
+
+
+############################## CLEANING #################################################
+
+def clean_trips(trips, flags, drop=INVALID):
+    """The trips without any of the ``drop`` flags, selected once; ``trips`` is left unchanged."""
+    keep = (flags & drop) == 0
+    return trips if keep.all() else trips.loc[keep]
+
+
+def cap_durations(trips, fences, column='trip_duration'):
+    """Clip ``column`` to the upper fence of each trip's cell in place, as the notebook's
+    capping does with one global fence. Returns ``trips``.
+    """
+    _, upper = _fence_lookup(fences, trips['member_casual'], trips['season'])
+    values = trips[column].to_numpy()
+    capped = np.fmin(values, np.floor(upper)).astype(values.dtype)
+    trips[column] = capped
+    return trips
+
+
+def trip_quality(trips, histogram=None, drop=INVALID, cap=True):
+    """The whole "Data Wragling" duration step for an in-memory frame.
+
+    Takes the fences from ``histogram`` (or builds one from the timed trips),
+    selects the trips without ``drop`` flags once, and on that selection sets
+    the exact ``trip_duration`` and caps it at the cell's upper fence.
+    Returns the cleaned trips, a new frame, and the fences; ``trips`` is left
+    unchanged.
+    """
+    seconds = trip_seconds(trips['started_at'], trips['ended_at'])
+    if histogram is None:
+        timed = pd.DataFrame({'member_casual': trips['member_casual'], 'season': trips['season'],
+                              'trip_duration': seconds}, index = trips.index)
+        histogram = DurationHistogram.from_trips(timed.loc[seconds >= 0])
+    fences = duration_fences(histogram)
+    keep = np.flatnonzero((quality_flags(trips, fences, seconds) & drop) == 0)
+    trips = trips.take(keep)
+    trips['trip_duration'] = seconds[keep].astype(np.int32)
+    if cap:
+        cap_durations(trips, fences)
+    return trips, fences
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    from citibike.trip_store import trip_dataset
+
+    parser = argparse.ArgumentParser(description = 'Report duration fences and quality flags of the trip store.')
+    parser.add_argument('--source', default = TRIPS_DIR, help = 'trip store folder written by citibike.ingest')
+    parser.add_argument('--prepared', default = PREPARED_DIR, help = 'folder with DB_duration_hist.parquet')
+    parser.add_argument('--batch-size', type = int, default = 1_000_000, help = 'trips read at a time')
+    args = parser.parse_args(argv)
+
+    fences = duration_fences(load_duration_histogram(args.prepared))
+    print(fences.to_string(index = False, float_format = '{:,.0f}'.format))
+
+    columns = ['started_at', 'ended_at', 'start_station_key', 'end_station_key', 'avgTemp', 'member_casual', 'season']
+    totals = None
+    for batch in trip_dataset(args.source).to_batches(columns = columns, batch_size = args.batch_size):
+        counts = flag_counts(quality_flags(batch.to_pandas(), fences))
+        totals = counts if totals is None else totals + counts
+    print(totals.to_string())
+
+
+if __name__ == '__main__':
+    main()
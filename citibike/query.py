@@ -0,0 +1,440 @@
+############################# TRIP QUERIES ##############################################
+#########################################################################################
+"""Lazy select / filter / group / aggregate / top-N queries over the trip store.
+
+The notebook analyses are eager pandas over the whole cleaned table, e.g. in
+"2.4 Visualization Libraries Part 2"::
+
+    df.groupby('start_station_name')['value'].count().reset_index().nlargest(20, 'value')
+
+``TripQuery`` records the same steps as a plan and only runs it on
+``collect``, which fuses them into one scan of the trip store:
+
+- only the columns the plan uses are read, and the filters are pushed into
+  the scan, pruning year/month partitions and row groups;
+- station names, ids and coordinates are grouped by their integer station
+  key and looked up once in the station table at the end;
+- every batch is aggregated as soon as it is read, into partial counts, sums,
+  minimums and maximums that merge exactly (a mean is a sum and a count);
+- the partitions are split between ``workers`` processes;
+- top-N keeps only the best groups of every merged bucket.
+
+A worker holds one batch and its running partials. When the partials outgrow
+``spill_rows`` they are hashed into buckets on the group keys (station keys
+as the labels they will get) and written to Parquet under a temporary
+folder, and the buckets are merged one at a time, so the group count is
+bounded by disk rather than RAM. An ungrouped ``select`` returns its rows as
+one frame, so without ``top`` its result has to fit in memory; with ``top``
+only the best rows are kept as batches are read. For example::
+
+    TripQuery().filter(seasons = 'Summer').group_by('start_station_name') \\
+        .agg(trips = 'count').top(20, 'trips').collect(workers = 8)
+"""
+
+import argparse
+import copy
+import functools
+import multiprocessing
+import operator
+import os
+import shutil
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from citibike.paths import TRIPS_DIR
+from citibike.schema import TRIP_ARROW_SCHEMA, apply_schema
+from citibike.stations import STATION_COLUMNS, StationTable
+from citibike.trip_store import trip_dataset, trip_filter
+
+AGGREGATIONS = ['count', 'sum', 'min', 'max', 'mean']
+## How the partials of each aggregation merge
+_MERGE = {'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max'}
+PARTITION_COLUMNS = ['year', 'month']
+
+BATCH_SIZE = 1_000_000
+## Partial groups a worker keeps in memory before spilling them to disk
+SPILL_ROWS = 5_000_000
+SPILL_BUCKETS = 64
+## Batches of best rows an ungrouped top-N collects before cutting them down again
+TOP_BATCHES = 16
+
+
+def _partials(aggregations):
+    """The mergeable (column, function) pairs behind the requested aggregations."""
+    partials = []
+    for column, function in aggregations.values():
+        needed = [(column, 'sum'), (column, 'count')] if function == 'mean' else [(column, function)]
+        partials += [partial for partial in needed if partial not in partials]
+    return partials
+
+
+def _partial_name(column, function):
+    return '%s(%s)' % (function, '*' if column is None else column)
+
+
+def _plain(column):
+    """Dictionary-encoded group keys decoded, so partials of different batches concatenate."""
+    return pc.cast(column, column.type.value_type) if pa.types.is_dictionary(column.type) else column
+
+
+def _aggregate(table, keys, partials, merge=False):
+    """Group ``table`` by ``keys`` into the ``partials``, or merge partials that were."""
+    targets = []
+    for column, function in partials:
+        name = _partial_name(column, function)
+        if merge:
+            targets.append((name, _MERGE[function], None))
+        elif column is None:
+            ## Rows are counted on any column, nulls included
+            targets.append((table.column_names[0], 'count', pc.CountOptions(mode = 'all')))
+        else:
+            targets.append((column, function, None))
+    names = [_partial_name(column, function) for column, function in partials]
+    if not keys:
+        values = [getattr(pc, function)(table[target], options = options) if options else
+                  getattr(pc, function)(table[target]) for target, function, options in targets]
+        return pa.table({name: [value.as_py()] for name, value in zip(names, values)})
+    result = table.group_by(keys).aggregate([(target, function, options) if options else (target, function)
+                                             for target, function, options in targets])
+    return pa.table([_plain(result[key]) for key in keys]
+                    + [result['%s_%s' % (target, function)] for target, function, _ in targets],
+                    names = keys + names)
+
+
+def _spill(table, plan, folder):
+    """Write ``table`` into hash buckets of its group keys under ``folder``."""
+    frame = table.to_pandas()
+    bucket = pd.util.hash_pandas_object(plan.bucket_keys(frame), index = False).to_numpy() % SPILL_BUCKETS
+    for number in np.unique(bucket):
+        path = os.path.join(folder, 'bucket=%02d' % number)
+        os.makedirs(path, exist_ok = True)
+        frame[bucket == number].to_parquet(os.path.join(path, 'part-%s.parquet' % uuid.uuid4().hex), index = False)
+
+
+def _pool(workers):
+    """Worker processes forked where the platform allows: a spawned worker spends
+    seconds importing pandas and pyarrow, longer than a query over years of trips.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    return ProcessPoolExecutor(max_workers = workers, mp_context = context)
+
+
+def _run_task(plan, paths, spill_dir):
+    """Scan ``paths`` with the fused plan; returns partials, selected rows or ``None`` once spilled."""
+    dataset = ds.dataset(paths, format = 'parquet', partitioning = 'hive', partition_base_dir = plan.root)
+    batches = dataset.to_batches(columns = plan.read_columns(), filter = plan.expression, batch_size = plan.batch_size)
+    keys = plan.scan_keys()
+    partials = _partials(plan.aggregations or {})
+    pending, pending_rows, spilled = [], 0, False
+    for batch in batches:
+        table = pa.Table.from_batches([batch])
+        if plan.aggregations is None:
+            pending.append(plan.top_rows(table))
+            if plan.order is not None and len(pending) >= TOP_BATCHES:
+                pending = [plan.top_rows(pa.concat_tables(pending))]
+            continue
+        pending.append(_aggregate(table, keys, partials))
+        pending_rows += pending[-1].num_rows
+        if keys and pending_rows > plan.spill_rows:
+            merged = _aggregate(pa.concat_tables(pending), keys, partials, merge = True)
+            pending, pending_rows = [merged], merged.num_rows
+            if merged.num_rows > plan.spill_rows // 2:
+                _spill(merged, plan, spill_dir)
+                pending, pending_rows, spilled = [], 0, True
+    if plan.aggregations is None:
+        return plan.top_rows(pa.concat_tables(pending)) if pending else None
+    if not pending:
+        return None
+    merged = _aggregate(pa.concat_tables(pending), keys, partials, merge = True)
+    if spilled:
+        _spill(merged, plan, spill_dir)
+        return None
+    return merged
+
+
+class TripQuery:
+    """A lazy query over the trip store; every method returns a new query."""
+
+    def __init__(self, root=TRIPS_DIR):
+        self.root = root
+        self.columns = None
+        self.expression = None
+        self.keys = None
+        self.aggregations = None
+        self.order = None
+        self.batch_size = BATCH_SIZE
+        self.spill_rows = SPILL_ROWS
+
+    def _with(self, **changes):
+        query = copy.copy(self)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    ############################## BUILD ################################################
+
+    def select(self, *columns):
+        """Keep only ``columns`` (stored, partition or station columns) in an ungrouped result."""
+        return self._with(columns = list(columns))
+
+    def filter(self, expression=None, start=None, end=None, seasons=None, member=None):
+        """Keep trips matching a ``pyarrow.dataset`` expression and the ``trip_filter`` terms."""
+        terms = [term for term in [self.expression, expression, trip_filter(start, end, seasons, member)]
+                 if term is not None]
+        return self._with(expression = functools.reduce(operator.and_, terms) if terms else None)
+
+    def group_by(self, *keys):
+        return self._with(keys = list(keys))
+
+    def agg(self, **aggregations):
+        """Named aggregations: ``name='count'`` counts trips, ``name=(column, function)``
+        applies one of ``AGGREGATIONS`` to a column.
+        """
+        named = {}
+        for name, spec in aggregations.items():
+            column, function = (None, spec) if isinstance(spec, str) else spec
+            if function not in AGGREGATIONS or (column is None and function != 'count'):
+                raise ValueError('unknown aggregation %r for %s' % (spec, name))
+            named[name] = (column, function)
+        return self._with(aggregations = named)
+
+    def top(self, n, by, ascending=False):
+        """The ``n`` rows or groups with the largest (or smallest) ``by``."""
+        return self._with(order = (n, by, ascending))
+
+    ############################## PLAN #################################################
+
+    def _check(self):
+        stored = set(TRIP_ARROW_SCHEMA.names) | set(PARTITION_COLUMNS)
+        used = (self.columns or []) + (self.keys or []) + [column for column, _ in (self.aggregations or {}).values()
+                                                           if column is not None]
+        unknown = [column for column in used if column not in stored and column not in STATION_COLUMNS]
+        if unknown:
+            raise KeyError('unknown trip columns: %s' % ', '.join(unknown))
+        if self.keys is not None and self.aggregations is None:
+            raise ValueError('group_by needs agg')
+        if self.order is not None:
+            outputs = list(self.aggregations) if self.aggregations is not None else self.output_columns()
+            if self.order[1] not in outputs:
+                raise KeyError('cannot order by %s' % self.order[1])
+
+    def output_columns(self):
+        if self.aggregations is not None:
+            return (self.keys or []) + list(self.aggregations)
+        return self.columns if self.columns is not None else list(TRIP_ARROW_SCHEMA.names)
+
+    def scan_keys(self):
+        """Group keys as scanned: station attributes become their station key column."""
+        return [_key_column(key) for key in (self.keys or [])]
+
+    def bucket_keys(self, frame):
+        """The group keys of scanned partials as they will be labelled, to hash them into buckets.
+
+        Stations sharing a name, id or coordinate are one group once labelled,
+        so their keys must land in the same bucket.
+        """
+        stations = None
+        columns = {}
+        for key, scan_key in zip(self.keys, self.scan_keys()):
+            if key in STATION_COLUMNS:
+                if stations is None:
+                    stations = StationTable.load(self.root)
+                columns[key] = stations.attribute(frame[scan_key].to_numpy(), STATION_COLUMNS[key][1])
+            else:
+                columns[key] = frame[scan_key].to_numpy()
+        return pd.DataFrame(columns)
+
+    def read_columns(self):
+        if self.aggregations is None:
+            columns = [_key_column(column) for column in self.output_columns()]
+        else:
+            columns = self.scan_keys() + [column for column, _ in self.aggregations.values() if column is not None]
+        if not columns:
+            ## A bare count still has to read one column to count its rows
+            columns = ['season']
+        return list(dict.fromkeys(columns))
+
+    def top_rows(self, table):
+        """Best ``order`` rows of an ungrouped batch; the whole batch without ``top``."""
+        if self.order is None:
+            return table
+        n, by, ascending = self.order
+        return table.take(pc.select_k_unstable(table, n, [(by, 'ascending' if ascending else 'descending')]))
+
+    def parts(self):
+        """Part files the filter can match, after partition pruning."""
+        return [fragment.path for fragment in trip_dataset(self.root).get_fragments(filter = self.expression)]
+
+    def explain(self):
+        """The fused plan, one step per line."""
+        parts = self.parts()
+        lines = ['scan    %d parts, columns %s' % (len(parts), ', '.join(self.read_columns()))]
+        if self.expression is not None:
+            lines.append('filter  %s (in the scan)' % self.expression)
+        if self.aggregations is not None:
+            lines.append('group   %s' % (', '.join(self.scan_keys()) or '(all trips)'))
+            lines.append('agg     %s (per batch, merged per bucket)' % ', '.join(
+                '%s = %s(%s)' % (name, function, column or '*')
+                for name, (column, function) in self.aggregations.items()))
+        labels = [key for key in (self.keys or self.columns or []) if key in STATION_COLUMNS]
+        if labels:
+            lines.append('label   %s (from the station table)' % ', '.join(labels))
+        if self.order is not None:
+            lines.append('top     %d by %s%s' % (self.order[0], self.order[1], ' ascending' if self.order[2] else ''))
+        return '\n'.join(lines)
+
+    ############################## RUN ##################################################
+
+    def collect(self, workers=None, spill_dir=None, spill_rows=SPILL_ROWS):
+        """Run the plan and return a DataFrame.
+
+        ``workers`` processes (all cores by default) each scan a share of the
+        part files. Partials over ``spill_rows`` groups per worker go to a
+        temporary folder under ``spill_dir``, removed when the query ends.
+        """
+        if spill_rows != self.spill_rows:
+            return self._with(spill_rows = spill_rows).collect(workers, spill_dir, spill_rows)
+        self._check()
+        parts = self.parts()
+        workers = max(1, min(workers or os.cpu_count() or 1, len(parts)))
+        ## Interleave the parts so every worker gets months of every year
+        tasks = [parts[i::workers] for i in range(workers)] if parts else []
+        spill_folder = tempfile.mkdtemp(prefix = 'query-', dir = spill_dir)
+        try:
+            if workers > 1:
+                with _pool(workers) as pool:
+                    results = list(pool.map(_run_task, [self] * len(tasks), tasks, [spill_folder] * len(tasks)))
+            else:
+                results = [_run_task(self, task, spill_folder) for task in tasks]
+            results = [result for result in results if result is not None]
+            if self.aggregations is None:
+                frame = self._finish_rows(results)
+            else:
+                frame = self._finish_groups(results, spill_folder)
+        finally:
+            shutil.rmtree(spill_folder, ignore_errors = True)
+        return frame
+
+    def _finish_rows(self, results):
+        columns = [_key_column(column) for column in self.output_columns()]
+        table = self.top_rows(pa.concat_tables(results)) if results else \
+            pa.schema([_field(column) for column in dict.fromkeys(columns)]).empty_table()
+        if self.order is not None:
+            table = table.sort_by([(self.order[1], 'ascending' if self.order[2] else 'descending')])
+        frame = _label(table.to_pandas(), self.output_columns(), self.root)
+        return apply_schema(frame[self.output_columns()])
+
+    def _finish_groups(self, results, spill_folder):
+        partials = _partials(self.aggregations)
+        buckets = sorted(os.listdir(spill_folder))
+        if buckets:
+            ## Anything still in memory joins the spilled buckets, so each group lives in one bucket
+            for result in results:
+                _spill(result, self, spill_folder)
+            buckets = sorted(os.listdir(spill_folder))
+            groups = [self._finish_bucket(pa.Table.from_pandas(pd.read_parquet(os.path.join(spill_folder, bucket)),
+                                                               preserve_index = False), partials)
+                      for bucket in buckets]
+        elif results:
+            groups = [self._finish_bucket(pa.concat_tables(results), partials)]
+        else:
+            groups = []
+        frame = pd.concat(groups, ignore_index = True) if groups else \
+            pd.DataFrame(columns = self.output_columns())
+        return self._order(frame).reset_index(drop = True)
+
+    def _finish_bucket(self, table, partials):
+        """Merged groups of one bucket with their station labels, outputs and top-N."""
+        keys = self.scan_keys()
+        frame = _aggregate(table, keys, partials, merge = True).to_pandas()
+        if any(key in STATION_COLUMNS for key in self.keys or []):
+            frame = _label(frame, self.keys, self.root)
+            ## Stations sharing a name (or an id) are one group once labelled
+            names = [_partial_name(column, function) for column, function in partials]
+            frame = frame.groupby(self.keys, as_index = False, observed = True, dropna = False, sort = False).agg(
+                {name: _MERGE[function] for name, (_, function) in zip(names, partials)})
+        for name, (column, function) in self.aggregations.items():
+            if function == 'mean':
+                frame[name] = frame[_partial_name(column, 'sum')] / frame[_partial_name(column, 'count')]
+            else:
+                frame[name] = frame[_partial_name(column, function)]
+        return self._order(frame[self.output_columns()])
+
+    def _order(self, frame):
+        if self.order is None:
+            return frame
+        n, by, ascending = self.order
+        keys = [key for key in (self.keys or []) if key != by]
+        return frame.sort_values([by] + keys, ascending = [ascending] + [True] * len(keys), kind = 'mergesort').head(n)
+
+
+def _key_column(column):
+    """Stored column a requested column is read from."""
+    return '%s_station_key' % STATION_COLUMNS[column][0] if column in STATION_COLUMNS else column
+
+
+def _field(column):
+    return pa.field(column, pa.int32()) if column in PARTITION_COLUMNS else TRIP_ARROW_SCHEMA.field(column)
+
+
+def _label(frame, columns, root):
+    """Replace the station keys read for station ``columns`` with their names, ids or coordinates."""
+    requested = [column for column in columns if column in STATION_COLUMNS]
+    if requested:
+        stations = StationTable.load(root)
+        for column in requested:
+            direction, attribute = STATION_COLUMNS[column]
+            frame[column] = stations.attribute(frame['%s_station_key' % direction].to_numpy(), attribute)
+    return frame
+
+
+############################## ANALYSES #################################################
+
+def top_stations(n=20, direction='start', root=TRIPS_DIR, workers=None, **filters):
+    """The ``n`` stations with the most trips starting (or ending) there, like the notebook's
+    ``groupby('start_station_name')['value'].count()`` and ``nlargest(20, 'value')``.
+    """
+    column = '%s_station_name' % direction
+    return TripQuery(root).filter(**filters).group_by(column).agg(value = 'count') \
+        .top(n, 'value').collect(workers)
+
+
+def daily_rides(root=TRIPS_DIR, workers=None, **filters):
+    """Trips and average temperature per day, the columns of DB_line_chart_data."""
+    frame = TripQuery(root).filter(**filters).group_by('date') \
+        .agg(bike_rides_daily = 'count', avgTemp = ('avgTemp', 'mean')).collect(workers)
+    return frame.sort_values('date', ignore_index = True)
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Run the notebook analyses as fused queries over the trip store.')
+    parser.add_argument('analysis', choices = ['top-stations', 'daily-rides'])
+    parser.add_argument('--source', default = TRIPS_DIR, help = 'trip store folder written by citibike.ingest')
+    parser.add_argument('--top', type = int, default = 20, help = 'stations listed by top-stations')
+    parser.add_argument('--direction', choices = ['start', 'end'], default = 'start')
+    parser.add_argument('--start', default = None, help = 'first date, inclusive')
+    parser.add_argument('--end', default = None, help = 'last date, inclusive')
+    parser.add_argument('--season', nargs = '+', default = None, help = 'only these seasons')
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes, all cores by default')
+    args = parser.parse_args(argv)
+
+    filters = {'start': args.start, 'end': args.end, 'seasons': args.season}
+    if args.analysis == 'top-stations':
+        result = top_stations(args.top, args.direction, args.source, args.workers, **filters)
+    else:
+        result = daily_rides(args.source, args.workers, **filters)
+    print(result.to_string(index = False))
+
+
+if __name__ == '__main__':
+    main()
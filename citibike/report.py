@@ -0,0 +1,316 @@
+############################# REPORT FIGURES ############################################
+#########################################################################################
+"""Headless batch rendering of the static report figures in Visualizations/.
+
+The PNGs of the report used to be saved by hand from ``plt.savefig`` cells in
+"2.3 Visualization Libraries Part 1", "2.3 Bonus Part 1" and "2.4
+Visualization Libraries Part 2", each notebook re-reading the full cleaned
+pickle first. ``render_report`` draws them from the aggregates the ingestion
+already writes (DB_line_chart_data.csv, the trip cube and the duration
+histogram), with matplotlib's Agg backend in a process pool, one figure per
+task.
+
+Every figure's fingerprint (the content hash of its input files, the dpi and
+``REPORT_VERSION``) is kept in ``_report.json`` next to the PNGs, and a figure
+whose fingerprint and file are unchanged is skipped. After the monthly
+ingestion the whole pack is refreshed with::
+
+    python -m citibike.report
+
+The duration histogram is keyed by member status and season, so the facet
+grid splits durations by member status where the notebook's split them by
+bike type.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from citibike.cube import CUBE_FILE, TripCube
+from citibike.duration_hist import DURATION_HIST_FILE, DurationHistogram
+from citibike.paths import PREPARED_DIR, VISUALIZATIONS_DIR
+from citibike.transform import SEASONS
+
+## Bump when the drawing code changes, so every figure is rendered again
+REPORT_VERSION = 1
+REPORT_MANIFEST = '_report.json'
+DEFAULT_DPI = 300
+
+LINE_CHART_FILE = 'DB_line_chart_data.csv'
+## Notebook palette of "2.4 Visualization Libraries Part 2"
+palette = ['#235789', '#B9D6F2', '#F1D302', '#550C18']
+## Durations past this many seconds are cut from the duration histograms, as in the notebooks
+DURATION_LIMIT = 2500
+
+
+############################## FIGURES ##################################################
+
+def draw_daily_trips_temperature(folderpath, plt):
+    data = pd.read_csv(os.path.join(folderpath, LINE_CHART_FILE), index_col = 0, parse_dates = ['Date'])
+    fig, ax = plt.subplots(figsize = (10, 5))
+    ax.plot(data['Date'], data['Daily Rides'], color = palette[0], alpha = 0.4)
+    ax.fill_between(data['Date'], data['Daily Rides'], color = palette[0], alpha = 0.3)
+    ax.set_ylabel('Bike Rides Daily', color = palette[0], fontsize = 14)
+    ax.tick_params(axis = 'y', which = 'both', length = 0)
+
+    ax2 = ax.twinx()
+    ax2.plot(data['Date'], data['Average Temperature'], color = palette[3])
+    ax2.set_ylabel('Average Temperatures (in C)', color = palette[3], fontsize = 14)
+    ax2.tick_params(axis = 'y', which = 'both', length = 0)
+    ax.set_title('Daily Bike Trips and Average NYC Temperature', fontsize = 18)
+    return fig
+
+
+def draw_duration_by_season(folderpath, plt):
+    histogram = DurationHistogram.load(os.path.join(folderpath, os.path.basename(DURATION_HIST_FILE)))
+    ## Box statistics from the binned counts; whiskers stop at the 1.5 IQR fences or the extreme trips
+    boxes = []
+    for season in histogram.seasons:
+        low, q1, median, q3, high = histogram.quantile([0, 0.25, 0.5, 0.75, 1], season = season)
+        boxes.append({'label': season, 'med': median, 'q1': q1, 'q3': q3, 'fliers': [],
+                      'whislo': max(low, q1 - 1.5 * (q3 - q1)), 'whishi': min(high, q3 + 1.5 * (q3 - q1))})
+
+    fig, ax = plt.subplots(figsize = (10, 5))
+    artists = ax.bxp(boxes, showfliers = False, patch_artist = True)
+    for patch, color in zip(artists['boxes'], palette):
+        patch.set_facecolor(color)
+    for x, box in enumerate(boxes, start = 1):
+        ax.text(x, box['med'] + 10, '%.2f' % box['med'], horizontalalignment = 'center',
+                fontsize = 12, color = 'w', weight = 'bold')
+    ax.set_ylabel('Trip Duration (in seconds)', fontsize = 14)
+    ax.set_title('Distribution of Trip Durations by Season', fontsize = 18)
+    return fig
+
+
+def draw_duration_by_member(folderpath, plt):
+    histogram = DurationHistogram.load(os.path.join(folderpath, os.path.basename(DURATION_HIST_FILE)))
+    fig, axes = plt.subplots(2, figsize = (10, 8))
+    for ax, member, color, title in [(axes[0], 'Casual', 'blue', 'CASUAL RIDERS'), (axes[1], 'Member', 'red', 'MEMBERS')]:
+        if member in histogram.members:
+            bins = histogram.histogram(50, DURATION_LIMIT, member_casual = member)
+            ax.bar(bins['start'], bins['trips'], width = bins['end'] - bins['start'], align = 'edge',
+                   color = color, alpha = 0.4)
+        ax.set_xlim([-50, DURATION_LIMIT])
+        ax.set_ylabel('Total Rides', color = color, fontsize = 14)
+        ax.set_title(title)
+        ax.spines[['right', 'top']].set_visible(False)
+    axes[1].set_xlabel('Ride Duration (in seconds)', fontsize = 14)
+    fig.tight_layout()
+    fig.subplots_adjust(hspace = 0.3, top = 0.85)
+    fig.suptitle('Distribution of Bike Trip Durations by Member Status', fontsize = 18)
+    return fig
+
+
+def draw_rides_by_type_member(folderpath, plt):
+    cube = TripCube.load(os.path.join(folderpath, os.path.basename(CUBE_FILE)))
+    ## Every trip is in the cube once per direction: count the starts
+    rideable = cube.rollup('rideable_type', direction = 'start').sort_values('trips')
+    members = cube.rollup('member_casual', direction = 'start')
+
+    fig, ax = plt.subplots(2, figsize = (8, 6))
+    ax[0].barh(rideable['rideable_type'], rideable['trips'], color = 'navy')
+    ax[0].spines[['right', 'left', 'top']].set_visible(False)
+    ax[0].xaxis.set_ticks_position('none')
+    ax[0].yaxis.set_ticks_position('none')
+    ax[0].set_title('Total Rides by Bike Type', fontsize = 14)
+    ax[0].bar_label(ax[0].containers[0], fontsize = 10, fontweight = 'bold', padding = 3, color = 'white',
+                    label_type = 'center')
+
+    ax[1].pie(members['trips'], labels = members['member_casual'], startangle = 90,
+              colors = ['#F88D9C', 'red'], autopct = '%1.2f%%',
+              textprops = {'size': 'medium', 'fontweight': 'bold', 'color': 'white'},
+              explode = [0] + [0.12] * (len(members) - 1))
+    ax[1].set_title('Percent of Rides by Membership Status', fontsize = 14)
+    fig.tight_layout()
+    fig.subplots_adjust(hspace = 0.5, top = 0.85)
+    fig.suptitle('Breaking Down Total Rides by Bike Type and Membership Status', fontsize = 16, fontweight = 'bold')
+    return fig
+
+
+def draw_top_stations(folderpath, plt):
+    cube = TripCube.load(os.path.join(folderpath, os.path.basename(CUBE_FILE)))
+    top = cube.top_n(20, 'station', direction = 'start')['station']
+    split = cube.rollup(['station', 'rideable_type'], direction = 'start', station = list(top))
+    split = split.pivot(index = 'station', columns = 'rideable_type', values = 'trips').fillna(0)
+    ## Busiest at the top
+    split = split.reindex(top[::-1])
+
+    fig, ax = plt.subplots(figsize = (10, 8))
+    left = np.zeros(len(split))
+    for rideable_type, color in zip(split.columns, palette):
+        ax.barh(split.index, split[rideable_type], left = left, color = color, label = rideable_type)
+        left += split[rideable_type].to_numpy()
+    ax.spines[['right', 'top']].set_visible(False)
+    ax.set_xlabel('Trips', fontsize = 14)
+    ax.legend(frameon = False)
+    ax.set_title('Top 20 Most Popular Start Stations', fontsize = 18)
+    return fig
+
+
+def draw_facet_grid(folderpath, plt):
+    histogram = DurationHistogram.load(os.path.join(folderpath, os.path.basename(DURATION_HIST_FILE)))
+    seasons = [season for season in SEASONS if season in histogram.seasons]
+    members = list(histogram.members)
+    fig, axes = plt.subplots(len(seasons), len(members), figsize = (5 * len(members), 2.5 * len(seasons)),
+                             squeeze = False)
+    upper = min(histogram.quantile(0.99), DURATION_LIMIT)
+    for row, season in enumerate(seasons):
+        for column, member in enumerate(members):
+            ax = axes[row, column]
+            bins = histogram.histogram(50, upper, member_casual = member, season = season)
+            ax.bar(bins['start'], bins['trips'], width = bins['end'] - bins['start'], align = 'edge',
+                   color = palette[row % len(palette)])
+            median = histogram.median(member_casual = member, season = season)
+            ax.axvline(x = median, color = 'black', linestyle = '--')
+            ax.text(.3, .8, 'Median = {:.1f}'.format(median), transform = ax.transAxes)
+            if row == 0:
+                ax.set_title(member, fontsize = 16)
+            if column == len(members) - 1:
+                ax.yaxis.set_label_position('right')
+                ax.set_ylabel(season, fontsize = 16, rotation = 270, labelpad = 20)
+            if row == len(seasons) - 1:
+                ax.set_xlabel('trip_duration')
+    fig.tight_layout()
+    return fig
+
+
+## Figure name -> (PNG file name, input files in the prepared folder, drawing function)
+FIGURES = {
+    'daily_trips_temperature': ('DailyTrips_AverageNYC_Temperature.png', [LINE_CHART_FILE],
+                                draw_daily_trips_temperature),
+    'duration_by_season': ('trip_duration_by_season.png', [os.path.basename(DURATION_HIST_FILE)],
+                           draw_duration_by_season),
+    'duration_by_member': ('distribution_biketrip_bymemberstatus.png', [os.path.basename(DURATION_HIST_FILE)],
+                           draw_duration_by_member),
+    'rides_by_type_member': ('Nbr_Rides_by_RideType_MemberStatus.png', [os.path.basename(CUBE_FILE)],
+                             draw_rides_by_type_member),
+    'top_stations': ('top_start_stations.png', [os.path.basename(CUBE_FILE)], draw_top_stations),
+    'facet_grid': ('Faced_grid.png', [os.path.basename(DURATION_HIST_FILE)], draw_facet_grid),
+}
+
+
+############################## RENDERING ################################################
+
+def render_figure(name, folderpath, out_dir, dpi=DEFAULT_DPI):
+    """Draw one of the ``FIGURES`` and write its PNG; returns the seconds it took."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    start = time.perf_counter()
+    filename, _, draw = FIGURES[name]
+    fig = draw(folderpath, plt)
+    path = os.path.join(out_dir, filename)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        fig.savefig(tmp_path, format = 'png', dpi = dpi, bbox_inches = 'tight')
+    finally:
+        plt.close(fig)
+    os.replace(tmp_path, path)
+    return time.perf_counter() - start
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def figure_fingerprint(name, digests, dpi):
+    """Hash of everything a figure depends on: drawing code version, dpi and input contents."""
+    _, inputs, _ = FIGURES[name]
+    payload = json.dumps([REPORT_VERSION, name, dpi, [digests[filename] for filename in inputs]])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def read_report_manifest(out_dir):
+    path = os.path.join(out_dir, REPORT_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def _write_report_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, REPORT_MANIFEST)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w', encoding = 'utf-8') as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    os.replace(tmp_path, path)
+
+
+def render_report(folderpath=PREPARED_DIR, out_dir=VISUALIZATIONS_DIR, names=None, dpi=DEFAULT_DPI,
+                  workers=None, force=False):
+    """Render the ``names`` figures (all by default) whose inputs changed since the last run.
+
+    Returns the status of every figure: ``rendered`` with its seconds,
+    ``unchanged`` or ``missing input``.
+    """
+    names = list(FIGURES) if names is None else list(names)
+    manifest = read_report_manifest(out_dir)
+    digests = {}
+    status = {}
+    pending = {}
+    for name in names:
+        filename, inputs, _ = FIGURES[name]
+        paths = [os.path.join(folderpath, path) for path in inputs]
+        if not all(os.path.exists(path) for path in paths):
+            status[name] = 'missing input'
+            continue
+        for path in inputs:
+            if path not in digests:
+                digests[path] = _file_digest(os.path.join(folderpath, path))
+        fingerprint = figure_fingerprint(name, digests, dpi)
+        if not force and manifest.get(name) == fingerprint and os.path.exists(os.path.join(out_dir, filename)):
+            status[name] = 'unchanged'
+        else:
+            pending[name] = fingerprint
+
+    os.makedirs(out_dir, exist_ok = True)
+    workers = min(workers or os.cpu_count() or 1, len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            futures = {name: pool.submit(render_figure, name, folderpath, out_dir, dpi) for name in pending}
+            seconds = {name: future.result() for name, future in futures.items()}
+    else:
+        seconds = {name: render_figure(name, folderpath, out_dir, dpi) for name in pending}
+
+    for name, fingerprint in pending.items():
+        manifest[name] = fingerprint
+        status[name] = 'rendered in %.1fs' % seconds[name]
+    if pending:
+        _write_report_manifest(out_dir, manifest)
+    return status
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Render the static report figures from the prepared aggregates.')
+    parser.add_argument('figures', nargs = '*', help = 'figures to render (all by default): %s' % ', '.join(FIGURES))
+    parser.add_argument('--prepared', default = PREPARED_DIR, help = 'folder with the prepared aggregates')
+    parser.add_argument('--out', default = VISUALIZATIONS_DIR, help = 'folder for the PNGs')
+    parser.add_argument('--dpi', type = int, default = DEFAULT_DPI)
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes, all cores by default')
+    parser.add_argument('--force', action = 'store_true', help = 'render even the figures whose inputs are unchanged')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.figures if name not in FIGURES]
+    if unknown:
+        parser.error('unknown figures: %s' % ', '.join(unknown))
+
+    status = render_report(args.prepared, args.out, args.figures or None, args.dpi, args.workers, args.force)
+    for name in FIGURES:
+        if name in status:
+            print('%-24s %s' % (name, status[name]))
+
+
+if __name__ == '__main__':
+    main()
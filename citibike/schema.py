@@ -0,0 +1,219 @@
+############################# TRIP SCHEMA ###############################################
+#########################################################################################
+"""Declared dtypes of the trip table and the memory they cost.
+
+"Data Wragling" casts a few columns to ``category`` by hand and leaves the
+rest as objects and float64, so every notebook that loads the cleaned table
+pays for it. ``TRIP_SCHEMA`` fixes one compact dtype per column, applied when
+the trips are read: categoricals for the labels and stations, float32
+coordinates, int32 durations and ``ride_id`` stored as the 8-byte integer its
+16 hexadecimal characters encode. A malformed or missing ``ride_id`` becomes
+``INVALID_RIDE_ID`` and an integer column with missing values takes the
+nullable counterpart of its dtype (``Int32`` for ``int32``), so one bad row
+neither aborts a read nor turns into a real-looking zero.
+
+Report the memory of an existing pickle before and after the schema with::
+
+    python -m citibike.schema Data/Prepared_data/cleaned_nyc_bike_weather_data.pkl
+"""
+
+import argparse
+import binascii
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from citibike.transform import SEASONS
+
+RIDE_ID_LENGTH = 16
+## Code of missing or malformed ride ids; the all-zero id is not one Citi Bike issues
+INVALID_RIDE_ID = np.uint64(0)
+
+TRIP_SCHEMA = {
+    'ride_id': 'uint64',
+    'rideable_type': 'category',
+    'started_at': 'datetime64[ns]',
+    'ended_at': 'datetime64[ns]',
+    'start_station_name': 'category',
+    'start_station_id': 'category',
+    'end_station_name': 'category',
+    'end_station_id': 'category',
+    'start_lat': 'float32',
+    'start_lng': 'float32',
+    'end_lat': 'float32',
+    'end_lng': 'float32',
+    'start_station_key': 'int32',
+    'end_station_key': 'int32',
+    'member_casual': 'category',
+    'date': 'datetime64[ns]',
+    'avgTemp': 'float32',
+    'hourlyTemp': 'float32',
+    'hourlyPrcp': 'float32',
+    'month': 'int8',
+    'season': pd.CategoricalDtype(SEASONS, ordered = True),
+    'value': 'int8',
+    'bike_rides_daily': 'int32',
+    'trip_duration': 'int32',
+    'log_trip_duration': 'float32',
+}
+
+## Columns and Arrow types of the ingested trip dataset; station names, ids and coordinates
+## live once per station in citibike.stations and are joined back on read
+_category = pa.dictionary(pa.int32(), pa.string())
+TRIP_ARROW_SCHEMA = pa.schema([
+    ('ride_id', pa.uint64()),
+    ('rideable_type', _category),
+    ('started_at', pa.timestamp('ns')),
+    ('ended_at', pa.timestamp('ns')),
+    ('start_station_key', pa.int32()),
+    ('end_station_key', pa.int32()),
+    ('member_casual', _category),
+    ('date', pa.timestamp('ns')),
+    ('avgTemp', pa.float32()),
+    ('hourlyTemp', pa.float32()),
+    ('hourlyPrcp', pa.float32()),
+    ('season', pa.dictionary(pa.int32(), pa.string(), ordered = True)),
+    ('trip_duration', pa.int32()),
+])
+
+## Upper bound for a frame holding every TRIP_SCHEMA column, measured with memory_report
+MEMORY_BUDGET_BYTES_PER_ROW = 96
+
+
+############################## RIDE IDS #################################################
+
+def _pack_ride_ids(ride_ids):
+    """``uint64`` codes of ride ids that are all valid; ``ValueError`` otherwise."""
+    try:
+        ## One spare byte per value shows up ids that are too long
+        packed = np.asarray(ride_ids, dtype = 'S%d' % (RIDE_ID_LENGTH + 1))
+    except (UnicodeEncodeError, ValueError):
+        raise ValueError
+    chars = packed.view(np.uint8).reshape(len(packed), RIDE_ID_LENGTH + 1)
+    if chars[:, RIDE_ID_LENGTH].any():
+        raise ValueError
+    try:
+        raw = binascii.unhexlify(np.ascontiguousarray(chars[:, :RIDE_ID_LENGTH]).tobytes())
+    except (binascii.Error, ValueError):
+        raise ValueError
+    return np.frombuffer(raw, dtype = '>u8').astype(np.uint64)
+
+
+def encode_ride_ids(ride_ids, errors='raise'):
+    """Pack 16-character hexadecimal ride ids into ``uint64``.
+
+    Missing or malformed ids raise a ``ValueError``, or with ``errors='coerce'``
+    are encoded as ``INVALID_RIDE_ID``.
+    """
+    ride_ids = np.asarray(ride_ids, dtype = object)
+    try:
+        return _pack_ride_ids(ride_ids)
+    except ValueError:
+        if errors != 'coerce':
+            raise ValueError('ride_id values must be %d hexadecimal characters' % RIDE_ID_LENGTH)
+    ## Only files with bad ids pay for checking every id on its own
+    valid = pd.Series(ride_ids).str.fullmatch('[0-9a-fA-F]{%d}' % RIDE_ID_LENGTH).fillna(False).to_numpy(dtype = bool)
+    codes = np.full(len(ride_ids), INVALID_RIDE_ID, dtype = np.uint64)
+    codes[valid] = _pack_ride_ids(ride_ids[valid])
+    return codes
+
+
+def decode_ride_ids(codes):
+    """Inverse of ``encode_ride_ids``: the upper-case hexadecimal ride ids."""
+    raw = np.asarray(codes, dtype = '>u8').tobytes()
+    return np.frombuffer(binascii.hexlify(raw).upper(), dtype = 'S%d' % RIDE_ID_LENGTH).astype(str)
+
+
+############################## APPLY AND VALIDATE #######################################
+
+def _nullable(dtype):
+    """The pandas nullable counterpart of an integer dtype, e.g. ``Int32`` for ``int32``."""
+    name = str(dtype)
+    return pd.api.types.pandas_dtype('UInt' + name[4:] if name.startswith('uint') else 'Int' + name[3:])
+
+
+def _matches(series, dtype):
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.dtype == dtype
+    if dtype == 'category':
+        return isinstance(series.dtype, pd.CategoricalDtype)
+    if str(dtype).startswith(('int', 'uint')) and series.dtype == _nullable(dtype):
+        return True
+    return series.dtype == np.dtype(dtype)
+
+
+def apply_schema(df, schema=TRIP_SCHEMA):
+    """Cast the ``schema`` columns present in ``df`` in place and return it.
+
+    Invalid ride ids become ``INVALID_RIDE_ID``; integer columns with missing
+    values keep them, as the nullable dtype.
+    """
+    for column, dtype in schema.items():
+        if column not in df or _matches(df[column], dtype):
+            continue
+        if column == 'ride_id':
+            df[column] = encode_ride_ids(df[column].to_numpy(), errors = 'coerce')
+        elif str(dtype).startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column], errors = 'coerce').astype(dtype)
+        elif str(dtype).startswith(('int', 'uint')) and df[column].isna().any():
+            df[column] = df[column].astype(_nullable(dtype))
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def validate_schema(df, schema=TRIP_SCHEMA, required=None, budget=MEMORY_BUDGET_BYTES_PER_ROW):
+    """Raise if ``df`` does not follow ``schema``.
+
+    ``required`` lists columns that must be present (all of ``schema`` when
+    omitted). A ``TypeError`` names every column with the wrong dtype and a
+    ``ValueError`` reports missing columns or a frame over ``budget`` bytes per
+    row; pass ``budget=None`` to skip the memory check.
+    """
+    required = list(schema) if required is None else required
+    missing = [column for column in required if column not in df]
+    if missing:
+        raise ValueError('missing trip columns: %s' % ', '.join(missing))
+
+    wrong = ['%s is %s, expected %s' % (column, df[column].dtype, dtype)
+             for column, dtype in schema.items() if column in df and not _matches(df[column], dtype)]
+    if wrong:
+        raise TypeError('trip columns with the wrong dtype: %s' % '; '.join(wrong))
+
+    if budget is not None and len(df):
+        bytes_per_row = memory_report(df)['bytes_per_row'].sum()
+        if bytes_per_row > budget:
+            raise ValueError('trips use %.1f bytes per row, over the budget of %d' % (bytes_per_row, budget))
+
+
+def memory_report(df):
+    """Bytes and bytes per row of every column, including the index."""
+    usage = df.memory_usage(index = True, deep = True)
+    report = pd.DataFrame({'dtype': [str(df.index.dtype)] + [str(df[column].dtype) for column in usage.index[1:]],
+                           'bytes': usage.to_numpy()},
+                          index = usage.index)
+    report['bytes_per_row'] = report['bytes'] / max(len(df), 1)
+    return report
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Report the memory of a trip pickle before and after the trip schema.')
+    parser.add_argument('path', help = 'pickled trip DataFrame, e.g. cleaned_nyc_bike_weather_data.pkl')
+    args = parser.parse_args(argv)
+
+    df = pd.read_pickle(args.path)
+    before = memory_report(df)
+    after = memory_report(apply_schema(df))
+    report = pd.DataFrame({'before_bytes_per_row': before['bytes_per_row'],
+                           'after_bytes_per_row': after['bytes_per_row'],
+                           'dtype': after['dtype']})
+    print(report.to_string(float_format = '{:,.2f}'.format))
+    print('Total: %.1f -> %.1f bytes per row over %s rows'
+          % (before['bytes_per_row'].sum(), after['bytes_per_row'].sum(), format(len(df), ',')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+############################# STATION RANKING ###########################################
+#########################################################################################
+"""Top stations for any set of seasons, for the "Most Popular Stations" page.
+
+The page used to run ``DataFrame.query`` and ``sort_values`` on every rerun and
+ordered the bars by a ``Grand Total`` precomputed over all seasons, so the
+bars did not reorder when seasons were filtered. ``StationRanking`` keeps the
+trips of every station in a dense (direction, station, rideable_type, season)
+array, ranks stations by their total over the selected seasons only and
+memoizes the result of every filter combination.
+
+Built from the trip cube it covers every station; built from
+DB_bar_chart_start/end.csv it covers the 20 stations those files hold.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from citibike.cube import CUBE_FILE, DIRECTIONS, TripCube
+from citibike.data_store import PREPARED_DATASETS, file_signature, load_derived, load_prepared
+from citibike.paths import PREPARED_DIR
+from citibike.transform import SEASONS
+
+
+class StationRanking:
+    """Trips per (direction, station, rideable_type, season) with memoized top-N."""
+
+    def __init__(self, counts):
+        """``counts`` has ``direction``, ``station``, ``rideable_type``, ``season`` and ``trips`` columns."""
+        self.stations = pd.Index(sorted(counts['station'].unique()))
+        self.rideable_types = pd.Index(sorted(counts['rideable_type'].unique()))
+        self.seasons = [season for season in SEASONS if season in set(counts['season'])]
+
+        shape = (len(DIRECTIONS), len(self.stations), len(self.rideable_types), len(SEASONS))
+        self.trips = np.zeros(shape, dtype = np.int64)
+        np.add.at(self.trips,
+                  (pd.Index(DIRECTIONS).get_indexer(counts['direction']),
+                   self.stations.get_indexer(counts['station']),
+                   self.rideable_types.get_indexer(counts['rideable_type']),
+                   pd.Index(SEASONS).get_indexer(counts['season'])),
+                  counts['trips'].to_numpy())
+        self.version = None
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def from_cube(cls, cube):
+        counts = cube.rollup(['direction', 'station', 'rideable_type', 'season'])
+        return cls(counts)
+
+    @classmethod
+    def from_bar_charts(cls, bar_chart_start, bar_chart_end):
+        """Build from the DB_bar_chart_start/end frames."""
+        frames = []
+        for direction, frame in zip(DIRECTIONS, [bar_chart_start, bar_chart_end]):
+            frames.append(pd.DataFrame({'direction': direction,
+                                        'station': frame['%s_station_name' % direction],
+                                        'rideable_type': frame['rideable_type'],
+                                        'season': frame['season'],
+                                        'trips': frame['Total']}))
+        return cls(pd.concat(frames, ignore_index = True))
+
+    def _season_codes(self, seasons):
+        return [SEASONS.index(season) for season in seasons if season in SEASONS]
+
+    def top(self, direction, seasons, n=20, rideable_type=None):
+        """Bars for the ``n`` busiest stations over ``seasons``.
+
+        Returns one row per station and rideable type with the station column
+        named like the bar chart files (``start_station_name`` or
+        ``end_station_name``), ``Total`` for the bar segment and ``Grand Total``
+        for the station over the selected seasons, ordered busiest first. The
+        frame is shared between callers and must not be modified.
+        """
+        if rideable_type is not None and not isinstance(rideable_type, str):
+            rideable_type = tuple(sorted(rideable_type))
+        key = (direction, frozenset(seasons), n, rideable_type)
+        with self._memo_lock:
+            cached = self._memo.get(key)
+        if cached is not None:
+            return cached
+
+        trips = self.trips[DIRECTIONS.index(direction)][:, :, self._season_codes(seasons)].sum(axis = 2)
+        if rideable_type is not None:
+            keep = self.rideable_types.isin([rideable_type] if isinstance(rideable_type, str) else rideable_type)
+            trips = trips[:, keep]
+            rideable_types = self.rideable_types[keep]
+        else:
+            rideable_types = self.rideable_types
+
+        station_totals = trips.sum(axis = 1)
+        n = min(n, int(np.count_nonzero(station_totals)))
+        top = np.argpartition(-station_totals, n - 1)[:n] if n else np.array([], dtype = np.int64)
+        top = top[np.lexsort((self.stations[top], -station_totals[top]))]
+
+        column = '%s_station_name' % direction
+        result = pd.DataFrame({column: np.repeat(self.stations[top], len(rideable_types)),
+                               'rideable_type': np.tile(rideable_types, len(top)),
+                               'Total': trips[top].ravel(),
+                               'Grand Total': np.repeat(station_totals[top], len(rideable_types))})
+
+        with self._memo_lock:
+            self._memo[key] = result
+        return result
+
+
+def _versioned(build, paths):
+    ranking = build()
+    ranking.version = tuple(file_signature(path) for path in paths)
+    return ranking
+
+
+def load_station_ranking(folderpath=PREPARED_DIR):
+    """Process-wide ranking, from the trip cube when it exists, else from the bar chart files.
+
+    Rebuilt only when the underlying files change; ``version`` holds the
+    signatures of the files it was built from.
+    """
+    cube_path = os.path.join(folderpath, os.path.basename(CUBE_FILE))
+    if os.path.exists(cube_path):
+        paths = [cube_path]
+        build = lambda: StationRanking.from_cube(TripCube.load(cube_path))
+    else:
+        paths = [os.path.join(folderpath, PREPARED_DATASETS[name][0]) for name in ['bar_chart_start', 'bar_chart_end']]
+        build = lambda: StationRanking.from_bar_charts(load_prepared('bar_chart_start', folderpath),
+                                                       load_prepared('bar_chart_end', folderpath))
+    return load_derived(('station_ranking', os.path.abspath(folderpath)), paths,
+                        lambda: _versioned(build, paths))
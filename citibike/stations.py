@@ -0,0 +1,293 @@
+############################# STATION DIMENSION #########################################
+#########################################################################################
+"""One row per station, keyed by a small integer, with a spatial index.
+
+Every raw trip repeats the start and end station name, id, latitude and
+longitude, and "2.5 Geospatial Plotting" recovers station locations with a
+median over every route pair. ``StationTable`` holds each station once: an
+``int32`` surrogate key, the station name, its most frequent station id and
+its median latitude and longitude. The trip dataset stores only
+``start_station_key`` and ``end_station_key``; ``citibike.trip_store`` maps
+the keys back to names and coordinates when those columns are requested.
+
+Keys are assigned before the trips are written, in a first pass that only
+reads the station names, and are never reused or renumbered, so part files
+written earlier stay valid. Ids and coordinates come from per-file partial
+aggregates (see ``citibike.aggregates``) and are refreshed on every ingest.
+
+``GridIndex`` buckets the stations into square cells for nearest-station and
+radius queries::
+
+    stations = StationTable.load()
+    stations.nearest(40.7420, -73.9897, k = 5)
+    stations.within(40.7420, -73.9897, radius_m = 500)
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from citibike.paths import TRIPS_DIR
+
+STATIONS_NAME = '_stations.parquet'
+DIRECTIONS = ['start', 'end']
+KEY_COLUMNS = ['%s_station_key' % direction for direction in DIRECTIONS]
+
+## Trip columns served from the station table instead of being stored on every trip
+STATION_COLUMNS = {'%s_%s' % (direction, column): (direction, attribute)
+                   for direction in DIRECTIONS
+                   for column, attribute in [('station_name', 'station_name'), ('station_id', 'station_id'),
+                                             ('lat', 'lat'), ('lng', 'lng')]}
+
+## Coordinates are counted on a 1e-5 degree grid (about a metre) to take mergeable medians
+COORDINATE_SCALE = 100_000
+METRES_PER_DEGREE = 111_320
+
+
+############################## KEYS #####################################################
+
+def station_codes(names, stations):
+    """Integer code of every name in ``names`` within ``stations``, a name -> code dict
+    that grows as new stations appear; missing names get -1.
+    """
+    names = names if isinstance(names.dtype, pd.CategoricalDtype) else names.astype('category')
+    lookup = np.array([stations.setdefault(name, len(stations)) for name in names.cat.categories] + [-1],
+                      dtype = np.int64)
+    ## Missing values have category code -1, which picks the trailing -1
+    return lookup[names.cat.codes.to_numpy()]
+
+
+def lookup_keys(names, keys):
+    """Keys of ``names`` in the name -> key dict ``keys``; unknown and missing names get -1."""
+    names = names if isinstance(names.dtype, pd.CategoricalDtype) else names.astype('category')
+    lookup = np.array([keys.get(name, -1) for name in names.cat.categories] + [-1], dtype = np.int32)
+    return lookup[names.cat.codes.to_numpy()]
+
+
+def scan_station_names(path, chunksize=1_000_000):
+    """Every station name in one raw trip CSV, reading only the two name columns."""
+    names = set()
+    columns = ['start_station_name', 'end_station_name']
+    reader = pd.read_csv(path, usecols = columns, dtype = 'category', chunksize = chunksize, encoding = 'utf-8')
+    for chunk in reader:
+        for column in columns:
+            names.update(chunk[column].cat.categories)
+    return names
+
+
+############################## PARTIALS #################################################
+
+def weighted_medians(groups, values, weights, n_groups):
+    """Median of ``values`` within each group, counting each value ``weights`` times; NaN for empty groups."""
+    medians = np.full(n_groups, np.nan)
+    if not len(values):
+        return medians
+    order = np.lexsort((values, groups))
+    groups, values, weights = groups[order], values[order], weights[order]
+    totals = np.bincount(groups, weights = weights, minlength = n_groups)
+    cumulative = np.cumsum(weights)
+    ## Running count within each group, rows being sorted by group then value
+    first = np.searchsorted(groups, groups)
+    within = cumulative - (cumulative[first] - weights[first])
+    reached = within * 2 >= totals[groups]
+    found, position = np.unique(groups[reached], return_index = True)
+    medians[found] = values[reached][position]
+    return medians
+
+
+def station_partials(chunk):
+    """Coordinate and id counts per station key of one chunk of keyed trips.
+
+    Returns ``station_coords`` (``station_key``, ``axis``, ``grid``, ``trips``)
+    and ``station_ids`` (``station_key``, ``station_id``, ``trips``) frames.
+    """
+    coords = []
+    ids = []
+    for direction in DIRECTIONS:
+        keys = chunk['%s_station_key' % direction].to_numpy()
+        for axis in ['lat', 'lng']:
+            values = chunk['%s_%s' % (direction, axis)].to_numpy(dtype = np.float64)
+            valid = (keys >= 0) & np.isfinite(values)
+            coords.append(pd.DataFrame({'station_key': keys[valid],
+                                        'axis': axis,
+                                        'grid': np.round(values[valid] * COORDINATE_SCALE).astype(np.int64)}))
+        ids.append(pd.DataFrame({'station_key': keys,
+                                 'station_id': chunk['%s_station_id' % direction].astype(object).to_numpy()}))
+    coords = (pd.concat(coords, ignore_index = True)
+              .groupby(['station_key', 'axis', 'grid'], as_index = False).size().rename(columns = {'size': 'trips'}))
+    ids = pd.concat(ids, ignore_index = True)
+    ids = ids.loc[(ids['station_key'] >= 0) & ids['station_id'].notna()]
+    ids = ids.groupby(['station_key', 'station_id'], as_index = False).size().rename(columns = {'size': 'trips'})
+    return coords, ids
+
+
+############################## SPATIAL INDEX ############################################
+
+class GridIndex:
+    """Points bucketed into square cells of ``cell_m`` metres for radius and nearest queries.
+
+    Distances use an equirectangular projection around the points' mean
+    latitude, accurate to well under a metre across a city.
+    """
+
+    def __init__(self, lat, lng, cell_m=250):
+        self.cell_m = cell_m
+        lat = np.asarray(lat, dtype = np.float64)
+        lng = np.asarray(lng, dtype = np.float64)
+        self.positions = np.flatnonzero(np.isfinite(lat) & np.isfinite(lng))
+        self.scale_x = METRES_PER_DEGREE * np.cos(np.radians(np.mean(lat[self.positions]) if len(self.positions) else 0))
+        self.x = lng[self.positions] * self.scale_x
+        self.y = lat[self.positions] * METRES_PER_DEGREE
+
+        cell_x, cell_y = self._cells(self.x, self.y)
+        order = np.lexsort((cell_y, cell_x))
+        self.positions, self.x, self.y = self.positions[order], self.x[order], self.y[order]
+        self.cell_x, self.cell_y = cell_x[order], cell_y[order]
+
+    def _cells(self, x, y):
+        return np.floor_divide(x, self.cell_m).astype(np.int64), np.floor_divide(y, self.cell_m).astype(np.int64)
+
+    def within(self, lat, lng, radius_m):
+        """Positions of the points within ``radius_m`` of (lat, lng) and their distances, nearest first."""
+        x, y = lng * self.scale_x, lat * METRES_PER_DEGREE
+        (low_x, high_x), (low_y, high_y) = self._cells(np.array([x - radius_m, x + radius_m]),
+                                                       np.array([y - radius_m, y + radius_m]))
+        candidates = []
+        ## Points are sorted by cell column then cell row, so each column is one contiguous slice
+        for column in range(low_x, high_x + 1):
+            start, end = np.searchsorted(self.cell_x, [column, column + 1])
+            rows = self.cell_y[start:end]
+            candidates.append(np.arange(start + np.searchsorted(rows, low_y),
+                                        start + np.searchsorted(rows, high_y, side = 'right')))
+        candidates = np.concatenate(candidates) if candidates else np.array([], dtype = np.int64)
+        distances = np.hypot(self.x[candidates] - x, self.y[candidates] - y)
+        inside = distances <= radius_m
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind = 'stable')
+        return self.positions[candidates[order]], distances[order]
+
+    def nearest(self, lat, lng, k=1):
+        """Positions of the ``k`` points nearest to (lat, lng) and their distances."""
+        k = min(k, len(self.positions))
+        if not k:
+            return self.positions[:0], np.array([])
+        x, y = lng * self.scale_x, lat * METRES_PER_DEGREE
+        ## Distance to the farthest corner of the points' bounding box covers every point
+        reach = np.hypot(max(abs(x - self.x.min()), abs(x - self.x.max())),
+                         max(abs(y - self.y.min()), abs(y - self.y.max())))
+        radius = self.cell_m
+        while True:
+            positions, distances = self.within(lat, lng, min(radius, reach))
+            ## Everything within the radius has been found, so these are the nearest
+            if len(positions) >= k or radius >= reach:
+                return positions[:k], distances[:k]
+            radius *= 2
+
+
+############################## STATION TABLE ############################################
+
+class StationTable:
+    """Station dimension: ``station_key`` (the row position), name, id and median coordinates."""
+
+    def __init__(self, frame=None):
+        if frame is None:
+            frame = pd.DataFrame({'station_key': np.array([], dtype = np.int32),
+                                  'station_name': np.array([], dtype = object),
+                                  'station_id': np.array([], dtype = object),
+                                  'lat': np.array([], dtype = np.float64),
+                                  'lng': np.array([], dtype = np.float64)})
+        self.frame = frame.sort_values('station_key').reset_index(drop = True)
+        if not np.array_equal(self.frame['station_key'].to_numpy(), np.arange(len(self.frame))):
+            raise ValueError('station keys must be 0..n-1')
+        self._index = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def keys(self):
+        """Name -> key dict."""
+        return dict(zip(self.frame['station_name'], self.frame['station_key']))
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = GridIndex(self.frame['lat'].to_numpy(), self.frame['lng'].to_numpy())
+        return self._index
+
+    ############################## BUILD AND STORE ######################################
+
+    def add_names(self, names):
+        """A table with a new key for every name not in it yet, in sorted order."""
+        known = set(self.frame['station_name'])
+        new = sorted(name for name in names if name not in known and isinstance(name, str))
+        if not new:
+            return self
+        added = pd.DataFrame({'station_key': np.arange(len(self), len(self) + len(new), dtype = np.int32),
+                              'station_name': new,
+                              'station_id': None,
+                              'lat': np.nan,
+                              'lng': np.nan})
+        return StationTable(pd.concat([self.frame, added], ignore_index = True))
+
+    def with_partials(self, coords, ids):
+        """A table with ids and coordinates from combined ``station_partials``."""
+        frame = self.frame.copy()
+        for axis in ['lat', 'lng']:
+            counts = coords.loc[coords['axis'] == axis]
+            medians = weighted_medians(counts['station_key'].to_numpy(dtype = np.int64),
+                                       counts['grid'].to_numpy(dtype = np.int64),
+                                       counts['trips'].to_numpy(dtype = np.int64), len(frame))
+            frame[axis] = medians / COORDINATE_SCALE
+        ## Most frequent id of every station
+        ids = ids.sort_values(['station_key', 'trips', 'station_id'], ascending = [True, False, True])
+        ids = ids.drop_duplicates('station_key').set_index('station_key')['station_id']
+        frame['station_id'] = frame['station_key'].map(ids)
+        return StationTable(frame)
+
+    def save(self, root=TRIPS_DIR):
+        os.makedirs(root, exist_ok = True)
+        path = os.path.join(root, STATIONS_NAME)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        frame = self.frame.astype({'station_key': np.int32, 'station_id': object})
+        frame.to_parquet(tmp_path, index = False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, root=TRIPS_DIR):
+        """The station table of the trip store in ``root``; empty when there is none yet."""
+        path = os.path.join(root, STATIONS_NAME)
+        if not os.path.exists(path):
+            return cls()
+        return cls(pd.read_parquet(path))
+
+    ############################## LOOKUPS ##############################################
+
+    def attribute(self, keys, attribute):
+        """``station_name``, ``station_id``, ``lat`` or ``lng`` of every key; missing for -1.
+
+        Names and ids are returned as categoricals that share the table's categories.
+        """
+        keys = np.asarray(keys)
+        if attribute in ('lat', 'lng'):
+            ## A trailing NaN is picked by the -1 keys
+            values = np.append(self.frame[attribute].to_numpy(dtype = np.float32), np.float32(np.nan))
+            return values[keys]
+        if attribute == 'station_name':
+            return pd.Categorical.from_codes(keys, categories = pd.Index(self.frame['station_name']))
+        codes, categories = pd.factorize(self.frame['station_id'])
+        return pd.Categorical.from_codes(np.append(codes, -1)[keys], categories = categories)
+
+    def _stations_at(self, positions, distances):
+        frame = self.frame.iloc[positions].reset_index(drop = True)
+        frame['distance_m'] = distances
+        return frame
+
+    def nearest(self, lat, lng, k=1):
+        """The ``k`` stations nearest to (lat, lng) with their ``distance_m``."""
+        return self._stations_at(*self.index.nearest(lat, lng, k))
+
+    def within(self, lat, lng, radius_m):
+        """Every station within ``radius_m`` metres of (lat, lng), nearest first."""
+        return self._stations_at(*self.index.within(lat, lng, radius_m))
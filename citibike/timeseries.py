@@ -0,0 +1,120 @@
+############################# RIDE AND TEMPERATURE TIME SERIES ##########################
+#########################################################################################
+"""Daily rides and temperature at a level of detail that fits the visible range.
+
+The "Seasonality of Bike Usage" page plots every row of DB_line_chart_data as
+three traces, so the payload grows with every year of history loaded. A
+``TimeSeries`` keeps daily, weekly and monthly roll-ups of the same columns and
+``view`` answers a date range with the finest of them that stays under a point
+budget; if even monthly points exceed it, the series is downsampled with
+Largest-Triangle-Three-Buckets (LTTB), which keeps the peaks and dips a plain
+stride would drop. Rides are summed and temperatures averaged per period, and
+rides are reported per day so every resolution reads on the same axis.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from citibike.data_store import PREPARED_DATASETS, load_derived, load_prepared, prepared_version
+from citibike.paths import PREPARED_DIR
+
+## Most points sent to the browser per trace
+MAX_POINTS = 400
+
+## Roll-ups from finest to coarsest, as pandas period frequencies
+RESOLUTIONS = {'daily': 'D', 'weekly': 'W', 'monthly': 'M'}
+RIDE_COLUMNS = ['Daily Rides', 'Daily Classic Rides']
+TEMPERATURE_COLUMN = 'Average Temperature'
+
+
+############################## DOWNSAMPLING #############################################
+
+def lttb(x, y, threshold):
+    """Indices of the ``threshold`` points LTTB keeps out of ``(x, y)``.
+
+    The first and last points are always kept; every bucket in between keeps the
+    point forming the largest triangle with the previous kept point and the
+    average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype = np.float64)
+    y = np.asarray(y, dtype = np.float64)
+
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    kept = np.empty(threshold, dtype = np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean() if next_end > end else x[-1]
+        next_y = y[end:next_end].mean() if next_end > end else y[-1]
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+
+############################## TIME SERIES ##############################################
+
+class TimeSeries:
+    """Roll-ups of the DB_line_chart_data columns with range queries."""
+
+    def __init__(self, line_chart_data):
+        daily = line_chart_data.assign(Date = pd.to_datetime(line_chart_data['Date'])).set_index('Date').sort_index()
+        self.start = daily.index.min()
+        self.end = daily.index.max()
+        self.rollups = {}
+        for resolution, frequency in RESOLUTIONS.items():
+            periods = daily.index.to_period(frequency)
+            grouped = daily.groupby(periods)
+            frame = grouped[RIDE_COLUMNS].sum().div(grouped.size(), axis = 0).round().astype(np.int64)
+            frame[TEMPERATURE_COLUMN] = grouped[TEMPERATURE_COLUMN].mean().round(1)
+            ## Plot every period at its first day
+            frame.index = frame.index.start_time
+            self.rollups[resolution] = frame.rename_axis('Date')
+        self.version = None
+
+    def resolution_for(self, start=None, end=None, max_points=MAX_POINTS):
+        """Finest resolution with at most ``max_points`` periods between ``start`` and ``end``."""
+        start = self.start if start is None else pd.Timestamp(start)
+        end = self.end if end is None else pd.Timestamp(end)
+        for resolution, frequency in RESOLUTIONS.items():
+            if len(pd.period_range(start, end, freq = frequency)) <= max_points:
+                return resolution
+        return list(RESOLUTIONS)[-1]
+
+    def view(self, start=None, end=None, max_points=MAX_POINTS):
+        """The series between ``start`` and ``end`` (inclusive) in at most ``max_points`` rows.
+
+        Returns the frame, with ``Date`` and the DB_line_chart_data columns, and
+        the name of the resolution used.
+        """
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        resolution = self.resolution_for(start, end, max_points)
+        frame = self.rollups[resolution]
+        if resolution != 'daily' and start is not None:
+            ## Keep the period the range starts in
+            start = start.to_period(RESOLUTIONS[resolution]).start_time
+        frame = frame.loc[start:end]
+        if len(frame) > max_points:
+            kept = lttb(frame.index.asi8, frame[RIDE_COLUMNS[0]].to_numpy(), max_points)
+            frame = frame.iloc[kept]
+        return frame.reset_index(), resolution
+
+
+def load_time_series(folderpath=PREPARED_DIR):
+    """Process-wide ``TimeSeries`` of DB_line_chart_data, rebuilt when the file changes."""
+    path = os.path.join(folderpath, PREPARED_DATASETS['line_chart'][0])
+
+    def build():
+        series = TimeSeries(load_prepared('line_chart', folderpath))
+        series.version = prepared_version('line_chart', folderpath)
+        return series
+    return load_derived(('time_series', os.path.abspath(folderpath)), [path], build)
@@ -0,0 +1,169 @@
+############################# TRIP STORE ################################################
+#########################################################################################
+"""Narrow, filtered reads of the cleaned trip dataset.
+
+The analysis notebooks used to start with ``pd.read_pickle`` on the cleaned
+table, deserializing every column of every trip just to keep three to six of
+them. The trips now live in the year/month partitioned Parquet dataset written
+by ``citibike.ingest``; ``load_trips`` reads only the requested columns and
+pushes date, season and member filters down to the partitions and row groups
+so the rest of the data is never read.
+
+An existing cleaned pickle can be moved into the store with::
+
+    python -m citibike.trip_store Data/Prepared_data/cleaned_nyc_bike_weather_data.pkl
+"""
+
+import argparse
+import functools
+import operator
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+
+from citibike.aggregates import combine_partials, partial_aggregates, read_partials, write_partials
+from citibike.ingest import TRIPS_DIR, attach_station_keys, new_run_id, write_chunk
+from citibike.manifest import MANIFEST_VERSION, collect_garbage, commit_manifest, manifest_parts, read_manifest
+from citibike.schema import TRIP_ARROW_SCHEMA, apply_schema
+from citibike.stations import DIRECTIONS, STATION_COLUMNS, StationTable
+from citibike.transform import SEASON_CODE_BY_MONTH, SEASONS, member_labels, rideable_labels
+from citibike.weather import HOURLY_COLUMNS
+
+## Columns derived on load rather than stored: month comes from the partition, value is constant
+VIRTUAL_COLUMNS = ['month', 'value']
+
+
+def trip_dataset(root=TRIPS_DIR):
+    """The committed trip parts of ``root`` as a ``pyarrow.dataset.Dataset``."""
+    parts = manifest_parts(root)
+    if not parts:
+        raise FileNotFoundError('no committed trip data in %s, run citibike.ingest first' % root)
+    return ds.dataset(parts, format = 'parquet', partitioning = 'hive', partition_base_dir = root)
+
+
+def _months_of(seasons):
+    codes = [SEASONS.index(season) for season in seasons]
+    return [int(month) for month in np.flatnonzero(np.isin(SEASON_CODE_BY_MONTH, codes))]
+
+
+def trip_filter(start=None, end=None, seasons=None, member=None):
+    """Arrow filter expression for a date range, seasons and member status.
+
+    ``start`` and ``end`` are inclusive dates. The year/month terms prune whole
+    partitions; the column terms prune row groups through their statistics.
+    """
+    terms = []
+    if start is not None:
+        start = pd.Timestamp(start).normalize()
+        terms.append((ds.field('year') > start.year)
+                     | ((ds.field('year') == start.year) & (ds.field('month') >= start.month)))
+        terms.append(ds.field('date') >= start.to_datetime64())
+    if end is not None:
+        end = pd.Timestamp(end).normalize()
+        terms.append((ds.field('year') < end.year)
+                     | ((ds.field('year') == end.year) & (ds.field('month') <= end.month)))
+        terms.append(ds.field('date') <= end.to_datetime64())
+    if seasons is not None:
+        seasons = [seasons] if isinstance(seasons, str) else list(seasons)
+        terms.append(ds.field('month').isin(_months_of(seasons)))
+        terms.append(ds.field('season').isin(seasons))
+    if member is not None:
+        members = [member] if isinstance(member, str) else list(member)
+        terms.append(ds.field('member_casual').isin([value.title() for value in members]))
+    return functools.reduce(operator.and_, terms) if terms else None
+
+
+def load_trips(columns=None, start=None, end=None, seasons=None, member=None, root=TRIPS_DIR):
+    """Read the trips matching the filters, with only ``columns``.
+
+    Columns are returned with their ``TRIP_SCHEMA`` dtypes. ``month``,
+    ``value`` and the station names, ids and coordinates may be requested like
+    stored columns; the station columns are looked up from the station keys.
+    """
+    dataset = trip_dataset(root)
+    stored = list(TRIP_ARROW_SCHEMA.names)
+    if columns is None:
+        columns = stored + list(STATION_COLUMNS) + VIRTUAL_COLUMNS
+    unknown = [column for column in columns
+               if column not in stored and column not in STATION_COLUMNS and column not in VIRTUAL_COLUMNS]
+    if unknown:
+        raise KeyError('unknown trip columns: %s' % ', '.join(unknown))
+
+    read = [column for column in columns if column in stored]
+    for column in columns:
+        key_column = '%s_station_key' % STATION_COLUMNS[column][0] if column in STATION_COLUMNS else None
+        if key_column and key_column not in read:
+            read.append(key_column)
+    if 'month' in columns:
+        read.append('month')
+    table = dataset.to_table(columns = read, filter = trip_filter(start, end, seasons, member))
+    df = table.to_pandas()
+    if 'value' in columns:
+        df['value'] = np.int8(1)
+
+    station_columns = [column for column in columns if column in STATION_COLUMNS]
+    if station_columns:
+        stations = StationTable.load(root)
+        for column in station_columns:
+            direction, attribute = STATION_COLUMNS[column]
+            df[column] = stations.attribute(df['%s_station_key' % direction].to_numpy(), attribute)
+    return apply_schema(df[list(columns)])
+
+
+############################## CONVERSION ###############################################
+
+def store_trips(df, key, root=TRIPS_DIR, chunksize=1_000_000):
+    """Write a cleaned trip frame into the store as the source ``key`` and commit it."""
+    if read_manifest(root).get('version') != MANIFEST_VERSION:
+        raise ValueError('%s holds trips in an older layout, run citibike.ingest first' % root)
+    prefix = '%s-%s' % (key, new_run_id())
+    df = apply_schema(df.loc[:, [column for column in TRIP_ARROW_SCHEMA.names + list(STATION_COLUMNS) if column in df]])
+    for column in HOURLY_COLUMNS:
+        if column not in df:
+            df[column] = np.float32(np.nan)
+    df['member_casual'] = member_labels(df['member_casual'])
+    df['rideable_type'] = rideable_labels(df['rideable_type'])
+
+    names = set()
+    for direction in DIRECTIONS:
+        names.update(df['%s_station_name' % direction].dropna().unique())
+    stations = StationTable.load(root).add_names(names)
+    stations.save(root)
+    df = attach_station_keys(df, stations.keys)
+
+    written = []
+    partials = []
+    for chunk_number, start in enumerate(range(0, len(df), chunksize)):
+        chunk = df.iloc[start:start + chunksize]
+        partials.append(partial_aggregates(chunk))
+        written += write_chunk(chunk.loc[:, list(TRIP_ARROW_SCHEMA.names)], root, prefix, chunk_number)
+
+    manifest = read_manifest(root)
+    manifest['sources'][key] = {'path': key,
+                                'rows': len(df),
+                                'parts': written,
+                                'aggregates': write_partials(combine_partials(partials), root, prefix)}
+    commit_manifest(root, manifest)
+    collect_garbage(root, manifest)
+
+    combined = read_partials(root, manifest)
+    stations.with_partials(combined['station_coords'], combined['station_ids']).save(root)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Move a cleaned trip pickle into the partitioned trip store.')
+    parser.add_argument('path', help = 'pickled cleaned trip DataFrame')
+    parser.add_argument('--dest', default = TRIPS_DIR, help = 'trip store folder')
+    args = parser.parse_args(argv)
+
+    df = pd.read_pickle(args.path)
+    key = os.path.splitext(os.path.basename(args.path))[0]
+    parts = store_trips(df, key, args.dest)
+    print('Stored %s trips in %d part files under %s' % (format(len(df), ','), len(parts), args.dest))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+############################# WEATHER OBSERVATIONS ######################################
+#########################################################################################
+"""Daily and hourly weather observations for the trip join.
+
+"2.2 Sourcing Data with an API" makes one request to the NOAA Climate Data
+Online API with ``limit=1000``, a hard-coded 2022 range and an inline token,
+which cannot cover several years or stations and needs the network on every
+run. Here a provider fetches observations (``NOAAProvider`` pages through the
+API a year at a time; ``LocalFileProvider`` reads a CSV for machines without
+network access) and ``WeatherCache`` keeps every (station, date) it has seen
+in one Parquet file, so each day is fetched once. Days the provider has no
+observation for are cached as missing and only asked for again while they
+are within ``MISSING_GRACE_DAYS`` of today, as NOAA publishes with a lag.
+
+Hourly observations (``HourlyWeather``) are joined to each trip as of its
+``started_at`` rather than by calendar date.
+
+Fill the cache before ingesting, then ingest with ``--weather-station``::
+
+    NOAA_TOKEN=... python -m citibike.weather --start 2022-01-01 --end 2022-12-31
+    python -m citibike.weather --start 2022-01-01 --end 2022-12-31 --file Data/Prepared_data/nyc_weather_daily.csv
+"""
+
+import abc
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from citibike.paths import PREPARED_DIR
+
+WEATHER_DIR = os.path.join(PREPARED_DIR, 'weather')
+DAILY_CACHE_FILE = os.path.join(WEATHER_DIR, 'daily.parquet')
+## New York City, Central Park is USW00094728; the notebooks use LaGuardia Airport
+DEFAULT_STATION = 'GHCND:USW00014732'
+
+NOAA_URL = 'https://www.ncei.noaa.gov/cdo-web/api/v2/data'
+NOAA_TOKEN_ENV = 'NOAA_TOKEN'
+## NOAA datatype -> column, in degrees Celsius with units=metric
+DAILY_ELEMENTS = {'TAVG': 'avgTemp'}
+DAILY_COLUMNS = ['station', 'date'] + list(DAILY_ELEMENTS.values())
+## Hourly temperature (C) and precipitation (mm) joined to every trip at its start time
+HOURLY_COLUMNS = ['hourlyTemp', 'hourlyPrcp']
+HOURLY_MAX_GAP = '3h'
+## NOAA publishes observations with a lag; missing days more recent than this are fetched again
+MISSING_GRACE_DAYS = 30
+
+
+def _daily_frame(dates, values):
+    """Observations on ``dates`` as a frame with the ``DAILY_ELEMENTS`` columns."""
+    frame = pd.DataFrame({'date': pd.DatetimeIndex(pd.to_datetime(dates)).normalize().astype('datetime64[ns]')})
+    for column in DAILY_ELEMENTS.values():
+        frame[column] = np.asarray(values[column], dtype = np.float32)
+    return frame
+
+
+############################## PROVIDERS ################################################
+
+class WeatherProvider(abc.ABC):
+    """Source of daily observations; subclasses implement ``fetch_daily``."""
+
+    @abc.abstractmethod
+    def fetch_daily(self, station, start, end):
+        """Observations of ``station`` from ``start`` to ``end`` (inclusive) as a frame with
+        ``date`` and the ``DAILY_ELEMENTS`` columns; days without an observation may be absent.
+        """
+
+
+class NOAAProvider(WeatherProvider):
+    """The NOAA Climate Data Online API, GHCND dataset.
+
+    The token comes from the ``NOAA_TOKEN`` environment variable unless given.
+    Requests are paged ``page_size`` results at a time, one year at most per
+    request as the API requires, and spaced to stay under its five requests a
+    second.
+    """
+
+    def __init__(self, token=None, page_size=1000, min_interval=0.25, timeout=60):
+        self.token = token or os.environ.get(NOAA_TOKEN_ENV)
+        if not self.token:
+            raise ValueError('no NOAA token: set %s or pass token' % NOAA_TOKEN_ENV)
+        self.page_size = page_size
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self._last_request = 0.0
+
+    def _get(self, params):
+        import requests
+
+        wait = self._last_request + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+        response = requests.get(NOAA_URL, params = params, headers = {'token': self.token}, timeout = self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_pages(self, station, start, end, datatypes):
+        """Every result record between ``start`` and ``end``, one page request at a time."""
+        records = []
+        for year_start in pd.date_range(pd.Timestamp(start).to_period('Y').start_time, end, freq = 'YS'):
+            window_start = max(pd.Timestamp(start), year_start)
+            window_end = min(pd.Timestamp(end), year_start + pd.offsets.YearEnd(0))
+            offset = 1
+            while True:
+                page = self._get({'datasetid': 'GHCND', 'stationid': station, 'datatypeid': ','.join(datatypes),
+                                  'startdate': window_start.strftime('%Y-%m-%d'),
+                                  'enddate': window_end.strftime('%Y-%m-%d'),
+                                  'units': 'metric', 'limit': self.page_size, 'offset': offset})
+                results = page.get('results', [])
+                records += results
+                count = page.get('metadata', {}).get('resultset', {}).get('count', 0)
+                offset += len(results)
+                if not results or offset > count:
+                    break
+        return records
+
+    def fetch_daily(self, station, start, end):
+        records = pd.DataFrame.from_records(self.fetch_pages(station, start, end, list(DAILY_ELEMENTS)),
+                                            columns = ['date', 'datatype', 'value'])
+        values = records.pivot_table(index = 'date', columns = 'datatype', values = 'value', aggfunc = 'first')
+        values = values.reindex(columns = list(DAILY_ELEMENTS)).rename(columns = DAILY_ELEMENTS)
+        return _daily_frame(values.index, values)
+
+
+class LocalFileProvider(WeatherProvider):
+    """A daily weather CSV with ``date`` and the ``DAILY_ELEMENTS`` columns, such as
+    nyc_weather_daily.csv; an optional ``station`` column selects the station's rows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._frame = None
+
+    def fetch_daily(self, station, start, end):
+        if self._frame is None:
+            frame = pd.read_csv(self.path)
+            frame['date'] = pd.to_datetime(frame['date']).dt.normalize()
+            self._frame = frame
+        frame = self._frame
+        if 'station' in frame:
+            frame = frame.loc[frame['station'] == station]
+        frame = frame.loc[frame['date'].between(pd.Timestamp(start), pd.Timestamp(end))]
+        frame = frame.drop_duplicates('date')
+        return _daily_frame(frame['date'], frame)
+
+
+############################## CACHE ####################################################
+
+class WeatherCache:
+    """Daily observations keyed by (station, date) in one Parquet file.
+
+    A row with missing values records a day the provider had no observation
+    for, so the day is not requested again once it is older than
+    ``MISSING_GRACE_DAYS``.
+    """
+
+    def __init__(self, path=DAILY_CACHE_FILE):
+        self.path = path
+        if os.path.exists(path):
+            self.frame = pd.read_parquet(path).astype({'station': object})
+        else:
+            self.frame = pd.DataFrame({'station': pd.Series(dtype = object),
+                                       'date': pd.Series(dtype = 'datetime64[ns]')})
+            for column in DAILY_ELEMENTS.values():
+                self.frame[column] = pd.Series(dtype = np.float32)
+
+    def missing_spans(self, station, start, end, today=None):
+        """Runs of consecutive days between ``start`` and ``end`` to fetch, as (first, last) pairs.
+
+        These are the days not cached, and the days cached without an
+        observation within ``MISSING_GRACE_DAYS`` of ``today``.
+        """
+        days = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())
+        recent = pd.Timestamp(today).normalize() if today is not None else pd.Timestamp.now().normalize()
+        recent -= pd.Timedelta(days = MISSING_GRACE_DAYS)
+        rows = self.frame.loc[self.frame['station'] == station]
+        observed = rows[list(DAILY_ELEMENTS.values())].notna().any(axis = 1)
+        cached = rows.loc[observed | (rows['date'] < recent), 'date']
+        missing = days[~days.isin(cached)]
+        if not len(missing):
+            return []
+        ## A new run starts wherever the gap to the previous missing day is more than one day
+        breaks = np.flatnonzero(np.diff(missing.values.astype('datetime64[D]').astype(np.int64)) != 1) + 1
+        return [(run[0], run[-1]) for run in np.split(missing, breaks)]
+
+    def update(self, station, start, end, observations):
+        """Store the observations of ``station`` for every day from ``start`` to ``end``."""
+        days = pd.DataFrame({'date': pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize())})
+        observations = observations.astype({'date': 'datetime64[ns]'}).drop_duplicates('date')
+        rows = days.astype({'date': 'datetime64[ns]'}).merge(observations, on = 'date', how = 'left')
+        rows.insert(0, 'station', station)
+        frame = pd.concat([self.frame, rows[DAILY_COLUMNS]], ignore_index = True)
+        self.frame = (frame.drop_duplicates(['station', 'date'], keep = 'last')
+                      .sort_values(['station', 'date']).reset_index(drop = True))
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        self.frame.astype({'station': 'category'}).to_parquet(tmp_path, index = False)
+        os.replace(tmp_path, self.path)
+
+    def fill(self, provider, station, start, end, today=None):
+        """Fetch the days between ``start`` and ``end`` the cache lacks; returns the number of days fetched."""
+        fetched = 0
+        for first, last in self.missing_spans(station, start, end, today):
+            self.update(station, first, last, provider.fetch_daily(station, first, last))
+            fetched += (last - first).days + 1
+        if fetched:
+            self.save()
+        return fetched
+
+    def daily(self, station=DEFAULT_STATION, column='avgTemp'):
+        """Cached observations of ``station`` as a date-indexed series, like ``citibike.ingest.read_weather``."""
+        frame = self.frame.loc[(self.frame['station'] == station) & self.frame[column].notna()]
+        return frame.set_index('date')[column].astype('float32').rename_axis('date')
+
+
+def cached_daily_weather(station=DEFAULT_STATION, start=None, end=None, provider=None, path=DAILY_CACHE_FILE):
+    """Daily average temperature of ``station`` from the cache, first fetching missing days
+    between ``start`` and ``end`` from ``provider`` when one is given.
+    """
+    cache = WeatherCache(path)
+    if provider is not None and start is not None and end is not None:
+        cache.fill(provider, station, start, end)
+    return cache.daily(station)
+
+
+############################## JOIN #####################################################
+
+def lookup_daily(dates, weather):
+    """Value of the date-indexed ``weather`` series for each of ``dates``, NaN where it has none.
+
+    The series is laid out as a dense array over its day range, so every date
+    is found by its day offset instead of a hash lookup.
+    """
+    day = np.int64(pd.Timedelta(days = 1).value)
+    ## NaT is the smallest int64, so it lands before the range like any unknown day
+    dates = np.asarray(dates, dtype = 'datetime64[ns]').view(np.int64)
+    result = np.full(len(dates), np.nan, dtype = np.float32)
+    if not len(weather):
+        return result
+    days = np.asarray(weather.index.values, dtype = 'datetime64[ns]').view(np.int64) // day
+    first = days.min()
+    dense = np.full(days.max() - first + 1, np.nan, dtype = np.float32)
+    dense[days - first] = weather.to_numpy(dtype = np.float32)
+    offsets = dates // day - first
+    valid = (offsets >= 0) & (offsets < len(dense))
+    result[valid] = dense[offsets[valid]]
+    return result
+
+
+class HourlyWeather:
+    """Hourly observations sorted by time, joined to trips as of their start.
+
+    Each trip gets the latest observation at or before its ``started_at``,
+    found with one ``np.searchsorted`` over the observation times, so a chunk
+    of trips costs O(n log m) with no sort or merge of the trips. Observations
+    older than ``max_gap`` count as missing.
+    """
+
+    def __init__(self, times, values, max_gap=HOURLY_MAX_GAP):
+        times = np.asarray(times, dtype = 'datetime64[ns]')
+        keep = ~np.isnat(times)
+        order = np.argsort(times[keep], kind = 'stable')
+        self.times = times[keep][order].view(np.int64)
+        self.values = {column: np.asarray(values[column], dtype = np.float32)[keep][order]
+                       for column in HOURLY_COLUMNS}
+        self.max_gap = pd.Timedelta(max_gap).value
+
+    @classmethod
+    def read_csv(cls, path, max_gap=HOURLY_MAX_GAP):
+        """A CSV with ``time`` and the ``HOURLY_COLUMNS`` columns, e.g. NOAA LCD observations."""
+        frame = pd.read_csv(path, usecols = ['time'] + HOURLY_COLUMNS)
+        return cls(pd.to_datetime(frame['time'], errors = 'coerce'), frame, max_gap)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def digest(self):
+        """SHA-256 of the observations and gap, recorded by ingestion to spot a changed source."""
+        digest = hashlib.sha256(self.times.tobytes())
+        for column in HOURLY_COLUMNS:
+            digest.update(self.values[column].tobytes())
+        digest.update(str(self.max_gap).encode())
+        return digest.hexdigest()
+
+    def lookup(self, times):
+        """The ``HOURLY_COLUMNS`` values as of each of ``times``, NaN where no observation is recent enough."""
+        times = np.asarray(times, dtype = 'datetime64[ns]').view(np.int64)
+        ## Index of the last observation at or before each time; -1 when there is none
+        position = np.searchsorted(self.times, times, side = 'right') - 1
+        found = position >= 0
+        found[found] &= times[found] - self.times[position[found]] <= self.max_gap
+        ## NaT is the smallest int64 and never finds an observation
+        result = {}
+        for column in HOURLY_COLUMNS:
+            values = np.full(len(times), np.nan, dtype = np.float32)
+            values[found] = self.values[column][position[found]]
+            result[column] = values
+        return result
+
+
+############################## COMMAND LINE #############################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description = 'Fill the daily weather cache from NOAA or a local file.')
+    parser.add_argument('--start', required = True, help = 'first day, YYYY-MM-DD')
+    parser.add_argument('--end', required = True, help = 'last day, YYYY-MM-DD')
+    parser.add_argument('--station', default = DEFAULT_STATION, help = 'GHCND station id')
+    parser.add_argument('--file', default = None, help = 'read this CSV instead of calling the NOAA API')
+    parser.add_argument('--cache', default = DAILY_CACHE_FILE, help = 'cache Parquet file')
+    args = parser.parse_args(argv)
+
+    provider = LocalFileProvider(args.file) if args.file else NOAAProvider()
+    cache = WeatherCache(args.cache)
+    fetched = cache.fill(provider, args.station, args.start, args.end)
+    observed = cache.daily(args.station).loc[args.start:args.end]
+    print('Fetched %d days; %d days with observations for %s cached in %s'
+          % (fetched, len(observed), args.station, args.cache))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+"""Pages of the Citi Bike dashboard.
+
+``Citibike_Dashboard.py`` imports only the module of the page selected in the
+sidebar, so each rerun pays for the libraries and prepared data that page
+renders and nothing else. A page loads its data through the process-wide
+caches of ``citibike.data_store``, so the data is read once and then shared
+by every rerun and session. Every module exposes ``render()``.
+"""
+
+## Sidebar label -> module of this package
+PAGES = {'Intro Page': 'intro',
+         'Seasonality of Bike Usage': 'seasonality',
+         'Most Popular Stations': 'popular_stations',
+         'Map of Aggregated Bike Trips': 'trip_map',
+         'User Behavior Analysis': 'user_behavior',
+         'Distribution Imbalance': 'distribution',
+         'Recommendations': 'recommendations'}
@@ -0,0 +1,81 @@
+############################# DISTRIBUTION IMBALANCE ####################################
+#########################################################################################
+"""Stations that gain or lose bikes over the year."""
+
+import numpy as np
+import plotly.graph_objects as go
+import streamlit as st
+from numerize.numerize import numerize
+
+from citibike.figure_cache import cached_figure
+from citibike.imbalance import load_net_flow
+from citibike.instrumentation import span
+from dashboard.settings import accent, colors, folderpath
+
+
+def render():
+    st.title("Stations That Gain or Lose Bikes")
+
+    try:
+        with span('load'):
+            net_flow = load_net_flow(folderpath)
+    except FileNotFoundError:
+        net_flow = None
+        st.info("The net flow counts have not been prepared yet: run `python -m citibike.imbalance` after ingesting the trips.")
+
+    if net_flow is not None:
+        with st.sidebar:
+         rank_by = st.radio('Rank stations by', ['Net flow', 'Drift range'])
+         ## Worst 20 stations, most imbalanced first
+         with span('filter'):
+             imbalance = net_flow.ranking(20, by = 'net' if rank_by == 'Net flow' else 'drift')
+         st.metric(label = 'Bikes to move (top 20)', value = numerize(float(imbalance['drift_range'].sum())))
+
+        ## Net flow bar chart: arrivals minus departures, coloured by sign
+        def build_net_fig():
+            net_fig = go.Figure(go.Bar(x = imbalance['station'],
+                                       y = imbalance['net'],
+                                       marker_color = np.where(imbalance['net'] >= 0, colors[0], accent),
+                                       customdata = imbalance[['arrivals', 'departures']],
+                                       hovertemplate = 'Arrivals: %{customdata[0]}<br>Departures: %{customdata[1]}'
+                                                       '<br>Net: %{y}<extra></extra>'))
+
+            net_fig.update_layout(
+                xaxis_title = dict(text = '<b>Stations</b>',
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                yaxis_title = dict(text = '<b>Arrivals - Departures</b>',
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                xaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                yaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                width = 900, height = 600
+            )
+            net_fig.update_xaxes(automargin = True)
+            return net_fig
+
+        ## Drift of the five worst stations: bikes gained or lost since the first day
+        def build_drift_fig():
+            drift = net_flow.drift(imbalance['station'].head(5))
+            drift_fig = go.Figure()
+            for station in drift.columns:
+                drift_fig.add_trace(go.Scatter(x = drift.index, y = drift[station], name = station, mode = 'lines'))
+
+            drift_fig.update_layout(
+                xaxis_title = dict(text = '<b>Date</b>',
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                yaxis_title = dict(text = '<b>Cumulative Net Flow</b>',
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                xaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                yaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                legend_title_text = '',
+                width = 900, height = 500
+            )
+            return drift_fig
+
+        net_fig = cached_figure('Distribution Imbalance: net', net_flow.version, {'by': rank_by}, build_net_fig)
+        with span('chart'):
+            st.plotly_chart(net_fig, use_container_width = True)
+        drift_fig = cached_figure('Distribution Imbalance: drift', net_flow.version, {'by': rank_by}, build_drift_fig)
+        with span('chart'):
+            st.plotly_chart(drift_fig, use_container_width = True)
+
+        st.markdown("Blue stations receive more bikes than they send out and fill up; red stations are emptied over time. The drift range is the number of bikes a station would need moved to never run empty or full over the period.")
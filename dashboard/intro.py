@@ -0,0 +1,57 @@
+############################# INTRO PAGE ################################################
+#########################################################################################
+"""Intro page: what the dashboard covers, with no data to load."""
+
+import os
+
+import streamlit as st
+from PIL import Image
+
+from dashboard.settings import picturepath
+
+
+def render():
+    st.markdown(
+    "*Since its launch in 2013, Citi Bike has surged in popularity, with demand skyrocketing during the COVID-19 pandemic. However, this growth has led to distribution challenges, where some stations experience shortages while others are overcrowded.*")
+    st.markdown("🚴 This dashboard helps explore:")
+    st.markdown("✔ *Seasonal demand trends*")
+    st.markdown("✔ *Most frequently used stations* ")
+    st.markdown("✔ *Common bike routes and distribution issues* ")
+    st.markdown("✔ *Actionable recommendations for improvement* ")
+    st.markdown("Use the sidebar to explore! 📊")
+
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        with st.expander('🌦️ Weather & Bike Usage'):
+            st.markdown("- Is demand seasonal?")
+            st.markdown("- Which bike type (Classic/Electric) is preferred?")
+        with st.expander('📍 Most Popular Stations'):
+            st.write(
+                '''What are the most-used starting and ending stations?''')
+            st.write(
+                '''Is there a difference between where trips begin and end?''')
+            st.write(
+                '''Do users favor different bike types at different locations?''')
+        with st.expander('🗺️ Interactive Map with Aggregated Bike Trips'):
+            st.write(
+                '''Where are the top 20 busiest stations?''')
+            st.write(
+                '''What are the most common routes?''')
+        with st.expander('🚦 Addressing Distribution Issues'):
+            st.write(
+                '''Where do imbalances occur?''')
+            st.write(
+                '''What’s causing these problems?''')
+            st.write(
+                '''How can we optimize the system to prevent shortages?''')
+        st.text("")
+    st.markdown(
+        """ To see more about these different aspects of the analysis, click on the drop down menu in the left sidebar
+"""
+    )
+       
+    with col2:
+        myImage = Image.open(os.path.join(picturepath, 'Citibike_Dashboard.jpg')) 
+        #source: https://www.freepik.com/free-vector/happy-young-family-riding-bikes-park_7416563.htm#fromView=search&page=1&position=30&uuid=f1e4be12-be3f-43c3-9cf6-13f8f06ce3de&query=citibike
+        st.image(myImage)
@@ -0,0 +1,152 @@
+############################# MOST POPULAR STATIONS #####################################
+#########################################################################################
+"""Top 20 start and end stations for the selected seasons."""
+
+import plotly.express as px
+import plotly.graph_objects as go
+import streamlit as st
+from numerize.numerize import numerize
+
+from citibike.figure_cache import cached_figure
+from citibike.instrumentation import span
+from citibike.station_rank import load_station_ranking
+from dashboard.settings import colors, folderpath
+
+
+def render():
+    with span('load'):
+        station_ranking = load_station_ranking(folderpath)
+
+    st.title("Top 20 Most Popular Citi Bike Stations in New York")
+
+    ################## START/END TOGGLE #####################
+    myKey = 'my_key'
+    if myKey not in st.session_state:
+        st.session_state[myKey] = False
+    
+    ####################### BAR CHARTS #######################
+    if st.session_state[myKey]:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            pass
+        with col3:
+            pass
+        with col2:
+            myBtn = st.button('Click to see Starting Stations', use_container_width=True)
+            st.session_state[myKey] = False
+        
+        with st.sidebar:
+         season_filter = st.multiselect(label= 'Select the season', options=station_ranking.seasons,
+         default= station_ranking.seasons)
+         ## Top 20 for the selected seasons, already ordered by their total
+         with span('filter'):
+             df1 = station_ranking.top('end', season_filter, n = 20)
+         total_rides = float(df1['Total'].sum())    
+         st.metric(label = 'Total Bike Rides', value= numerize(total_rides))
+
+        ## Ending Stations Bar Chart
+        def build_bar_end_fig():
+            bar_end_fig = go.Figure(px.bar(df1,
+                                           x = 'end_station_name', 
+                                           y = 'Total', 
+                                           color = 'rideable_type',
+                                           barmode = 'stack',
+                                           color_discrete_sequence = colors))
+
+            ## Formatting axes and titles
+            bar_end_fig.update_layout(
+                xaxis_title = dict(text = '<b>End Stations</b>', 
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                yaxis_title = dict(text = '<b>Total Trips</b>', 
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                xaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                yaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                legend_title_text = '',
+                legend = dict(yanchor = 'top',
+                              y = 0.95,
+                              xanchor = 'right',
+                              x = 0.95,
+                              font = dict(size = 16)
+                             ),
+                width = 900, height = 600
+            )
+
+            bar_end_fig.update_xaxes(
+                automargin = True 
+            )
+            return bar_end_fig
+
+        bar_end_fig = cached_figure('Most Popular Stations: end',
+                                    station_ranking.version, {'seasons': set(season_filter)}, build_bar_end_fig)
+        with span('chart'):
+            st.plotly_chart(bar_end_fig, use_container_width = True)
+        
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            pass
+        with col3:
+            pass
+        with col2:
+            myBtn = st.button('Click to see Ending Stations', use_container_width=True)
+            st.session_state[myKey] = True
+        
+        with st.sidebar:
+         season_filter = st.multiselect(label= 'Select the season', options=station_ranking.seasons,
+         default= station_ranking.seasons)
+         ## Top 20 for the selected seasons, already ordered by their total
+         with span('filter'):
+             df2 = station_ranking.top('start', season_filter, n = 20)
+         total_rides = float(df2['Total'].sum())    
+         st.metric(label = 'Total Bike Rides', value= numerize(total_rides))
+
+        ## Starting Stations Bar Chart
+        def build_bar_start_fig():
+            bar_start_fig = go.Figure(px.bar(df2,
+                                             x = 'start_station_name', 
+                                             y = 'Total', 
+                                             color = 'rideable_type',
+                                             barmode = 'stack',
+                                             color_discrete_sequence = colors))
+
+            ## Formatting axes and titles
+            bar_start_fig.update_layout(
+                xaxis_title = dict(text = '<b>Start Stations</b>', 
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                yaxis_title = dict(text = '<b>Total Trips</b>', 
+                                   font = dict(size = 22, color = '#2B4B8D')),
+                xaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                yaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                legend_title_text = '',
+                legend = dict(yanchor = 'top',
+                              y = 0.95,
+                              xanchor = 'right',
+                              x = 0.95,
+                              font = dict(size = 16)
+                             ),
+                width = 900, height = 600
+            )
+
+            bar_start_fig.update_xaxes(
+            automargin = True 
+            )
+            return bar_start_fig
+
+        bar_start_fig = cached_figure('Most Popular Stations: start',
+                                      station_ranking.version, {'seasons': set(season_filter)}, build_bar_start_fig)
+        with span('chart'):
+            st.plotly_chart(bar_start_fig, use_container_width = True)
+
+
+    ####################### ANALYSIS #######################
+    st.markdown(
+    """
+    The station at W 21 St & 6 Ave stands out as the most frequented starting and ending point for Citi Bike trips. 
+    Interestingly, all of the top 20 stations are located in Manhattan, despite it being the third most populous borough in New York City. 
+    This suggests that the popularity of Citi Bike stations isn’t necessarily tied to population density.
+
+    With the exception of one station, the most popular starting stations also happen to be the most popular ending stations, 
+    which might point to commuters being a primary user group. However, the concentration of popular stations near major tourist attractions—such as Central Park, Washington Square Park, etc—suggests 
+    that tourism is a key driver of demand. These stations likely see high traffic due to their proximity to iconic New York destinations.
+    """
+    )
@@ -0,0 +1,119 @@
+############################# RECOMMENDATIONS ###########################################
+#########################################################################################
+"""Recommendations drawn from every page, with no data to load."""
+
+import os
+
+import streamlit as st
+from PIL import Image
+
+from dashboard.settings import picturepath
+
+
+def render():
+    st.markdown("## Recommendations")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        myImage2 = Image.open(os.path.join(picturepath,'Citibike_Dashboard.jpg')) 
+        #source: https://www.freepik.com/free-vector/happy-young-family-riding-bikes-park_7416563.htm#fromView=search&page=1&position=30&uuid=f1e4be12-be3f-43c3-9cf6-13f8f06ce3de&query=citibike
+        st.image(myImage2)
+
+        
+    with col2:
+        st.text("")
+        myImage3 = Image.open(os.path.join(picturepath,'Citibike_Dashboard3.jpg')) 
+        #source: https://www.freepik.com/free-vector/businessman-holding-pencil-big-complete-checklist-with-tick-marks_11879344.htm#fromView=search&page=1&position=0&uuid=a12ba572-a4bc-4cfe-afcf-7910198d9cd3&query=recommendations
+        st.image(myImage3)
+            
+    st.text("")
+   
+
+    # Weather and Bike Usage Section
+    st.header("🌦️ Weather & Bike Usage")
+    st.markdown("""
+    **Seasonal Demand:**
+     - Peak usage occurs in spring and summer (March–August).
+     - Usage declines sharply in winter months (December–February).
+     - Electric bike usage increases in summer, despite potential battery heat issues.
+
+    **Actionable Insights:**
+      1. Increase bike availability during high-demand months (March–August).
+      2. Offer winter discounts to boost off-season ridership.
+      3. Monitor electric bike batteries during extreme temperatures.
+    """)
+
+     # Bike Type Preference
+    st.header("🚲 Bike Type Preference")
+    st.markdown("""
+    **Observations:**
+      - Electric bikes dominate usage, year-round, suggestion their convenience and efficency appeal to both members and casual users.
+      - Usage of eletric bikes still sees a noticeable increase in summer, likely due to higher tourism and longer trips.
+
+    **Recommendations:**
+      1. Expand the fleet of electric bikes to meet growing demand.
+      2. Monitor battery performance, especially in extreme weather conditions(both heat in summer and cold in winter).
+      3. Highlight the benefits of electric bikes in marketing campaigns to further encourage adoption by casual and new riders.
+     """)
+
+     # Most Popular Stations
+    st.header("📍 Most Popular Stations")
+    st.markdown("""
+                **Insights:**
+  - The busiest station is W 21 St & 6 Ave.
+  - All top 20 stations are located in Manhattan, particularly near tourist attractions like Central Park and Washington Square Park.
+  - Starting and ending stations overlap, indicating commuter-driven usage.
+                **Recommendations:**
+  1. Optimize bike inventory near high-traffic stations.
+  2. Reduce congestion at popular stations by incentivizing trips to lesser-used docks.
+""")
+
+    # Interactive Map Insights
+    st.header("🗺️ Interactive Map Insights")
+    st.markdown("""
+- *Top 20 Busiest Stations:* Concentrated in Midtown and Lower Manhattan.
+- *Most Common Routes:* Short trips dominate in commercial hubs, while cross-borough routes see longer trips.
+
+**Recommendations:**
+  1. Improve docking availability in Midtown and Lower Manhattan.
+  2. Offer route-based promotions for tourists and casual riders.
+""")
+
+    # Addressing Distribution Issues
+    st.header("🔄 Addressing Distribution Issues")
+    st.markdown("""
+**Challenges:**
+  - Dock shortages occur at high-traffic stations during peak hours.
+  - Cross-borough trips create imbalances, as bikes move from Brooklyn to Manhattan.
+
+**Optimization Strategies:**
+  1. Use predictive analytics to redistribute bikes proactively.
+  2. Deploy flexible dockless bikes in areas with persistent shortages.
+  3. Incentivize riders to return bikes to underutilized stations.
+""")
+
+    # User Behavior Insights
+    st.header("📊 User Behavior Insights")
+    st.markdown("""
+**Trip Duration:**
+  - Median trip duration for members is *550 seconds, while casual users take longer trips (median: **887 seconds*).
+
+**Membership Breakdown:**
+  - 77.9% of users are members, using bikes for routine commutes.
+  - 22.1% are casual riders, primarily tourists or occasional users.
+
+**Recommendations:**
+  1. Design campaigns to convert casual riders into members.
+  2. Enhance availability at transit hubs for member convenience.
+  3. Offer leisure-friendly packages for tourists.
+""")
+
+    # Closing and Key Takeaways
+    st.header("📌 Key Takeaways")
+    st.markdown("""
+1. Expand bike availability during peak demand periods.
+2. Optimize dock distribution to address imbalances.
+3. Promote electric bike adoption and resolve battery issues.
+4. Offer seasonal promotions to boost engagement.
+5. Use real-time data for continuous operational improvements.
+""")
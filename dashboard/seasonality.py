@@ -0,0 +1,155 @@
+############################# WEATHER COMPONENT AND BIKE USAGE ##########################
+#########################################################################################
+"""Daily rides of both bike types against the average temperature."""
+
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from plotly.subplots import make_subplots
+
+from citibike.figure_cache import cached_figure
+from citibike.instrumentation import span
+from citibike.timeseries import load_time_series
+from dashboard.settings import accent, folderpath
+
+
+def render():
+    with span('load'):
+        time_series = load_time_series(folderpath)
+
+    st.title("Daily Bike Trips and Avergage NYC Temperature")
+    st.subheader("How Does Weather Affect Citi Bike Usage?")
+
+    ####################### LINE CHART #######################
+    with st.sidebar:
+        date_range = st.date_input('Select the date range',
+                                   value = (time_series.start.date(), time_series.end.date()),
+                                   min_value = time_series.start.date(),
+                                   max_value = time_series.end.date())
+    ## Only the start is set while the range is being picked
+    start_date = date_range[0]
+    end_date = date_range[1] if len(date_range) > 1 else time_series.end.date()
+
+    ## Daily, weekly or monthly points, whichever keeps the range under the point budget
+    with span('filter'):
+        line_chart_data, resolution = time_series.view(start_date, end_date)
+
+    def build_line_fig():
+        line_fig = make_subplots(specs = [[{"secondary_y": True}]])
+
+        ## Electric bike rides area chart
+        line_fig.add_trace(go.Scatter(x = line_chart_data['Date'], 
+                                      y = line_chart_data['Daily Rides'], 
+                                      fill = 'tozeroy', #fill down to xaxis
+                                      fillcolor = 'rgba(56, 129, 181, 0.8)',
+                                      mode = 'lines',
+                                      line = {'color': '#3881B5'},
+                                      name = 'Electric Bikes'),
+                            secondary_y = False)
+
+        ## Classic bike rides area chart
+        line_fig.add_trace(go.Scatter(x = line_chart_data['Date'], 
+                                      y = line_chart_data['Daily Classic Rides'], 
+                                      fill = 'tozeroy', #fill down to xaxis
+                                      fillcolor = 'rgba(43, 75, 141, 0.8)',
+                                      mode = 'lines',
+                                      line = {'color': '#2B4B8D'},
+                                      name = 'Classic Bikes'),
+                           secondary_y = False)
+
+        ## Average temperature line chart
+        line_fig.add_trace(
+        go.Scatter(x = line_chart_data['Date'], 
+                   y = line_chart_data['Average Temperature'], 
+                   name = '',
+                   showlegend = False,
+                   marker={'color': line_chart_data['Average Temperature'],'color': accent}),
+        secondary_y = True
+        )
+
+        ## Formatting axes and titles
+        line_fig.update_layout(
+            xaxis_title = '',
+            yaxis1_title = dict(text = '<b>Bike Rides Daily</b>', 
+                                font = dict(size = 22, color = '#2B4B8D')),
+            yaxis2_title = dict(text = '<b>Average Temperature (in C)</b>', 
+                                font = dict(size = 22, color = accent)),
+            xaxis = dict(showgrid = False,
+                         range = [line_chart_data['Date'].min(), pd.Timestamp(end_date) + pd.Timedelta(days = 1)],
+                         tickfont = dict(size = 16, color = '#2B4B8D')),
+            yaxis1 = dict(showgrid = False,
+                          tickfont = dict(size = 14, color = '#2B4B8D'),
+                          color = '#323232'),
+            yaxis2 = dict(showgrid = False,
+                          zeroline = False,
+                          tickfont = dict(size = 14, color = '#2B4B8D'),
+                          color = '#323232'),
+            showlegend = True,
+            legend = dict(yanchor = 'top',
+                          y = 0.95,
+                          xanchor = 'left',
+                          x = 0.05,
+                          font = dict(size = 16)
+                         ),
+            margin = dict(pad = 10),
+            width = 900, height = 500
+        )
+
+        line_fig.update_yaxes(
+            automargin = True
+        )
+        return line_fig
+
+    line_fig = cached_figure('Seasonality of Bike Usage',
+                             time_series.version, {'start': start_date, 'end': end_date}, build_line_fig)
+    with span('chart'):
+        st.plotly_chart(line_fig, use_container_width=True)
+    if resolution != 'daily':
+        st.caption('Showing %s averages of the daily rides and temperature.' % resolution)
+
+
+    ####################### ANALYSIS #######################
+    # Section Header
+    st.markdown("## How Weather Affects Citi Bike Usage 🌡️")
+
+    # Summary of Insights
+    st.markdown(
+    """
+    - **Bike usage is strongly correlated with temperature.** Warmer weather leads to more rides, while colder temperatures see a significant drop in activity.
+    - **Peak ridership occurs in late spring and summer (March–August)** as temperatures rise, encouraging outdoor activity.
+    - **Ridership declines in fall and winter**, with a sharp drop in December as cold weather sets in.
+    - **Bike rentals are not strictly seasonal**—users check daily weather conditions before deciding to ride.
+    """
+    )
+
+    # Key Observations
+    st.markdown("### Key Observations 🚴‍♂️")
+    st.markdown(
+    """
+    - On **September 27th and October 7th**, high temperatures correlated with strong bike rental numbers.
+    - Conversely, when temperatures dropped to **10.3°C**, bike rentals also declined significantly.
+    - Despite known **heat sensitivity issues with electric bike batteries**, electric bike usage increases significantly in the summer.
+    """
+    )
+
+    # Possible Reasons for Higher Ridership in Warm Weather
+    st.markdown("### Why Do More People Bike in Warm Weather? ☀️")
+    st.markdown(
+    """
+    - **Tourism peaks** in summer, increasing Citi Bike usage by visitors.
+    - **Outdoor exercise is more appealing**, making biking a preferred mode of transportation.
+    - **Subway usage declines** in affluent areas during the summer, suggesting a shift to biking.
+    - **Remote work trends** allow for flexible travel, encouraging bike usage for short local trips.
+    - **Schools are out**, leading to increased bike rides by students.
+    """
+    )
+
+    # Actionable Insights
+    st.markdown("### Actionable Insights 📊")
+    st.markdown(
+    """
+    - **Expand bike availability during peak months** (March–August) to meet increased demand.
+    - **Consider promotions or discounts in colder months** to encourage winter ridership.
+    - **Monitor electric bike performance in high temperatures** to address potential battery concerns.
+    """
+    )
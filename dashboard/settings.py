@@ -0,0 +1,11 @@
+############################# DASHBOARD SETTINGS ########################################
+#########################################################################################
+"""Theme colours and file locations shared by the dashboard pages."""
+
+## Theme colors
+colors = ['#2B4B8D', '#3881B5']
+accent = '#EB392A'
+
+folderpath = "Data/Prepared_data"
+picturepath = "Visualizations"
+path_to_html = "Citi_Bike_Trips2.html"
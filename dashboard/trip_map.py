@@ -0,0 +1,49 @@
+############################# INTERACTIVE MAP OF AGGREGATED BIKE TRIPS ##################
+#########################################################################################
+"""The exported Kepler.gl map of the most common routes."""
+
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from citibike.instrumentation import span
+from citibike.kepler_map import load_kepler_map
+from dashboard.settings import folderpath, path_to_html
+
+
+def render():
+    st.title("Aggregated Bike Trips in New York")
+
+    ####################### GEOSPATIAL VISUALIZATION #######################
+
+    st.markdown("**Most Popular Bike Trips**")
+
+    ## Encoded and published once per process; sessions get a small page and fetch the cached data file
+    try:
+        with span('load'):
+            kepler_map = load_kepler_map(folderpath)
+    except FileNotFoundError:
+        kepler_map = None
+
+    # Show in webpage
+    st.header("Aggregated Bike Trips in New York")
+    if kepler_map is not None:
+        with span('chart'):
+            components.html(kepler_map.html(kepler_map.url(st.get_option('server.baseUrlPath'))), height=1000)
+    elif os.path.exists(path_to_html):
+        with span('load'):
+            with open(path_to_html, 'r', encoding='utf-8') as f:
+             html_data = f.read()
+        with span('chart'):
+            components.html(html_data, height=1000)
+    else:
+        st.info("The route flows have not been prepared yet: run `python -m citibike.od_matrix --top 5000` after ingesting the trips.")
+
+
+    ####################### ANALYSIS #######################
+    st.text("")
+    st.markdown("### Busy Zones:")
+    st.markdown("The densest areas of trips are concentrated in Midtown and Lower Manhattan, with heavy traffic around Times Square and there are significant movements between Manhattan and Brooklyn. These areas are major commercial and transit hubs, which explains the high trip volume.")
+    st.text("")
+    st.markdown("These patterns align with New York City's transit infrastructure, where business districts and major transportation hubs generate the highest trip activity. The visualization helps understand how people move through the city and which areas see the most traffic.")
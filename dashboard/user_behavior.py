@@ -0,0 +1,140 @@
+############################# USER BEHAVIOR ANALYSIS ####################################
+#########################################################################################
+"""Trip durations and payment types of members and casual riders."""
+
+import pandas as pd
+import plotly.express as px
+import streamlit as st
+
+from citibike.data_store import load_prepared, prepared_version
+from citibike.duration_hist import load_duration_histogram
+from citibike.figure_cache import cached_figure
+from citibike.instrumentation import span
+from dashboard.settings import accent, folderpath
+
+
+def render():
+    with span('load'):
+        pie_payment_data = load_prepared('pie_payment', folderpath)
+    try:
+        with span('load'):
+            duration_histogram = load_duration_histogram(folderpath)
+    except FileNotFoundError:
+        duration_histogram = None
+
+    st.markdown("## User Behavior Analysis")
+    col1, col2 = st.columns([0.6, 0.4])
+    with col1:
+        ########################### DURATION HISTOGRAM #########################
+        if duration_histogram is None:
+            st.info("The trip durations have not been prepared yet: run `python -m citibike.ingest` to build them.")
+        else:
+            def build_hist_fig():
+                ## Exact counts over every trip, cut at the 99th percentile so the long tail does not flatten the bars
+                upper = duration_histogram.quantile(0.99)
+                hist_data = pd.concat([duration_histogram.histogram(50, upper, member_casual = member)
+                                       .assign(member_casual = member)
+                                       for member in ['Member', 'Casual'] if member in duration_histogram.members])
+                hist_fig = px.bar(hist_data,
+                                  x = 'duration',
+                                  y = 'trips',
+                                  color = 'member_casual',
+                                  color_discrete_sequence = ['#2B4B8D', '#3881B5'])
+
+                hist_fig.update_layout(bargap = 0.05)
+
+                ## Exact medians from the binned counts, labels placed relative to the tallest stacked bar
+                member_median = duration_histogram.median(member_casual = 'Member')
+                casual_median = duration_histogram.median(member_casual = 'Casual')
+                peak = hist_data.groupby('duration')['trips'].sum().max()
+
+                ## Add median line and annotation for both member and casual charts
+                hist_fig.add_vline(x = member_median,
+                                   line_width = 2,
+                                   line_dash = 'solid',
+                                   line_color = accent)
+                hist_fig.add_annotation(x = member_median,
+                                        y = peak * 0.9,
+                                        text = f"<b>Member Median: <br>{member_median:.0f} sec</b>",
+                                        font = dict(color = '#2B4B8D', size = 14),
+                                        showarrow = False,
+                                        xshift = -24,
+                                        yshift = 0)
+
+                hist_fig.add_vline(x = casual_median,
+                                   line_width = 2,
+                                   line_dash = 'solid',
+                                   line_color = accent)
+                hist_fig.add_annotation(x = casual_median,
+                                        y = peak * 0.7,
+                                        text = f"<b>Casual Median: <br>{casual_median:.0f} sec</b>",
+                                        font = dict(color = '#2B4B8D', size = 14),
+                                        showarrow = False,
+                                        xshift = 24,
+                                        yshift = 0)
+
+                ## Formatting axes and titles
+                hist_fig.update_layout(legend_title_text = '',
+                                       legend = dict(yanchor = 'top',
+                                                     y = 0.95,
+                                                     xanchor = 'right',
+                                                     x = 0.65,
+                                                     font = dict(size = 16)),
+                                       xaxis_title = dict(text = '<b>Trip Duration (in seconds)</b>',
+                                                          font = dict(size = 18, color = '#2B4B8D')),
+                                       yaxis_title = dict(text = ''),
+                                       xaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D')),
+                                       yaxis = dict(tickfont = dict(size = 14, color = '#2B4B8D'),
+                                                    visible = False),
+                                       width = 900, height = 400)
+                return hist_fig
+
+            hist_fig = cached_figure('User Behavior Analysis: histogram',
+                                     duration_histogram.version, {}, build_hist_fig)
+            with span('chart'):
+                st.plotly_chart(hist_fig, use_container_width = True)
+
+    with col2:
+        ####################### MEMBER STATUS PIE CHART ########################
+        def build_pie_fig():
+            pie_fig = px.pie(pie_payment_data,
+                             values = 'value',
+                             names = 'member_casual',
+                             color = 'member_casual',
+                             color_discrete_sequence = ['#3881B5', '#2B4B8D'],
+                             hole = 0.6,
+                             labels = ['<b>Member</b>', '<b>Casual</b>'])
+
+            ## Formatting pie chart and labels
+            pie_fig.update_traces(textinfo = 'label+percent',
+                              
+                                  textfont_size = 15,
+                                  insidetextorientation = 'horizontal',
+                                  showlegend = False,
+                                  rotation = 0)
+
+            pie_fig.update_layout(height = 450, width = 450)
+            return pie_fig
+
+        pie_fig = cached_figure('User Behavior Analysis: pie',
+                                prepared_version('pie_payment', folderpath), {}, build_pie_fig)
+        with span('chart'):
+            st.plotly_chart(pie_fig, use_container_width = True)
+
+    ####################### ANALYSIS #######################
+    st.text("")
+    if duration_histogram is not None:
+        st.markdown("**Trip Duration Distribution:**")
+        member_median = duration_histogram.median(member_casual = 'Member')
+        casual_median = duration_histogram.median(member_casual = 'Casual')
+        if casual_median > member_median:
+            st.markdown(f"The median trip duration for members is {member_median:.0f} seconds, while for casual users, it is higher at {casual_median:.0f} seconds. This suggests that casual users tend to take longer trips compared to members.")
+        else:
+            st.markdown(f"The median trip duration for members is {member_median:.0f} seconds, and {casual_median:.0f} seconds for casual users.")
+        st.text("")
+    st.markdown("**Membership Breakdown:**")
+    st.markdown("The majority of Citi Bike users are subscribed members, likely using the service for regular commuting or shorter, consistent trips.")
+    st.text("")
+    st.markdown("**Behavioral Insights**")
+    st.markdown(" - Members appear to prioritize shorter, more frequent rides, possibly due to routine travel needs or familiarity with the service.")
+    st.markdown(" - Casual users may use the bikes for leisure, sightseeing, or less frequent activities, explaining the longer trip durations.")